@@ -31,8 +31,30 @@ Usage:
 """
 import os
 import sys
+import time
+import argparse
 import re
 import html
+import json
+import mmap
+import hashlib
+import pickle
+import gzip
+import heapq
+import codecs
+import sqlite3
+import shutil
+import stat
+import tempfile
+import cProfile
+import pstats
+import tracemalloc
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import partial
 from datetime import datetime
 
 # ================= 設定區 =================
@@ -42,9 +64,60 @@ SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
 MAX_LINES = 7
 MAX_DISPLAY_MSGS = 5000 # 限制顯示最近的 N 則訊息，避免瀏覽器崩潰
 
+# 快取資料夾 (建立在 txt 檔所在目錄下)
+CACHE_DIR_NAME = '.line_parser_cache'
+# 名字偵測快取：只需分析新增的訊息，重複轉換同一個對話時可省下最耗時的步驟
+NAME_CACHE_ENABLED = True
+NAME_CACHE_VERSION = 2
+HASH_BLOCK_SIZE = 1 << 20
+# 單檔平行解析時每段的最小大小 (太小的檔案切段反而較慢)
+PARALLEL_MIN_CHUNK_BYTES = 4 << 20
+# 增量模式檢查點格式版本
+CHECKPOINT_VERSION = 3
+# 日期索引 (日期分隔線 → byte offset) 格式版本；驗證索引時抽查的分隔線數與比對的尾端長度
+DATE_INDEX_VERSION = 1
+DATE_INDEX_SPOT_CHECKS = 32
+DATE_INDEX_TAIL_BYTES = 4096
+# 過濾規則設定檔 (JSON)；不存在時使用程式內建的 DEFAULT_FILTER_RULES
+FILTER_RULES_FILE = os.path.join(SOURCE_DIR, 'line_filter_rules.json')
+# 分段輸出模式 (--shards) 每個分段檔最多的訊息數 (另外每個月份一定會切開)
+SHARD_MAX_MSGS = 2000
+# SQLite 匯出 (--sqlite) 的預設資料庫路徑、資料表格式版本與每批寫入的筆數
+SQLITE_DB_DEFAULT = os.path.join(SOURCE_DIR, 'line_chats.db')
+SQLITE_SCHEMA_VERSION = 2
+SQLITE_BATCH_SIZE = 10000
+# 資料夾模式的建置快取 (manifest)：輸入、設定與所有輸出 (HTML、分段、統計與 SQLite) 都沒變的檔案直接跳過
+BUILD_MANIFEST_VERSION = 2
+# 檔案在 manifest 記錄前後這段時間內被修改時，mtime 無法可靠判斷 (改為比對內容雜湊)
+MANIFEST_RACY_NS = 2 * 10**9
+# --gzip 輸出 .html.gz 時的壓縮等級 (1 最快，9 最小)
+GZIP_COMPRESS_LEVEL = 6
+# --analytics：頁首統計區塊列出前幾名的發送者與網址
+ANALYTICS_TOP_N = 10
+# 統計時先把每則訊息的發送者/日期/小時編號存在 array，累積這麼多則才一次彙總
+ANALYTICS_BATCH_SIZE = 1 << 16
+# --search：搜尋結果清單最多列出幾則 (符合的總數仍會顯示)
+SEARCH_MAX_RESULTS = 200
+
+# 名字自動偵測的權重與門檻 (修改後名字快取會自動失效)
+NAME_DETECT_THRESHOLDS = {
+    'tab_weight': 100,          # Tab 分隔 (電腦版格式) 的名字
+    'system_weight': 200,       # 從加入/退出群組等系統訊息取得的名字
+    'double_space_weight': 50,  # 雙空格分隔的名字
+    'max_tokens': 4,            # 單空格格式最多假設名字有幾個詞
+    'max_name_length': 30,      # 超過此長度不視為名字
+    'diversity_cap': 10,        # 每個候選名字最多記錄幾種不同的後續內容
+    'strong_count': 20,         # 權重超過此值直接視為名字
+    'min_count': 5,             # 單空格推測的基本出現次數門檻
+    'min_diversity': 3,         # 後續內容至少要有幾種不同的變化
+    'binding_ratio': 0.7,       # 強連結：延伸版本佔原本次數的比例
+    'binding_min_count': 2,     # 強連結：延伸版本本身的最低次數
+}
+# 名字比對：同一個字開頭的名字不超過這個數量時編譯成一個正則，超過時改用字元 trie
+NAME_MATCHER_REGEX_LIMIT = 64
+
 # ================= 樣式與 HTML 模板 =================
-HTML_TEMPLATE_START = """
-<!DOCTYPE html>
+HTML_TEMPLATE_START = """<!DOCTYPE html>
 <html lang="zh-TW">
 <head>
     <meta charset="UTF-8">
@@ -54,16 +127,22 @@ HTML_TEMPLATE_START = """
         body { font-family: "Microsoft JhengHei", "Helvetica Neue", sans-serif; background-color: #f0f2f5; margin: 0; padding: 20px; }
         .container { max-width: 800px; margin: 0 auto; background: white; padding: 20px; border-radius: 10px; box-shadow: 0 2px 5px rgba(0,0,0,0.1); }
         h1 { text-align: center; color: #00B900; }
+        .subtitle { text-align: center; color: #666; }
         .file-header { background-color: #eee; padding: 10px; margin-top: 30px; border-radius: 5px; font-weight: bold; color: #555; border-left: 5px solid #00B900; }
         .date-divider { text-align: center; margin: 20px 0; position: -webkit-sticky; position: sticky; top: 10px; z-index: 1000; pointer-events: none; }
         .date-divider span { background-color: #dcf8c6; padding: 5px 15px; border-radius: 15px; font-size: 0.8em; color: #555; box-shadow: 0 1px 2px rgba(0,0,0,0.1); display: inline-block; }
         .message { display: flex; margin-bottom: 15px; align-items: flex-start; }
+        .message.system { justify-content: center; }
+        .system-bubble { background-color: #f0f0f0; color: #888; padding: 5px 15px; border-radius: 15px; font-size: 0.85em; }
+        .system-bubble span { font-size: 0.8em; margin-left: 5px; }
         .avatar { width: 40px; height: 40px; background-color: #ddd; border-radius: 50%; display: flex; align-items: center; justify-content: center; font-weight: bold; color: #fff; margin-right: 10px; flex-shrink: 0; font-size: 14px;}
         .content-wrapper { max-width: 80%; }
         .sender-name { font-size: 0.8em; color: #888; margin-bottom: 2px; }
         .bubble { background-color: #e9e9eb; padding: 10px 15px; border-radius: 15px; position: relative; line-height: 1.5; white-space: pre-wrap; word-break: break-all;}
         .bubble.filtered { background-color: #ffebee; color: #c62828; font-style: italic; }
+        .message a { color: #007bff; text-decoration: none; }
         .time { font-size: 0.7em; color: #aaa; margin-top: 5px; text-align: right; }
+        .notice { text-align: center; padding: 20px; color: #888; background: #f9f9f9; margin: 20px 0; border-radius: 10px; }
         
         /* 簡單的顏色生成邏輯 */
         .color-0 { background-color: #FF5722; }
@@ -76,18 +155,359 @@ HTML_TEMPLATE_START = """
 <body>
     <div class="container">
         <h1>Line 對話紀錄閱覽器 (近期訊息)</h1>
-        <p style="text-align:center; color: #666;">
-            過濾條件：忽略超過 {max_lines} 行的訊息 | 
-            顯示限制：最新的 {max_msgs} 則
-        </p>
 """
 
+# 副標題 (過濾條件與顯示範圍)
+HTML_SUBTITLE = '<p class="subtitle">過濾條件：忽略超過 {max_lines} 行的訊息 | {scope}</p>'
+
 HTML_TEMPLATE_END = """
     </div>
 </body>
 </html>
 """
 
+# 每則訊息的 HTML 片段 (不含縮排與換行，大量訊息時可明顯縮小輸出)。
+# 一般訊息拆成「發送者前綴」與「內容之後」兩段，前綴依發送者快取
+HTML_DATE_DIVIDER = '<div class="date-divider"><span>{date}</span></div>'
+HTML_USER_MSG_PREFIX = ('<div class="message"><div class="avatar {color}">{initial}</div>'
+                        '<div class="content-wrapper"><div class="sender-name">{name}</div><div class="bubble">')
+HTML_USER_MSG_TIME = '</div><div class="time">'
+HTML_USER_MSG_END = '</div></div></div>'
+HTML_SYSTEM_MSG_PREFIX = '<div class="message system"><div class="system-bubble">'
+HTML_SYSTEM_MSG_TIME = ' <span>'
+HTML_SYSTEM_MSG_END = '</span></div></div>'
+HTML_LINK = r'<a href="\1" target="_blank">\1</a>'
+# 每累積多少則訊息的 HTML 才寫入一次檔案
+RENDER_BATCH_MSGS = 2000
+
+# --analytics：檔名下方的對話統計區塊
+ANALYTICS_STYLE = """
+    <style>
+        .analytics { margin-top: 10px; padding: 10px 15px; background: #fafafa; border-radius: 5px; font-size: 0.85em; color: #555; }
+        .analytics summary { cursor: pointer; font-weight: bold; }
+        .analytics h3 { font-size: 1em; margin: 12px 0 5px; color: #00B900; }
+        .analytics table { width: 100%; border-collapse: collapse; }
+        .analytics td { padding: 2px 5px; white-space: nowrap; }
+        .analytics td.url { white-space: normal; word-break: break-all; }
+        .analytics .bar { background: #00B900; height: 10px; border-radius: 2px; }
+        .analytics .hours { display: flex; align-items: flex-end; height: 60px; gap: 2px; }
+        .analytics .hours div { flex: 1; background: #8bc34a; min-height: 1px; }
+        .analytics .hour-labels { display: flex; gap: 2px; font-size: 0.8em; color: #aaa; }
+        .analytics .hour-labels span { flex: 1; text-align: center; }
+    </style>
+"""
+
+# 分段 (shard) 輸出模式：外殼頁面只含索引與載入程式，訊息放在 <檔名>_shards/ 下的 .js 檔
+# (使用 <script> 載入而非 fetch，直接以 file:// 開啟也能運作)
+SHARD_PAGE_STYLE = """
+    <style>
+        .shard-toolbar { position: sticky; top: 0; z-index: 1001; background: white; padding: 10px 0; text-align: center; border-bottom: 1px solid #eee; }
+        .shard { overflow-anchor: auto; }
+        .shard.loading::before { content: "載入中..."; display: block; text-align: center; color: #aaa; padding: 20px; }
+    </style>
+"""
+
+SHARD_PAGE_SCRIPT = """
+<script>
+(function () {
+    var index = LINE_CHAT_INDEX;
+    var shards = index.shards; // 由新到舊
+    var chat = document.getElementById('chat');
+    var loaded = {}, waiting = {}, elements = [];
+
+    window.LineChatShard = function (data) {
+        loaded[data.id] = data;
+        (waiting[data.id] || []).forEach(function (cb) { cb(data); });
+        delete waiting[data.id];
+    };
+
+    function load(shard, cb) {
+        if (loaded[shard.id]) { cb(loaded[shard.id]); return; }
+        if (waiting[shard.id]) { waiting[shard.id].push(cb); return; }
+        waiting[shard.id] = [cb];
+        var script = document.createElement('script');
+        script.src = index.dir + '/' + shard.file;
+        document.body.appendChild(script);
+    }
+
+    function escapeHtml(text) {
+        return text.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;')
+                   .replace(/"/g, '&quot;').replace(/'/g, '&#x27;');
+    }
+
+    function avatarColor(name) {
+        var sum = 0;
+        for (var ch of name) { sum += ch.codePointAt(0); }
+        return 'color-' + (sum % 5);
+    }
+
+    function renderShard(i, data) {
+        // 與前一個 (較新) 分段最舊的日期相同時，不重複顯示日期分隔線
+        var lastDate = i > 0 ? shards[i - 1].first_date : '';
+        var out = [];
+        for (var k = data.msgs.length - 1; k >= 0; k--) {
+            var m = data.msgs[k];
+            var date = data.dates[m[0]], name = data.senders[m[2]];
+            if (date !== lastDate) {
+                out.push('<div class="date-divider"><span>' + escapeHtml(date) + '</span></div>');
+                lastDate = date;
+            }
+            var content = escapeHtml(m[3]).replace(/(https?:\\/\\/\\S+)/g, '<a href="$1" target="_blank">$1</a>');
+            if (m[4]) {
+                out.push('<div class="message system"><div class="system-bubble">' + content
+                    + ' <span>' + m[1] + '</span></div></div>');
+            } else {
+                out.push('<div class="message"><div class="avatar ' + avatarColor(name) + '">' + (name ? escapeHtml(Array.from(name)[0]) : '?') + '</div>'
+                    + '<div class="content-wrapper"><div class="sender-name">' + escapeHtml(name) + '</div>'
+                    + '<div class="bubble">' + content + '</div><div class="time">' + m[1] + '</div></div></div>');
+            }
+        }
+        return out.join('');
+    }
+
+    function show(el, i, cb) {
+        el.dataset.rendered = '1';
+        load(shards[i], function (data) {
+            if (!el.dataset.rendered) { return; }
+            if (el.classList.contains('loading')) {
+                el.classList.remove('loading');
+                el.innerHTML = renderShard(i, data);
+                el.style.height = '';
+            }
+            if (cb) { cb(); }
+        });
+    }
+
+    // 只有接近畫面的分段才會載入並渲染；離開畫面的分段換成固定高度的空白，避免 DOM 過大
+    var observer = new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) {
+            var el = entry.target, i = +el.dataset.index;
+            if (entry.isIntersecting && !el.dataset.rendered) {
+                show(el, i);
+            } else if (!entry.isIntersecting && el.dataset.rendered) {
+                el.style.height = el.offsetHeight + 'px';
+                el.innerHTML = '';
+                el.classList.add('loading');
+                delete el.dataset.rendered;
+            }
+        });
+    }, { rootMargin: '2000px 0px' });
+
+    var jump = document.getElementById('month-jump');
+    shards.forEach(function (shard, i) {
+        var el = document.createElement('div');
+        el.className = 'shard loading';
+        el.dataset.index = i;
+        el.style.height = (shard.count * 70) + 'px';
+        chat.appendChild(el);
+        elements.push(el);
+        observer.observe(el);
+        if (i === 0 || shards[i - 1].month !== shard.month) {
+            var option = document.createElement('option');
+            option.value = i;
+            option.textContent = shard.month || '未標日期';
+            jump.appendChild(option);
+        }
+    });
+    jump.addEventListener('change', function () {
+        elements[+jump.value].scrollIntoView();
+    });
+
+    // 依訊息編號 (由舊到新從 0 起算) 找到對應的元素，必要時先載入並渲染所在的分段 (供搜尋使用)
+    window.LineChatView = {
+        locate: function (id, cb) {
+            var start = 0;
+            for (var i = shards.length - 1; i >= 0; i--) {
+                if (id < start + shards[i].count) {
+                    var el = elements[i], k = id - start;
+                    show(el, i, function () {
+                        cb(el.querySelectorAll('.message')[shards[i].count - 1 - k]);
+                    });
+                    return;
+                }
+                start += shards[i].count;
+            }
+        }
+    };
+})();
+</script>
+"""
+
+# --search：搜尋框、結果清單與搜尋程式 (查詢預先建好的索引，不需掃描整個 DOM)
+SEARCH_STYLE = """
+    <style>
+        .search-bar { position: sticky; top: 0; z-index: 1002; background: white; }
+        .search-box { display: flex; flex-wrap: wrap; gap: 5px; align-items: center; padding: 8px 0; }
+        .search-box input[type=search] { flex: 1; min-width: 150px; padding: 5px 10px; border: 1px solid #ccc; border-radius: 15px; }
+        .search-box select, .search-box input[type=date] { padding: 4px; border: 1px solid #ccc; border-radius: 5px; }
+        .search-count { font-size: 0.8em; color: #888; }
+        .search-results { max-height: 300px; overflow-y: auto; font-size: 0.85em; text-align: left; border-bottom: 1px solid #eee; }
+        .search-results:empty { display: none; }
+        .search-result { padding: 4px 8px; cursor: pointer; border-top: 1px solid #f3f3f3; white-space: nowrap; overflow: hidden; text-overflow: ellipsis; }
+        .search-result:hover { background: #f0f8f0; }
+        .search-result b { color: #00B900; margin-right: 5px; }
+        .search-result i { color: #888; font-style: normal; margin-left: 5px; }
+        .message.search-hit .bubble, .message.search-hit .system-bubble { box-shadow: 0 0 0 3px #ffc107; }
+    </style>
+"""
+
+HTML_SEARCH_BOX = ('<div class="search-box"><input type="search" id="search-q" placeholder="搜尋訊息 (中文、英文或數字)...">'
+                   '<select id="search-sender"><option value="">所有人</option>{sender_options}</select>'
+                   '<input type="date" id="search-since"> ~ <input type="date" id="search-until">'
+                   '<span class="search-count" id="search-count"></span></div>'
+                   '<div class="search-results" id="search-results"></div>')
+
+SEARCH_SCRIPT = """
+<script>
+(function () {
+    var input = document.getElementById('search-q');
+    var senderSelect = document.getElementById('search-sender');
+    var sinceInput = document.getElementById('search-since');
+    var untilInput = document.getElementById('search-until');
+    var countLabel = document.getElementById('search-count');
+    var resultList = document.getElementById('search-results');
+    // 與 SEARCH_TOKEN_PATTERN 相同：中日韓文字取 bigram，其餘的字母與數字以整個詞為單位
+    var TOKEN = /([\\u3040-\\u30ff\\u3400-\\u4dbf\\u4e00-\\u9fff\\uac00-\\ud7af\\uf900-\\ufaff]+)|((?:(?![\\u3040-\\u30ff\\u3400-\\u4dbf\\u4e00-\\u9fff\\uac00-\\ud7af\\uf900-\\ufaff])[\\p{L}\\p{N}])+)/gu;
+    var index = null, keys = [], dates = null, decoded = {}, waiting = null, timer = null, current = null, elements = null;
+
+    function ready(cb) {
+        if (index) { cb(); return; }
+        if (waiting) { waiting.push(cb); return; }
+        waiting = [cb];
+        function init() {
+            index = window.LINE_SEARCH_INDEX;
+            keys = Object.keys(index.t).sort();
+            // 日期以 [YYYYMMDD, 連續幾則] 存放，展開成每則訊息的日期
+            dates = new Int32Array(index.n);
+            var pos = 0;
+            index.d.forEach(function (run) { dates.fill(run[0], pos, pos + run[1]); pos += run[1]; });
+            waiting.forEach(function (f) { f(); });
+            waiting = null;
+        }
+        if (window.LINE_SEARCH_INDEX) { init(); return; }
+        // 分段輸出模式：索引放在分段資料夾，第一次搜尋時才載入
+        var script = document.createElement('script');
+        script.src = window.LINE_SEARCH_SRC;
+        script.onload = init;
+        document.body.appendChild(script);
+    }
+
+    // 解開以差值編碼的 posting list (訊息編號由舊到新)
+    function postings(token) {
+        var ids = decoded[token];
+        if (!ids) {
+            ids = decoded[token] = [];
+            var id = 0, text = index.t[token];
+            if (text) { text.split(',').forEach(function (gap) { id += +gap; ids.push(id); }); }
+        }
+        return ids;
+    }
+
+    function lowerBound(prefix) {
+        var lo = 0, hi = keys.length;
+        while (lo < hi) {
+            var mid = (lo + hi) >> 1;
+            if (keys[mid] < prefix) { lo = mid + 1; } else { hi = mid; }
+        }
+        return lo;
+    }
+
+    // 查詢字串轉成數組 token：同一組的 token 任一個符合即可，每一組都要符合
+    function queryGroups(query) {
+        var groups = [];
+        for (var match of query.toLowerCase().matchAll(TOKEN)) {
+            var word = match[2], cjk = match[1];
+            if (word) {
+                // 英文與數字以前綴比對 (輸入到一半也能找到)
+                var group = [];
+                for (var i = lowerBound(word); i < keys.length && keys[i].startsWith(word); i++) { group.push(keys[i]); }
+                groups.push(group);
+            } else if (cjk.length === 1) {
+                groups.push(keys.filter(function (key) { return key.indexOf(cjk) >= 0; }));
+            } else {
+                for (var j = 0; j + 1 < cjk.length; j++) { groups.push([cjk.substr(j, 2)]); }
+            }
+        }
+        return groups;
+    }
+
+    function dateValue(el) {
+        return el.value ? +el.value.replace(/-/g, '') : 0;
+    }
+
+    function formatDate(key) {
+        var text = String(key);
+        return key ? text.substr(0, 4) + '-' + text.substr(4, 2) + '-' + text.substr(6, 2) : '';
+    }
+
+    function escapeHtml(text) {
+        return text.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+    }
+
+    // 一般模式：頁面上的訊息由新到舊排列，編號 id 的訊息是倒數第 id + 1 個
+    function locate(id, cb) {
+        if (window.LineChatView) { window.LineChatView.locate(id, cb); return; }
+        elements = elements || document.querySelectorAll('.container > .message');
+        cb(elements[elements.length - 1 - id]);
+    }
+
+    function snippet(id) {
+        if (window.LineChatView) { return ''; }
+        var text = '';
+        locate(id, function (el) { text = el ? el.querySelector('.bubble, .system-bubble').textContent : ''; });
+        return '<i>' + escapeHtml(text.substr(0, 80)) + '</i>';
+    }
+
+    function search() {
+        var groups = queryGroups(input.value);
+        var sender = senderSelect.value, since = dateValue(sinceInput), until = dateValue(untilInput);
+        resultList.innerHTML = '';
+        if (!groups.length && sender === '' && !since && !until) { countLabel.textContent = ''; return; }
+        // counts[id] 為已符合的組數；同一組內以 counts[id] === g 判斷，重複的編號只算一次
+        var counts = new Uint16Array(index.n);
+        groups.forEach(function (group, g) {
+            group.forEach(function (token) {
+                postings(token).forEach(function (id) { if (counts[id] === g) { counts[id] = g + 1; } });
+            });
+        });
+        var hits = [], found = 0;
+        for (var id = index.n - 1; id >= 0; id--) {
+            if (counts[id] !== groups.length) { continue; }
+            if (sender !== '' && index.s[id] !== +sender) { continue; }
+            if ((since && dates[id] < since) || (until && dates[id] > until)) { continue; }
+            found++;
+            if (hits.length < __SEARCH_MAX_RESULTS__) { hits.push(id); }
+        }
+        countLabel.textContent = '找到 ' + found + ' 則' + (found > hits.length ? '，列出最新的 ' + hits.length + ' 則' : '');
+        resultList.innerHTML = hits.map(function (id) {
+            return '<div class="search-result" data-id="' + id + '"><b>' + formatDate(dates[id]) + '</b>'
+                + escapeHtml(index.senders[index.s[id]]) + snippet(id) + '</div>';
+        }).join('');
+    }
+
+    resultList.addEventListener('click', function (event) {
+        var item = event.target.closest('.search-result');
+        if (!item) { return; }
+        locate(+item.dataset.id, function (el) {
+            if (!el) { return; }
+            if (current) { current.classList.remove('search-hit'); }
+            current = el;
+            el.classList.add('search-hit');
+            el.scrollIntoView({ block: 'center' });
+        });
+    });
+
+    function schedule() {
+        clearTimeout(timer);
+        timer = setTimeout(function () { ready(search); }, 150);
+    }
+    input.addEventListener('input', schedule);
+    [senderSelect, sinceInput, untilInput].forEach(function (el) { el.addEventListener('change', schedule); });
+    input.addEventListener('focus', function () { ready(function () {}); });
+})();
+</script>
+"""
+
 SPECIAL_NAMES = [
     'Kevin 侯Belong to GOD',
     'Bruce 布魯斯張 🥉',
@@ -148,30 +568,337 @@ SPECIAL_NAMES = [
     "grok-4-fast from 'AI小幫手'",
 ]
 
+# 正則表達式：匹配時間 (e.g., 22:05, 上午 10:00)
+TIME_PATTERN = re.compile(r'^(\d{1,2}:\d{2}|上午 \d{1,2}:\d{2}|下午 \d{1,2}:\d{2})')
+# 支援 YYYY/MM/DD 或 YYYY.MM.DD (Line 電腦版與手機版匯出格式可能不同)
+DATE_PATTERN = re.compile(r'^\d{4}[/.][\d]{2}[/.][\d]{2}')
+# 日期分隔線 (bytes 版本，用於不解碼直接掃描檔案找切點)
+DATE_LINE_PATTERN_BYTES = re.compile(rb'^\d{4}[/.][\d]{2}[/.][\d]{2}')
+# 在整個檔案 (mmap) 中找出所有日期分隔線，建立日期索引用
+DATE_LINE_SCAN_PATTERN = re.compile(rb'^(\d{4})[/.](\d{2})[/.](\d{2})', re.M)
+# UTF-8 BOM (部分匯出檔開頭會有)，各個以 bytes 讀檔的函式需自行略過
+UTF8_BOM = codecs.BOM_UTF8
+# 搜尋索引的斷詞：中日韓文字取連續兩字 (bigram)，其餘的字母與數字以整個詞為單位 (轉小寫)
+SEARCH_CJK_CHARS = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+SEARCH_TOKEN_PATTERN = re.compile(f'([{SEARCH_CJK_CHARS}]+)|([^\\W_{SEARCH_CJK_CHARS}]+)')
+# 網址 (簡單匹配 https:// 或 http:// 開頭，直到遇到空白或結尾)
+URL_PATTERN = re.compile(r'(https?://\S+)')
+# 取出日期分隔線的年、月、日
+DATE_PARTS_PATTERN = re.compile(r'^(\d{4})[/.](\d{2})[/.](\d{2})')
+
 def get_avatar_color(name):
     """根據名字生成固定的顏色 class"""
     hash_val = sum(ord(c) for c in name)
     return f"color-{hash_val % 5}"
 
-def auto_detect_names(lines):
+class NameMatcher:
     """
-    分析整個檔案，找出可能是名字的字串。
-    邏輯：
-    1. 抓取所有時間開頭的行
-    2. 取得去除時間後的內容
-    3. 統計前綴詞出現的頻率 (例如 "Kevin", "Kevin 侯", "Kevin 侯Belong"...)
-    4. 如果長的前綴詞出現頻率很高，且經常後面接不同的內容，則視為名字
+    名字前綴比對器，每次執行只需建立一次。
+    名字依第一個字分組，match() 先查一次 dict 找到同一組：
+    名字不多的組編譯成一個正則 (長的名字排在前面，所以第一個符合的就是最長的名字)，
+    一次 C 層級的比對比逐字走訪 trie 快；但正則會逐一嘗試每個名字，
+    超過 NAME_MATCHER_REGEX_LIMIT 個名字的組 (例如上百個同姓的名字) 改用字元 trie，
+    比對時間只跟名字長度有關。
     """
-    print("正在自動分析對話中的名字...")
-    from collections import Counter
-    
-    time_pattern = re.compile(r'^(\d{1,2}:\d{2}|上午 \d{1,2}:\d{2}|下午 \d{1,2}:\d{2})')
+    __slots__ = ('_groups', '_empty')
+
+    def __init__(self, names):
+        groups = {}
+        for name in sorted(set(names), key=len, reverse=True):
+            if name:
+                groups.setdefault(name[0], []).append(name)
+        # 每組是正則的 match 函式，或是 trie 的根節點 (dict)
+        self._groups = {}
+        for ch, group in groups.items():
+            if len(group) <= NAME_MATCHER_REGEX_LIMIT:
+                self._groups[ch] = re.compile('|'.join(map(re.escape, group))).match
+                continue
+            root = {}
+            for name in group:
+                node = root
+                for c in name:
+                    node = node.setdefault(c, {})
+                # 以 None 為 key 標記「到這裡是一個完整名字」
+                node[None] = name
+            self._groups[ch] = root
+        self._empty = '' if '' in names else None
+
+    def match(self, text):
+        """回傳 text 開頭最長的已知名字，沒有則回傳 None"""
+        node = self._groups.get(text[:1])
+        if node is None:
+            return self._empty
+        if node.__class__ is not dict:
+            found = node(text)
+            return found.group() if found else self._empty
+        longest = self._empty
+        for ch in text:
+            node = node.get(ch)
+            if node is None:
+                break
+            name = node.get(None)
+            if name is not None:
+                longest = name
+        return longest
+
+def time_to_minutes(time_str):
+    """
+    將時間字串轉為從午夜起算的分鐘數。
+    支援 24 小時制 (22:05) 與 12 小時制 (上午 10:00 / 下午 3:10，上午 12 點為 0 點、下午 12 點為中午)。
+    """
+    period = ''
+    if time_str.startswith('上午 ') or time_str.startswith('下午 '):
+        period, time_str = time_str[:2], time_str[3:]
+    hour, minute = time_str.split(':')
+    hour = int(hour)
+    if period == '上午' and hour == 12:
+        hour = 0
+    elif period == '下午' and hour != 12:
+        hour += 12
+    return hour * 60 + int(minute)
+
+def parse_date_divider(date_line):
+    """從日期分隔線取出 (年, 月, 日)，無法解析時回傳 None"""
+    match = DATE_PARTS_PATTERN.match(date_line)
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(2)), int(match.group(3))
+
+def date_key(date_text):
+    """
+    日期 (YYYY-MM-DD、YYYY/MM/DD、YYYY.MM.DD 或日期分隔線) 轉為 YYYYMMDD 整數，
+    用於日期比較與範圍查詢；格式錯誤時拋出 ValueError。
+    """
+    parts = parse_date_divider(date_text.replace('-', '/'))
+    if not parts:
+        raise ValueError(f"日期格式錯誤: {date_text}")
+    return parts[0] * 10000 + parts[1] * 100 + parts[2]
+
+# 日期分隔線與時間字串各自只會有幾千種，換算結果快取起來，每則訊息只需查表
+_EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+_day_seconds_cache = {}
+_time_seconds_cache = {}
+
+def date_line_to_seconds(date_line):
+    """
+    日期分隔線 (可帶星期等後綴，例如 2024/01/15（一）) 當天 00:00 的時間戳 (從 1970-01-01 起算的秒數，不含時區)。
+    沒有日期或日期無效時回傳 0。
+    """
+    seconds = _day_seconds_cache.get(date_line)
+    if seconds is None:
+        parts = parse_date_divider(date_line) if date_line else None
+        try:
+            seconds = (datetime(*parts).toordinal() - _EPOCH_ORDINAL) * 86400 if parts else 0
+        except ValueError:
+            seconds = 0
+        if len(_day_seconds_cache) < 100000:
+            _day_seconds_cache[date_line] = seconds
+    return seconds
+
+def message_timestamp(date_line, time_str):
+    """
+    訊息的整數時間戳：日期分隔線當天 00:00 加上時間 (上午/下午 12 小時制會換算成 24 小時制)。
+    同一天的訊息可直接以時間戳排序；沒有日期的訊息視為 1970-01-01。
+    """
+    seconds = _time_seconds_cache.get(time_str)
+    if seconds is None:
+        seconds = _time_seconds_cache[time_str] = time_to_minutes(time_str) * 60
+    return date_line_to_seconds(date_line) + seconds
+
+class MessageStore:
+    """
+    緊湊的欄位式 (columnar) 訊息儲存，取代每則訊息一個 dict。
+    日期、時間字串與名字各自 intern 在對照表中，每則訊息只存整數編號：
+    date_ids / time_ids / sender_ids / lines_counts / types 為 array，
+    內容以 UTF-8 串接在同一個 bytearray，text_offsets 記錄每則的起點。
+    每個時間字串另存從午夜起算的分鐘數 (time_minutes)，供計算時間戳。
+    取出單則訊息 (store[i] 或迭代) 時才組回與 parse_lines 相同格式的 dict (含 ts 時間戳)。
+    """
+    __slots__ = ('dates', 'times', 'senders', '_date_ids', '_time_ids', '_sender_ids',
+                 'time_minutes', 'date_ids', 'time_ids', 'sender_ids', 'lines_counts', 'types',
+                 'text', 'text_offsets')
+
+    TYPES = ('user', 'system')
+
+    def __init__(self, msgs=()):
+        self.dates = []
+        self.times = []
+        self.senders = []
+        self._date_ids = {}
+        self._time_ids = {}
+        self._sender_ids = {}
+        self.time_minutes = array('H')
+        self.date_ids = array('I')
+        self.time_ids = array('H')
+        self.sender_ids = array('I')
+        self.lines_counts = array('I')
+        self.types = array('B')
+        self.text = bytearray()
+        self.text_offsets = array('Q', [0])
+        self.extend(msgs)
+
+    @staticmethod
+    def _intern(value, table, ids):
+        idx = ids.get(value)
+        if idx is None:
+            idx = ids[value] = len(table)
+            table.append(value)
+        return idx
+
+    def append(self, msg):
+        time_str = msg['time']
+        if time_str not in self._time_ids:
+            self.time_minutes.append(time_to_minutes(time_str))
+        self.date_ids.append(self._intern(msg['date'], self.dates, self._date_ids))
+        self.time_ids.append(self._intern(time_str, self.times, self._time_ids))
+        self.sender_ids.append(self._intern(msg['name'], self.senders, self._sender_ids))
+        self.lines_counts.append(msg['lines_count'])
+        self.types.append(self.TYPES.index(msg['type']))
+        self.text += msg['content'].encode('utf-8')
+        self.text_offsets.append(len(self.text))
+
+    def extend(self, msgs):
+        for msg in msgs:
+            self.append(msg)
+
+    def __len__(self):
+        return len(self.date_ids)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        return {
+            'date': self.dates[self.date_ids[i]],
+            'time': self.times[self.time_ids[i]],
+            'name': self.senders[self.sender_ids[i]],
+            'content': self.text[self.text_offsets[i]:self.text_offsets[i + 1]].decode('utf-8'),
+            'lines_count': self.lines_counts[i],
+            'type': self.TYPES[self.types[i]],
+            'ts': self.timestamp(i),
+        }
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def timestamp(self, i):
+        """第 i 則訊息的整數時間戳 (見 message_timestamp)"""
+        return date_line_to_seconds(self.dates[self.date_ids[i]]) + self.time_minutes[self.time_ids[i]] * 60
+
+
+def peak_memory_mb():
+    """
+    目前行程的峰值記憶體 (MB)：有啟用 tracemalloc 時為 Python 配置的峰值，
+    否則為行程的峰值 RSS (Windows 上沒有 resource 模組時改用 GetProcessMemoryInfo)；無法取得時回傳 None。
+    """
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[1] / (1 << 20)
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 單位為 bytes，Linux 為 KB
+        return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize / (1 << 20)
+    return None
+
+class Stats:
+    """
+    單一檔案轉換過程的統計：各階段耗時與計數。
+    階段耗時為「不含內層階段」的時間 (例如 parse 內呼叫的 filter 只算在 filter)，
+    所以各階段加總約等於總耗時。只有 --stats / --metrics 時才會建立，平常沒有額外成本。
+    """
+
+    STAGES = ('read', 'detect', 'parse', 'filter', 'render', 'write')
+
+    def __init__(self, file_name):
+        self.file = file_name
+        self.times = dict.fromkeys(self.STAGES, 0.0)
+        self.counters = Counter()
+        self._child_time = []  # 每層進行中階段的內層耗時
+
+    def _enter(self):
+        self._child_time.append(0.0)
+        return time.perf_counter()
+
+    def _exit(self, name, start):
+        elapsed = time.perf_counter() - start
+        self.times[name] = self.times.get(name, 0.0) + elapsed - self._child_time.pop()
+        if self._child_time:
+            self._child_time[-1] += elapsed
+
+    @contextmanager
+    def stage(self, name):
+        """計時一個階段 (可巢狀)"""
+        start = self._enter()
+        try:
+            yield
+        finally:
+            self._exit(name, start)
+
+    def timed(self, iterable, name, counter=None):
+        """包裝 iterable，把取得每個元素的時間算在 name 階段，並以 counter 計數"""
+        it = iter(iterable)
+        while True:
+            start = self._enter()
+            try:
+                item = next(it)
+            except StopIteration:
+                self._exit(name, start)
+                return
+            self._exit(name, start)
+            if counter:
+                self.counters[counter] += 1
+            yield item
+
+    def to_dict(self):
+        return {
+            'file': self.file,
+            'stages': {name: round(seconds, 6) for name, seconds in self.times.items()},
+            'counters': dict(self.counters),
+            'peak_memory_mb': round(peak_memory_mb() or 0.0, 1),
+        }
+
+# 目前正在轉換的檔案的統計 (None 表示不統計)
+_stats = None
+
+def _stage(name):
+    """目前有在統計時計時 name 階段，否則不做任何事"""
+    return _stats.stage(name) if _stats is not None else nullcontext()
+
+def collect_name_candidates(lines, candidate_counts=None, candidate_diversity=None):
+    """
+    統計候選名字 (auto_detect_names 的第一階段)。
+    傳入先前的統計結果時，會把新的行累加上去 (供名字快取只處理新增的行)。
+    回傳 (candidate_counts, candidate_diversity)。
+    """
+    th = NAME_DETECT_THRESHOLDS
+    time_pattern = TIME_PATTERN
     
     # 候選名字計數器
-    candidate_counts = Counter()
+    if candidate_counts is None:
+        candidate_counts = Counter()
     # 記錄每個候選名字後面接的"不同內容"的數量 (用來判斷這是否為名字)
     # 例如 "Dave" 後面接 "Hi", "Dave" 後面接 "早安" -> diversity = 2
-    candidate_diversity = {} 
+    if candidate_diversity is None:
+        candidate_diversity = {} 
 
     for line in lines:
         line = line.strip('\n')
@@ -185,7 +912,7 @@ def auto_detect_names(lines):
             # 如果有 Tab，Tab 前面通常就是名字 (這是 Line 電腦版最穩定的格式)
             if '\t' in content:
                 name = content.split('\t')[0]
-                candidate_counts[name] += 100 # 給予高權重
+                candidate_counts[name] += th['tab_weight'] # 給予高權重
                 continue
 
             # --- 新增：從系統訊息"偷"名字 ---
@@ -197,47 +924,47 @@ def auto_detect_names(lines):
             sys_match_1 = re.match(r'^(.*)已加入群組。$', content)
             if sys_match_1:
                 name = sys_match_1.group(1).strip()
-                if name: candidate_counts[name] += 200 # 最高權重，系統保證
+                if name: candidate_counts[name] += th['system_weight'] # 最高權重，系統保證
                 continue
 
             sys_match_2 = re.match(r'^(.*)已退出群組。$', content)
             if sys_match_2:
                 name = sys_match_2.group(1).strip()
-                if name: candidate_counts[name] += 200
+                if name: candidate_counts[name] += th['system_weight']
                 continue
                 
             sys_match_3 = re.match(r'^(.*)邀請(.*)加入群組。$', content)
             if sys_match_3:
                 inviter = sys_match_3.group(1).strip()
                 invitee = sys_match_3.group(2).strip()
-                if inviter: candidate_counts[inviter] += 200
-                if invitee: candidate_counts[invitee] += 200
+                if inviter: candidate_counts[inviter] += th['system_weight']
+                if invitee: candidate_counts[invitee] += th['system_weight']
                 continue
 
             sys_match_4 = re.match(r'^(.*)已將(.*)退出群組。$', content)
             if sys_match_4:
                 admin = sys_match_4.group(1).strip()
                 victim = sys_match_4.group(2).strip()
-                if admin: candidate_counts[admin] += 200
-                if victim: candidate_counts[victim] += 200
+                if admin: candidate_counts[admin] += th['system_weight']
+                if victim: candidate_counts[victim] += th['system_weight']
                 continue
             # ---------------------------------
                 
             # 如果有雙空格，通常也是名字分隔
             if '  ' in content:
                 name = re.split(r'\s{2,}', content)[0]
-                candidate_counts[name] += 50
+                candidate_counts[name] += th['double_space_weight']
                 continue
             
             # 如果只有單空格，情況較複雜 (例如 "Bruce Lin 早安")
             # 我們嘗試切分出前 1~3 個 token 作為潛在名字
             parts = content.split(' ')
-            max_tokens = min(len(parts), 4) # 最多假設名字有 4 個詞 (例如 "Kevin 侯 Belong to GOD")
+            max_tokens = min(len(parts), th['max_tokens']) # 最多假設名字有 4 個詞 (例如 "Kevin 侯 Belong to GOD")
             
             for i in range(1, max_tokens + 1):
                 potential_name = " ".join(parts[:i])
                 # 排除太長的名字 (例如超過 30 字元)
-                if len(potential_name) > 30: continue
+                if len(potential_name) > th['max_name_length']: continue
                 
                 # 簡單過濾掉明顯不是名字的 (例如由純數字組成，或包含奇怪符號)
                 # 這裡先不做太嚴格過濾
@@ -248,97 +975,464 @@ def auto_detect_names(lines):
                 remainder = " ".join(parts[i:])
                 if potential_name not in candidate_diversity:
                     candidate_diversity[potential_name] = set()
-                if len(candidate_diversity[potential_name]) < 10: # 只需存前 10 個不同的就好，省記憶體
+                if len(candidate_diversity[potential_name]) < th['diversity_cap']: # 只需存前 10 個不同的就好，省記憶體
                     candidate_diversity[potential_name].add(remainder)
 
-    # 篩選階段
+    return candidate_counts, candidate_diversity
+
+def select_detected_names(candidate_counts, candidate_diversity):
+    """
+    從候選名字的統計結果篩選出新名字 (auto_detect_names 的第二階段)。
+    """
+    if _stats is not None:
+        _stats.counters['name_candidates'] += len(candidate_counts)
+    th = NAME_DETECT_THRESHOLDS
     detected_names = []
     
-    # 建立候選名單集合，方便查找
-    all_candidates = set(candidate_counts.keys())
+    # 已知名字與已偵測名字都用 set 查找，避免在 list 上做線性搜尋
+    known_names = set(SPECIAL_NAMES)
+    detected_set = set()
+    
+    # 前綴索引：候選名單依字典序排序後，所有以 base_name + " " 開頭的候選人
+    # 會排在連續的一段，用 bisect 找到起點即可，不需要掃描全部候選人
+    sorted_candidates = sorted(candidate_counts)
     
     # helper: 檢查是否為強連結 (Strong Binding)
     # 例如 "林立皋" (count=10) 與 "林立皋 Eric" (count=9)
     # 代表 "林立皋" 有 90% 的機率後面接 "Eric"，這時候應該視 "林立皋 Eric" 為完整名字
     def is_strong_binding(base_name, count):
         # 尋找是否有開頭為 base_name + space 的更長候選人
+        prefix = base_name + " "
         best_extension = None
         max_ext_count = 0
         
-        for cand in all_candidates:
-            if cand != base_name and cand.startswith(base_name + " "):
-                c_count = candidate_counts[cand]
-                if c_count > max_ext_count:
-                    max_ext_count = c_count
-                    best_extension = cand
+        for i in range(bisect_left(sorted_candidates, prefix), len(sorted_candidates)):
+            cand = sorted_candidates[i]
+            if not cand.startswith(prefix):
+                break
+            c_count = candidate_counts[cand]
+            if c_count > max_ext_count:
+                max_ext_count = c_count
+                best_extension = cand
         
         # 如果延伸版本的出現頻率佔原本的 70% 以上，且延伸版本本身也夠多 (>2)
-        if best_extension and max_ext_count > 0 and (max_ext_count / count) > 0.7 and max_ext_count > 2:
+        if best_extension and max_ext_count > 0 and (max_ext_count / count) > th['binding_ratio'] and max_ext_count > th['binding_min_count']:
             return best_extension
         return None
 
     # 1. 優先加入 Tab/雙空格 識別出的 (權重 > 20)
     for name, count in candidate_counts.items():
-        if count > 20 and name not in SPECIAL_NAMES:
+        if count > th['strong_count'] and name not in known_names:
             detected_names.append(name)
+            detected_set.add(name)
             
     # 2. 加入單空格推測的
     for name, count in candidate_counts.items():
-        if count > 5: # 出現超過 5 次 (基本門檻)
+        if count > th['min_count']: # 出現超過 5 次 (基本門檻)
             diversity = len(candidate_diversity.get(name, []))
             
             # 檢查是否有更 "強" 的長名字版本
             strong_extension = is_strong_binding(name, count)
             if strong_extension:
                 # 如果有強連結 (例如 林立皋 -> 林立皋 Eric)，優先加入長版本
-                if strong_extension not in SPECIAL_NAMES and strong_extension not in detected_names:
+                if strong_extension not in known_names and strong_extension not in detected_set:
                     detected_names.append(strong_extension)
+                    detected_set.add(strong_extension)
                 # 短版本通常就略過，或者是也加入但排序在後 (parse_line_log 會自動 sort by len)
                 continue
             
             # 一般多樣性檢查
-            if diversity >= 3 and name not in SPECIAL_NAMES and name not in detected_names:
+            if diversity >= th['min_diversity'] and name not in known_names and name not in detected_set:
                 detected_names.append(name)
+                detected_set.add(name)
                 
     # 額外補強：針對 "Name EngName" 類似 "林立皋 Eric" 這種組合
     # 如果 "林立皋 Eric" 被上面的 strong_binding 抓到了，那很好
     # 如果沒抓到 (可能比例不到 80%)，但它的 diversity 夠高，原本的邏輯也會抓到
     # 所以上述邏輯應該足夠處理大部分 "固定後綴" 的情況
 
+    return detected_names
+
+def auto_detect_names(lines):
+    """
+    分析整個檔案，找出可能是名字的字串。
+    邏輯：
+    1. 抓取所有時間開頭的行
+    2. 取得去除時間後的內容
+    3. 統計前綴詞出現的頻率 (例如 "Kevin", "Kevin 侯", "Kevin 侯Belong"...)
+    4. 如果長的前綴詞出現頻率很高，且經常後面接不同的內容，則視為名字
+    """
+    print("正在自動分析對話中的名字...")
+    candidate_counts, candidate_diversity = collect_name_candidates(lines)
+    detected_names = select_detected_names(candidate_counts, candidate_diversity)
+    print(f"自動偵測到 {len(detected_names)} 個新名字 (例如: {detected_names[:5]})...")
+    return detected_names
+
+
+def _cache_path(file_path, suffix):
+    """
+    回傳輸入檔對應的快取檔路徑 (放在同目錄的 CACHE_DIR_NAME 資料夾)；
+    輸入檔本身就在快取資料夾中 (例如轉成 UTF-8 的副本) 時放在它旁邊。
+    """
+    file_dir = os.path.dirname(os.path.abspath(file_path))
+    if os.path.basename(file_dir) != CACHE_DIR_NAME:
+        file_dir = os.path.join(file_dir, CACHE_DIR_NAME)
+    return os.path.join(file_dir, os.path.basename(file_path) + suffix)
+
+def _write_json_atomic(path, data):
+    """先寫入暫存檔再取代，避免中斷時留下寫一半的快取"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def _load_json(path):
+    """讀取 JSON 快取，不存在或損毀時回傳 None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def is_compressed_input(file_path):
+    """gzip 壓縮的對話檔 (.txt.gz)：只能從頭依序解壓縮，不能 seek 或從結尾往回讀"""
+    return file_path.endswith('.gz')
+
+def detect_encoding(file_path):
+    """
+    判斷對話檔的編碼：'utf-8'、'utf-8-sig' (有 BOM)、'utf-16' (有 BOM)，
+    或沒有 BOM 的 'utf-16-le' / 'utf-16-be' (依開頭 NUL 位元組在偶數或奇數位置判斷)。
+    壓縮檔以解壓縮後的開頭判斷。
+    """
+    with (gzip.open if is_compressed_input(file_path) else open)(file_path, 'rb') as f:
+        head = f.read(4096)
+    if head.startswith(UTF8_BOM):
+        return 'utf-8-sig'
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    sample = head[:len(head) & ~1]
+    if b'\0' in sample:
+        return 'utf-16-le' if sample[1::2].count(0) >= sample[0::2].count(0) else 'utf-16-be'
+    return 'utf-8'
+
+def utf8_source(file_path):
+    """
+    回傳可直接以 bytes / mmap 解析的 UTF-8 檔案路徑。
+    UTF-8 檔 (含 BOM，由各讀取函式略過) 直接回傳原路徑；
+    UTF-16 匯出檔以串流解碼器逐塊轉成 UTF-8，存到快取資料夾的 <檔名>.utf8.txt，
+    原檔大小與修改時間沒變時沿用上次轉好的副本。壓縮檔直接回傳原路徑 (一律以串流解碼，見 open_text_input)。
+    """
+    if is_compressed_input(file_path):
+        return file_path
+    encoding = detect_encoding(file_path)
+    if not encoding.startswith('utf-16'):
+        return file_path
+    target_path = _cache_path(file_path, '.utf8.txt')
+    meta_path = _cache_path(file_path, '.utf8.json')
+    stat = os.stat(file_path)
+    signature = [encoding, stat.st_size, stat.st_mtime_ns]
+    meta = _load_json(meta_path)
+    if meta and meta.get('source') == signature and os.path.exists(target_path):
+        return target_path
+
+    print(f"偵測到 {encoding.upper()} 編碼，轉換為 UTF-8...")
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    decoder = codecs.getincrementaldecoder(encoding)()
+    tmp_path = target_path + '.tmp'
+    with open(file_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+        while True:
+            block = src.read(HASH_BLOCK_SIZE)
+            text = decoder.decode(block, final=not block)
+            if text:
+                dst.write(text.encode('utf-8'))
+            if not block:
+                break
+    os.replace(tmp_path, target_path)
+    _write_json_atomic(meta_path, {'source': signature})
+    return target_path
+
+def open_text_input(file_path):
+    """
+    以文字模式開啟對話檔。一般檔案應先經過 utf8_source，以 UTF-8 讀取並略過 BOM；
+    .gz 壓縮檔邊讀邊解壓縮，依解壓縮後的開頭判斷編碼，UTF-16 也直接以串流解碼。
+    與反向讀取、日期範圍等以 bytes 讀取的路徑相同，只以 \n 分行 (行尾的 CRLF 由 parse_lines 處理)；
+    預設的 universal newlines 會把訊息內容中單獨的 \r 也當成換行。
+    """
+    if is_compressed_input(file_path):
+        return gzip.open(file_path, 'rt', encoding=detect_encoding(file_path), newline='\n')
+    return open(file_path, 'r', encoding='utf-8-sig', newline='\n')
+
+def _update_prefix_signature(f, signature, size, stat):
+    """
+    記錄檔案 [0, size) 的驗證資料 (供 _prefix_unchanged 判斷前段是否被改動)，回傳新的 dict：
+    size、記錄時的 stat (大小, mtime)、記錄時間，以及每個 HASH_BLOCK_SIZE 區塊的雜湊。
+    沿用 signature (上次的記錄) 時只需計算新增的區塊 (上次最後一個不完整的區塊重新計算)。
+    stat 應在讀取檔案之前取得，讀取期間檔案被修改時下次就不會直接相信 stat。
+    """
+    blocks = list(signature['blocks']) if signature else []
+    old_size = signature['size'] if signature else 0
+    if size != old_size:
+        start = old_size // HASH_BLOCK_SIZE * HASH_BLOCK_SIZE
+        del blocks[start // HASH_BLOCK_SIZE:]
+        f.seek(start)
+        while start < size:
+            block = f.read(min(HASH_BLOCK_SIZE, size - start))
+            if not block:
+                break
+            blocks.append(hashlib.sha256(block).hexdigest()[:32])
+            start += len(block)
+    return {'size': size, 'stat': [stat.st_size, stat.st_mtime_ns], 'recorded_ns': time.time_ns(), 'blocks': blocks}
+
+def _prefix_unchanged(f, signature, stat):
+    """
+    確認檔案 [0, signature['size']) 的內容與記錄時相同 (檔案只在尾端增加了內容)。
+    1. 大小與 mtime 都和記錄時相同 (且記錄時 mtime 可靠)：直接視為沒變，不需讀檔
+    2. 檔案比記錄的範圍小：已變動
+    3. 其他情況 (通常是新增了訊息) 逐一比對前段每個區塊的雜湊，任一不符即已變動。
+       只抽查部分區塊無法發現「原地修改某個區塊並同時新增訊息」，而計算雜湊比解析這些內容快得多
+    """
+    if not signature or 'blocks' not in signature:
+        return False
+    size = signature['size']
+    recorded_size, recorded_mtime_ns = signature['stat']
+    if (stat.st_size, stat.st_mtime_ns) == (recorded_size, recorded_mtime_ns) \
+            and stat.st_mtime_ns < signature['recorded_ns'] - MANIFEST_RACY_NS:
+        return True
+    if stat.st_size < size:
+        return False
+    blocks = signature['blocks']
+    if len(blocks) != (size + HASH_BLOCK_SIZE - 1) // HASH_BLOCK_SIZE:
+        return False
+
+    f.seek(0)
+    for i, block_hash in enumerate(blocks):
+        block = f.read(min(HASH_BLOCK_SIZE, size - i * HASH_BLOCK_SIZE))
+        if hashlib.sha256(block).hexdigest()[:32] != block_hash:
+            return False
+    return True
+
+def _name_cache_key():
+    """名字快取的設定指紋：SPECIAL_NAMES 或偵測門檻改變時快取即失效"""
+    config = {
+        'version': NAME_CACHE_VERSION,
+        'special_names': sorted(SPECIAL_NAMES),
+        'thresholds': NAME_DETECT_THRESHOLDS,
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def detect_names_cached(file_path):
+    """
+    與 auto_detect_names 相同，但會把候選名字的統計結果存到快取檔。
+    快取以檔案路徑 (對話身分) 為鍵，並記錄已統計的範圍 (見 _prefix_unchanged)；
+    檔案只是在尾端新增訊息時，只需統計新增的行，不需重新讀過已統計的部分。
+    """
+    print("正在自動分析對話中的名字...")
+    cache_path = _cache_path(file_path, '.names.json')
+    cache_key = _name_cache_key()
+    cache = _load_json(cache_path)
+
+    candidate_counts = Counter()
+    candidate_diversity = {}
+    signature = None
+    start = 0
+
+    with open(file_path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        # 1. 驗證快取：設定相同，且快取記錄的前段內容沒有被改動
+        if cache and cache.get('key') == cache_key and _prefix_unchanged(f, cache.get('prefix'), stat):
+            candidate_counts.update(cache['counts'])
+            candidate_diversity = {name: set(rest) for name, rest in cache['diversity'].items()}
+            signature = cache['prefix']
+            start = signature['size']
+            print(f"使用名字快取，只分析新增的 {stat.st_size - start} bytes...")
+
+        # 2. 只統計快取之後新增的完整行 (最後一行若沒有換行，可能還沒寫完，不寫進快取)
+        f.seek(start)
+        size = start
+        partial_line = None
+
+        def complete_lines():
+            nonlocal size, partial_line
+            for raw_line in f:
+                if size == 0 and raw_line.startswith(UTF8_BOM):
+                    size = len(UTF8_BOM)
+                    raw_line = raw_line[len(UTF8_BOM):]
+                if not raw_line.endswith(b'\n'):
+                    partial_line = raw_line.decode('utf-8')
+                    return
+                size += len(raw_line)
+                yield raw_line.decode('utf-8')
+
+        collect_name_candidates(complete_lines(), candidate_counts, candidate_diversity)
+        signature = _update_prefix_signature(f, signature, size, stat)
+
+    try:
+        _write_json_atomic(cache_path, {
+            'key': cache_key,
+            'prefix': signature,
+            'counts': candidate_counts,
+            'diversity': {name: list(rest) for name, rest in candidate_diversity.items()},
+        })
+    except OSError as e:
+        print(f"無法寫入名字快取 {cache_path}: {e}", file=sys.stderr)
+
+    if partial_line is not None:
+        collect_name_candidates([partial_line], candidate_counts, candidate_diversity)
+
+    detected_names = select_detected_names(candidate_counts, candidate_diversity)
     print(f"自動偵測到 {len(detected_names)} 個新名字 (例如: {detected_names[:5]})...")
     return detected_names
 
-def parse_line_log(file_path):
-    """解析單個 txt 檔案"""
-    with open(file_path, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
+def prepare_name_matcher(file_path):
+    """
+    偵測檔案中的名字，與 SPECIAL_NAMES 合併後回傳 (名字比對器, 本次使用的名單)。
+    偵測到的名字只用於這個檔案，不會修改 SPECIAL_NAMES，
+    避免批次處理時前一個對話的名字影響下一個檔案。
+    """
+    return _build_name_matcher(_detect_file_names(file_path))
 
+def prepare_shared_name_matcher(file_paths):
+    """
+    同一個對話的多個匯出檔共用的名字比對器：各檔偵測到的名字取聯集，
+    在某個檔案中出現次數不夠的名字，也能由其他檔案補上。回傳 (名字比對器, 名單)。
+    """
+    new_names = set()
+    for file_path in file_paths:
+        new_names.update(_detect_file_names(file_path))
+    return _build_name_matcher(sorted(new_names))
+
+def _detect_file_names(file_path):
+    """偵測單一檔案中的名字 (有快取時只分析新增的部分)"""
     # --- 自動分析階段 ---
-    # 動態擴充 SPECIAL_NAMES
-    global SPECIAL_NAMES
-    new_names = auto_detect_names(lines)
+    with _stage('detect'):
+        # 名字快取以原始 bytes 的位置續掃，壓縮檔只能每次完整解壓縮一遍
+        if NAME_CACHE_ENABLED and not is_compressed_input(file_path):
+            new_names = detect_names_cached(file_path)
+        else:
+            with open_text_input(file_path) as f:
+                new_names = auto_detect_names(f)
+    if _stats is not None:
+        _stats.counters['names_detected'] += len(new_names)
+    return new_names
+
+def _build_name_matcher(new_names):
+    """偵測到的名字與 SPECIAL_NAMES 合併，回傳 (名字比對器, 名單)"""
+    names = SPECIAL_NAMES
     if new_names:
         # 將新舊名單合併
         combined_names = set(SPECIAL_NAMES + new_names)
         # 轉回 List 並依長度排序 (長的優先匹配)
-        SPECIAL_NAMES = sorted(list(combined_names), key=len, reverse=True)
+        names = sorted(list(combined_names), key=len, reverse=True)
     # -------------------
 
+    # 名字比對器只建立一次，整個檔案共用
+    return NameMatcher(names), names
 
-    parsed_msgs = []
-    current_date = ""
+def iter_messages(file_path, name_matcher=None):
+    """
+    逐則產生 (yield) 單個 txt 檔案中的訊息。
+    檔案以串流方式逐行讀取，不會一次載入整個檔案，也不會累積所有訊息；
+    名字偵測需要完整掃過一次檔案，因此檔案會被依序讀取兩次 (已給 name_matcher 時不再偵測)。
+    開頭的 BOM 會被略過，UTF-16 的匯出檔會先轉成 UTF-8 (見 utf8_source)；
+    .gz 壓縮檔則是解壓縮兩遍 (不需暫存解壓縮後的內容)。
+    """
+    file_path = utf8_source(file_path)
+    if name_matcher is None:
+        name_matcher, _ = prepare_name_matcher(file_path)
+    with open_text_input(file_path) as f:
+        if _stats is None:
+            yield from parse_lines(f, name_matcher)
+        else:
+            yield from _stats.timed(parse_lines(_stats.timed(f, 'read', 'lines'), name_matcher), 'parse')
+
+def parse_line_log(file_path):
+    """解析單個 txt 檔案，回傳所有訊息的 list (大檔案請改用 iter_messages 或 load_message_store)"""
+    return list(iter_messages(file_path))
+
+def load_message_store(file_path):
+    """解析單個 txt 檔案，回傳存放所有訊息的 MessageStore (比 list of dict 省很多記憶體)"""
+    return MessageStore(iter_messages(file_path))
+
+def parse_message_head(line, time_str, name_matcher, current_date=""):
+    """
+    解析以時間開頭的那一行 (訊息的第一行)，切出名字與內容。
+    回傳訊息 dict，content 只含第一行的內容，lines_count 為 1。
+    """
+    rest_line = line[len(time_str):].strip()
+    
+    name = ""
+    content = ""
+    
+    # 優先檢查特殊名單 (取最長的符合名字)
+    is_special_name = False
+    special_name = name_matcher.match(rest_line)
+    if special_name is not None:
+        name = special_name
+        content = rest_line[len(special_name):].strip()
+        is_special_name = True
+    
+    # Checks for system event patterns (Join/Leave group)
+    # 放在特殊名單之後，但在一般分割之前
+    # 如果整行符合特定結尾 (過濾規則設定檔的 system_event_patterns)，視為系統訊息
+    system_event_pattern = (_filter_rules or get_filter_rules()).system_event_pattern
+    is_system_msg = system_event_pattern is not None and system_event_pattern.search(rest_line) is not None
+    
+    if is_system_msg:
+        # 系統訊息：沒有名字，內容為整行
+        name = ""
+        content = rest_line
+        # 這裡不需切分
+    elif not is_special_name:
+        # 嘗試切分名字與內容
+        if '\t' in rest_line:
+            parts = rest_line.split('\t', 1)
+            name = parts[0]
+            content = parts[1] if len(parts) > 1 else ""
+        elif '  ' in rest_line:
+             parts = re.split(r'\s{2,}', rest_line, maxsplit=1)
+             name = parts[0]
+             content = parts[1] if len(parts) > 1 else ""
+        elif ' ' in rest_line:
+            parts = rest_line.split(' ', 1)
+            name = parts[0]
+            content = parts[1] if len(parts) > 1 else ""
+        else:
+            # 無法切分，假設整行是名字? 或整行是內容? 
+            # 通常視為內容，名字留空 (或視為系統訊息)
+            content = rest_line
+        
+    return {
+        'date': current_date,
+        'time': time_str,
+        'name': name,
+        'content': content,
+        'lines_count': 1,
+        'type': 'system' if is_system_msg else 'user',
+        'ts': message_timestamp(current_date, time_str),
+    }
+
+def parse_lines(lines, name_matcher=None, current_date="", orphan_lines=None):
+    """
+    將逐行輸入 (檔案物件或任何可迭代的字串) 解析成訊息，逐則 yield。
+    每則訊息在遇到下一個時間開頭的行 (或輸入結束) 時才會產生。
+    name_matcher 未指定時，以目前的 SPECIAL_NAMES 建立；
+    從檔案中間開始解析時，以 current_date 傳入當時的日期分隔線。
+    若傳入 orphan_lines (list)，第一則訊息之前的續行會被收集進去 (而非丟棄)。
+    """
+    if name_matcher is None:
+        name_matcher = NameMatcher(SPECIAL_NAMES)
     
-    # 正則表達式：匹配時間 (e.g., 22:05, 上午 10:00)
-    time_pattern = re.compile(r'^(\d{1,2}:\d{2}|上午 \d{1,2}:\d{2}|下午 \d{1,2}:\d{2})')
-    # 支援 YYYY/MM/DD 或 YYYY.MM.DD (Line 電腦版與手機版匯出格式可能不同)
-    date_pattern = re.compile(r'^\d{4}[/.][\d]{2}[/.][\d]{2}')
+    time_pattern = TIME_PATTERN
+    date_pattern = DATE_PATTERN
 
     # 暫存變數
     temp_msg = None 
     current_msg_lines = [] 
 
     for line in lines:
-        line = line.strip('\n') # 保留行內的空格，只去尾端換行
+        # 保留行內的空格與單獨的 \r，只去尾端換行 (LF 或 CRLF，與以 bytes 讀取的路徑相同)
+        line = line[:-2] if line.endswith('\r\n') else line.strip('\n')
         if not line: continue
 
         # 1. 檢查是否為日期分隔線
@@ -352,68 +1446,13 @@ def parse_line_log(file_path):
             # 如果有前一則訊息，先存起來
             if temp_msg:
                 temp_msg['content'] = '\n'.join(current_msg_lines)
-                parsed_msgs.append(temp_msg)
+                yield temp_msg
                 temp_msg = None # 重置
                 current_msg_lines = []
             
             # 取得時間字串與剩餘內容
-            time_str = time_match.group(0)
-            rest_line = line[len(time_str):].strip()
-            
-            name = ""
-            content = ""
-            
-            # 優先檢查特殊名單
-            is_special_name = False
-            for special_name in SPECIAL_NAMES:
-                if rest_line.startswith(special_name):
-                    name = special_name
-                    content = rest_line[len(special_name):].strip()
-                    is_special_name = True
-                    break
-            
-            # Checks for system event patterns (Join/Leave group)
-            # 放在特殊名單之後，但在一般分割之前
-            # 如果整行符合特定結尾，視為系統訊息
-            system_suffixes = ['已退出群組。', '已加入群組。', '邀請.*加入群組。', '已將.*退出群組。']
-            is_system_msg = False
-            for suffix in system_suffixes:
-                 if re.search(suffix + '$', rest_line):
-                     is_system_msg = True
-                     break
-            
-            if is_system_msg:
-                # 系統訊息：沒有名字，內容為整行
-                name = ""
-                content = rest_line
-                # 這裡不需切分
-            elif not is_special_name:
-                # 嘗試切分名字與內容
-                if '\t' in rest_line:
-                    parts = rest_line.split('\t', 1)
-                    name = parts[0]
-                    content = parts[1] if len(parts) > 1 else ""
-                elif '  ' in rest_line:
-                     parts = re.split(r'\s{2,}', rest_line, maxsplit=1)
-                     name = parts[0]
-                     content = parts[1] if len(parts) > 1 else ""
-                elif ' ' in rest_line:
-                    parts = rest_line.split(' ', 1)
-                    name = parts[0]
-                    content = parts[1] if len(parts) > 1 else ""
-                else:
-                    # 無法切分，假設整行是名字? 或整行是內容? 
-                    # 通常視為內容，名字留空 (或視為系統訊息)
-                    content = rest_line
-                
-            temp_msg = {
-                'date': current_date,
-                'time': time_str,
-                'name': name,
-                'content': content if 'content' in locals() else "", # Ensure content exists
-                'lines_count': 1,
-                'type': 'system' if is_system_msg else 'user'
-            }
+            temp_msg = parse_message_head(line, time_match.group(0), name_matcher, current_date)
+            content = temp_msg['content']
             if content:
                 current_msg_lines = [content]
             else:
@@ -423,160 +1462,1889 @@ def parse_line_log(file_path):
             if temp_msg:
                 current_msg_lines.append(line)
                 temp_msg['lines_count'] += 1
+            elif orphan_lines is not None:
+                # 分段解析時，段落開頭的續行屬於前一段的最後一則訊息
+                orphan_lines.append(line)
 
     # 加入最後一則
     if temp_msg:
         temp_msg['content'] = '\n'.join(current_msg_lines)
-        parsed_msgs.append(temp_msg)
-        
-    return parsed_msgs
+        yield temp_msg
+
+DEFAULT_FILTER_RULES = {
+    # 名字包含這些字串的訊息 (AI 與機器人) 一律過濾
+    'sender_contains': ['AI小幫手', 'gpt-4o-mini', '麥肯錫AI'],
+    # 內容完全等於這些字串，或以「空白 + 字串」結尾時過濾
+    # (後者處理名字被誤判進內容的情況，例如 "Kevin 圖片")
+    'content_keywords': [
+        '圖片',
+        '影片',
+        '貼圖',
+        '已新增新的記事本。',
+        '已分享記事本。',
+        'GOD已設定<u>公告</u>',
+        '聯絡資訊',
+        '!切換角色',
+        '!重置角色',
+        '!清空對話',
+        '!56cf61af-bca7-4d4f-a0ab-2ba7844012ab',
+        '!8f279bfe-37c2-4734-bedf-e17f256096ad',
+        '!e9e2b097-2db4-4c97-9dab-52aaaf6fc74b',
+    ],
+    # 內容包含這些字串時過濾
+    'content_contains': ['已收回訊息'],
+    # 超過此行數的訊息過濾 (null 表示使用 MAX_LINES)
+    'max_lines': None,
+    # 解析時視為系統訊息 (沒有名字) 的整行結尾 (正則表達式)
+    'system_event_patterns': ['已退出群組。', '已加入群組。', '邀請.*加入群組。', '已將.*退出群組。'],
+}
+
+class FilterRules:
+    """
+    訊息過濾規則引擎，由設定檔編譯一次後重複使用：
+    精確比對用 set、結尾比對依「關鍵字內含的空白數」分組後查 set、
+    名字與內容的包含比對各合併成一個正則表達式。每條規則都有命中次數統計 (hits)。
+    """
+
+    def __init__(self, config):
+        self.config = dict(DEFAULT_FILTER_RULES, **config)
+        self.max_lines = self.config['max_lines'] if self.config['max_lines'] is not None else MAX_LINES
+        self.sender_pattern = self._compile_contains(self.config['sender_contains'])
+        self.content_pattern = self._compile_contains(self.config['content_contains'])
+        self.exact_keywords = set(self.config['content_keywords'])
+        # 以「空白 + 關鍵字」結尾：關鍵字本身含 n 個空白時，比對內容最後 n + 1 個空白之後的部分
+        self.suffix_groups = {}
+        for kw in self.config['content_keywords']:
+            self.suffix_groups.setdefault(kw.count(' '), set()).add(kw)
+        self.system_event_pattern = re.compile(
+            '(?:' + '|'.join(self.config['system_event_patterns']) + ')$'
+        ) if self.config['system_event_patterns'] else None
+        self.hits = Counter()
+        self.fingerprint = hashlib.sha256(
+            json.dumps([self.config, self.max_lines], sort_keys=True, ensure_ascii=False).encode('utf-8')
+        ).hexdigest()
+
+    @staticmethod
+    def _compile_contains(keywords):
+        if not keywords:
+            return None
+        return re.compile('|'.join(re.escape(kw) for kw in keywords))
+
+    @classmethod
+    def from_file(cls, path):
+        """讀取 JSON 設定檔；檔案不存在時使用預設規則"""
+        if not os.path.exists(path):
+            return cls({})
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def match_suffix(self, content):
+        """回傳 content 以「空白 + 關鍵字」結尾的關鍵字，沒有則回傳 None"""
+        for space_count, keywords in self.suffix_groups.items():
+            parts = content.rsplit(' ', space_count + 1)
+            if len(parts) == space_count + 2:
+                tail = content[len(parts[0]) + 1:]
+                if tail in keywords:
+                    return tail
+        return None
+
+    def match(self, msg):
+        """回傳符合的規則名稱 (例如 'exact:圖片')，不需過濾時回傳 None，並累計命中次數"""
+        rule = self.classify(msg)
+        if rule is not None:
+            self.hits[rule] += 1
+        return rule
+
+    def classify(self, msg):
+        """與 match 相同但不累計命中次數 (例如 SQLite 匯出只為了記錄每則訊息命中的規則)"""
+        name = msg.get('name', '')
+        content = msg.get('content', '').strip()
+
+        # 1. 過濾 AI 與機器人
+        if self.sender_pattern is not None:
+            found = self.sender_pattern.search(name)
+            if found:
+                return 'sender:' + found.group(0)
+
+        # 2. 過濾特定系統訊息/圖片/貼圖/記事本
+        # 精確匹配
+        if content in self.exact_keywords:
+            return 'exact:' + content
+        # 模糊匹配 (處理名字被誤判進內容的情況，例如 "Kevin 圖片")
+        kw = self.match_suffix(content)
+        if kw is not None:
+            return 'suffix:' + kw
+        if self.content_pattern is not None:
+            found = self.content_pattern.search(content)
+            if found:
+                return 'contains:' + found.group(0)
+
+        # 3. 過濾過長訊息 (直接跳過)
+        if msg['lines_count'] > self.max_lines:
+            return 'max_lines'
+
+        return None
+
+_filter_rules = None
+
+def get_filter_rules():
+    """取得 (第一次呼叫時由 FILTER_RULES_FILE 編譯的) 過濾規則"""
+    global _filter_rules
+    if _filter_rules is None:
+        _filter_rules = FilterRules.from_file(FILTER_RULES_FILE)
+    return _filter_rules
+
+def is_filtered_msg(msg):
+    """判斷訊息是否應被過濾 (不顯示)"""
+    if _stats is None:
+        return (_filter_rules or get_filter_rules()).match(msg) is not None
+    with _stats.stage('filter'):
+        filtered = (_filter_rules or get_filter_rules()).match(msg) is not None
+    _stats.counters['messages'] += 1
+    if filtered:
+        _stats.counters['messages_filtered'] += 1
+    return filtered
+
+class ChatAnalytics:
+    """
+    在解析的同一輪中統計對話活動：各發送者、各日期、各小時 (0-23) 的訊息數，
+    各過濾規則的命中次數，以及分享過的網址。只統計通過過濾的訊息 (過濾掉的只計總數)。
+    每則訊息只把發送者/日期的編號與小時附加到 array，每 ANALYTICS_BATCH_SIZE 則
+    以 Counter (C 實作的計數) 一次彙總到各自的計數 array，記憶體用量與訊息總數無關。
+    """
+
+    def __init__(self):
+        self.senders = []
+        self.days = []           # 1970-01-01 起算的天數 (沒有日期的訊息為 None)
+        self._sender_ids = {}
+        self._day_ids = {}
+        self.sender_counts = array('q')
+        self.day_counts = array('q')
+        self.hour_counts = array('q', [0] * 24)
+        self._sender_batch = array('I')
+        self._day_batch = array('I')
+        self._hour_batch = array('B')
+        self.urls = Counter()
+        self.total = 0
+        self.filtered = 0
+        self.system = 0
+        self._hits_before = Counter((_filter_rules or get_filter_rules()).hits)
+
+    def add(self, msg, filtered):
+        """記錄一則訊息 (filtered 為是否被過濾)"""
+        self.total += 1
+        if filtered:
+            self.filtered += 1
+            return
+        ts = msg['ts']
+        day = ts // 86400 if msg['date'] else None
+        self._day_batch.append(MessageStore._intern(day, self.days, self._day_ids))
+        self._hour_batch.append(ts % 86400 // 3600)
+        if msg['type'] == 'system':
+            self.system += 1
+        else:
+            self._sender_batch.append(MessageStore._intern(msg['name'], self.senders, self._sender_ids))
+        content = msg['content']
+        if 'http' in content:
+            self.urls.update(URL_PATTERN.findall(content))
+        if len(self._day_batch) >= ANALYTICS_BATCH_SIZE:
+            self._flush()
+
+    @staticmethod
+    def _accumulate(counts, batch, size):
+        """把一批編號的出現次數加到 counts (先補齊到 size 個)"""
+        counts.extend([0] * (size - len(counts)))
+        for idx, n in Counter(batch).items():
+            counts[idx] += n
+        del batch[:]
+
+    def _flush(self):
+        self._accumulate(self.sender_counts, self._sender_batch, len(self.senders))
+        self._accumulate(self.day_counts, self._day_batch, len(self.days))
+        self._accumulate(self.hour_counts, self._hour_batch, 24)
+
+    def summary(self):
+        """回傳統計摘要 dict (可直接寫成 JSON)"""
+        self._flush()
+        rules = _filter_rules or get_filter_rules()
+        days = sorted(zip(self.days, self.day_counts), key=lambda item: -1 if item[0] is None else item[0])
+        return {
+            'messages': self.total,
+            'kept': self.total - self.filtered,
+            'filtered': self.filtered,
+            'system': self.system,
+            'filter_hits': dict((rules.hits - self._hits_before).most_common()),
+            'senders': sorted(zip(self.senders, self.sender_counts), key=lambda item: -item[1]),
+            'days': [[datetime.fromordinal(_EPOCH_ORDINAL + day).strftime('%Y-%m-%d') if day is not None else '',
+                      count] for day, count in days],
+            'hours': list(self.hour_counts),
+            'urls': self.urls.most_common(),
+        }
+
+def collect_display_msgs(messages, analytics=None):
+    """
+    串流過濾訊息，只保留最新 MAX_DISPLAY_MSGS 則通過過濾的訊息。
+    回傳 (由新到舊排列的訊息 list, 是否有訊息因顯示上限而被省略)。
+    記憶體用量只跟顯示上限有關，與檔案大小無關。
+    指定 analytics (ChatAnalytics) 時，同時統計每一則訊息。
+    """
+    kept_msgs = deque(maxlen=MAX_DISPLAY_MSGS)
+    valid_msg_count = 0
+    for msg in messages:
+        filtered = is_filtered_msg(msg)
+        if analytics is not None:
+            analytics.add(msg, filtered)
+        if filtered:
+            continue
+        kept_msgs.append(msg)
+        valid_msg_count += 1
+
+    # 反轉訊息列表，讓最新的在最上面
+    kept_msgs.reverse()
+    return list(kept_msgs), valid_msg_count > MAX_DISPLAY_MSGS
 
-def generate_html(target_file=None):
+def _iter_lines_reverse(mm):
+    """從 mmap 的結尾往前逐行產生解碼後的行 (去除換行字元，略過空行與開頭的 BOM)"""
+    floor = len(UTF8_BOM) if mm[:len(UTF8_BOM)] == UTF8_BOM else 0
+    pos = len(mm)
+    while pos > floor:
+        # 找出 pos 之前的那一行 (pos - 1 可能就是這一行自己的換行字元)
+        start = max(mm.rfind(b'\n', 0, pos - 1) + 1, floor)
+        raw_line = mm[start:pos]
+        pos = start
+        if raw_line.endswith(b'\n'):
+            raw_line = raw_line[:-2] if raw_line.endswith(b'\r\n') else raw_line[:-1]
+        if raw_line:
+            yield raw_line.decode('utf-8')
+
+def collect_display_msgs_reverse(file_path):
+    """
+    由新到舊的 collect_display_msgs：以 mmap 從檔案結尾往前逐行讀取，
+    依序組回訊息 (先遇到續行，再遇到時間開頭的行，最後遇到日期分隔線)，
+    湊滿 MAX_DISPLAY_MSGS 則通過過濾的訊息後就停止。
+    解析的成本只跟要顯示的訊息量有關，與檔案大小 (對話歷史長度) 無關；
+    結果與從頭解析完全相同。
+    """
+    file_path = utf8_source(file_path)
+    name_matcher, _ = prepare_name_matcher(file_path)
+    if os.path.getsize(file_path) == 0:
+        return [], False
+
+    kept_msgs = []       # 由新到舊
+    undated_msgs = []    # 還沒遇到所屬日期分隔線的訊息
+    continuation = []    # 目前訊息的續行 (由後往前收集)
+    truncated = False
+
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        lines = _iter_lines_reverse(mm)
+        if _stats is not None:
+            lines = _stats.timed(lines, 'read', 'lines')
+        for line in lines:
+            # 1. 日期分隔線：補上之後 (較新) 訊息的日期
+            if DATE_PATTERN.match(line):
+                for msg in undated_msgs:
+                    msg['date'] = line
+                    msg['ts'] = message_timestamp(line, msg['time'])
+                undated_msgs = []
+                if truncated:
+                    break
+                continue
+
+            if truncated:
+                # 已湊滿，只需要再找到最舊那幾則訊息的日期分隔線
+                continue
+
+            # 2. 時間開頭的行：與收集到的續行組成一則完整訊息
+            time_match = TIME_PATTERN.match(line)
+            if time_match:
+                msg = parse_message_head(line, time_match.group(0), name_matcher)
+                if continuation:
+                    continuation.reverse()
+                    content_lines = [msg['content']] if msg['content'] else []
+                    msg['content'] = '\n'.join(content_lines + continuation)
+                    msg['lines_count'] += len(continuation)
+                    continuation = []
+                if is_filtered_msg(msg):
+                    continue
+                if len(kept_msgs) >= MAX_DISPLAY_MSGS:
+                    # 還有更舊的有效訊息，代表有訊息因顯示上限被省略
+                    truncated = True
+                    if not undated_msgs:
+                        break
+                    continue
+                kept_msgs.append(msg)
+                undated_msgs.append(msg)
+            else:
+                # 3. 續行，屬於前面 (較舊) 的那則訊息
+                continuation.append(line)
+
+    # 讀到檔案開頭仍沒有日期分隔線的訊息，日期維持空字串 (與從頭解析相同)
+    return kept_msgs, truncated
+
+class _OffsetLineReader:
+    """
+    從指定的 byte offset 開始逐行讀取二進位檔並解碼 (CRLF 統一轉為 LF，略過檔案開頭的 BOM)。
+    line_offset 為最近讀出那一行的起始位置。
+    """
+
+    def __init__(self, f, start):
+        self._f = f
+        self.line_offset = start
+
+    def __iter__(self):
+        self._f.seek(self.line_offset)
+        next_offset = self.line_offset
+        for raw_line in self._f:
+            self.line_offset = next_offset
+            next_offset += len(raw_line)
+            if raw_line.endswith(b'\r\n'):
+                raw_line = raw_line[:-2] + b'\n'
+            if self.line_offset == 0 and raw_line.startswith(UTF8_BOM):
+                raw_line = raw_line[len(UTF8_BOM):]
+            yield raw_line.decode('utf-8')
+
+def _checkpoint_key():
+    """
+    增量模式檢查點的設定指紋：顯示設定、過濾規則、SPECIAL_NAMES 或偵測門檻改變時需完整重建。
+    自動偵測到的名單不在指紋內 (新增的內容常會讓某個候選名字剛好超過門檻)，
+    檢查點另外記錄當時使用的名單，見 _names_change_lines。
+    """
+    config = {
+        'version': CHECKPOINT_VERSION,
+        'max_lines': MAX_LINES,
+        'max_msgs': MAX_DISPLAY_MSGS,
+        'filter_rules': get_filter_rules().fingerprint,
+        'special_names': sorted(SPECIAL_NAMES),
+        'thresholds': NAME_DETECT_THRESHOLDS,
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def _names_change_lines(lines, old_matcher, new_matcher):
+    """
+    新的名單是否會改變其中任何一則訊息的解析結果。
+    訊息的分界只看時間開頭的行，與名單無關，所以只需比對每則訊息開頭那一行切出的名字與內容
+    (兩個比對器的結果不同，但切法相同時不算，例如 Tab 分隔的名字)。
+    """
+    for line in lines:
+        line = line[:-2] if line.endswith('\r\n') else line.strip('\n')
+        if not line or DATE_PATTERN.match(line):
+            continue
+        time_match = TIME_PATTERN.match(line)
+        if time_match:
+            rest_line = line[time_match.end():].strip()
+            if old_matcher.match(rest_line) == new_matcher.match(rest_line):
+                continue
+            time_str = time_match.group(0)
+            old = parse_message_head(line, time_str, old_matcher)
+            new = parse_message_head(line, time_str, new_matcher)
+            if (old['name'], old['content'], old['type']) != (new['name'], new['content'], new['type']):
+                return True
+    return False
+
+def _resume_blocker(f, stat, signature, offset, pinned_names, names):
+    """
+    檢查能否從上次記錄的 offset 續接 (增量模式與 SQLite 匯出共用)：
+    前段內容沒變 (見 _prefix_unchanged)，且這次新偵測到的名字不會改變 offset 之後任何一則訊息。
+    可以續接時回傳 None (之後沿用 pinned_names 解析)，否則回傳無法續接的原因。
+    """
+    if not _prefix_unchanged(f, signature, stat):
+        return "檔案前段內容已變動"
+    new_names = set(names) - set(pinned_names)
+    if new_names and _names_change_lines(_OffsetLineReader(f, offset), NameMatcher(pinned_names),
+                                         NameMatcher(list(pinned_names) + sorted(new_names))):
+        return f"新偵測到的名字出現在新增的內容中 ({sorted(new_names)[:5]})"
+    return None
+
+def collect_display_msgs_incremental(file_path):
+    """
+    增量模式的 collect_display_msgs。
+    檢查點記錄：最後一則訊息的起始 byte offset、當時的日期分隔線、
+    最後一則訊息的時間/發送者、offset 之前內容的驗證資料 (見 _prefix_unchanged)、
+    當時使用的名單，以及目前要顯示的訊息。
+    前段內容沒變時只解析 offset 之後的部分 (最後一則訊息可能還有後續行，所以從它開始重新解析)，
+    並沿用檢查點的名單；這次新偵測到的名字會改變新增部分的某則訊息時，才以新名單完整重建。
+    """
+    file_path = utf8_source(file_path)
+    name_matcher, names = prepare_name_matcher(file_path)
+    checkpoint_path = _cache_path(file_path, '.checkpoint.json')
+    checkpoint_key = _checkpoint_key()
+    checkpoint = _load_json(checkpoint_path)
+
+    kept_msgs = deque(maxlen=MAX_DISPLAY_MSGS)
+    valid_msg_count = 0
+    current_date = ""
+    signature = None
+    start = 0
+
+    with open(file_path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        if checkpoint and checkpoint.get('key') == checkpoint_key:
+            blocker = _resume_blocker(f, stat, checkpoint.get('prefix'), checkpoint['offset'], checkpoint['names'], names)
+            if blocker:
+                print(f"增量模式：{blocker}，完整重建...")
+            else:
+                names = checkpoint['names']
+                name_matcher = NameMatcher(names)
+                kept_msgs.extend(checkpoint['kept_msgs'])
+                valid_msg_count = checkpoint['valid_msg_count']
+                current_date = checkpoint['current_date']
+                signature = checkpoint['prefix']
+                start = checkpoint['offset']
+                print(f"增量模式：從 byte {start} 繼續解析 (上次最後一則: {checkpoint['last_time']} {checkpoint['last_name']})")
+        elif checkpoint:
+            print("增量模式：設定已變動，完整重建...")
+
+        reader = _OffsetLineReader(f, start)
+        # 檢查點：下一次要從最後一則訊息的開頭重新解析
+        resume_offset = next_offset = start
+        last_msg = None
+        lines = reader if _stats is None else _stats.timed(reader, 'read', 'lines')
+        for msg in parse_lines(lines, name_matcher, current_date):
+            if last_msg is not None:
+                # 又收到一則訊息，代表 last_msg 不是最後一則，可以放入顯示結果
+                if not is_filtered_msg(last_msg):
+                    kept_msgs.append(last_msg)
+                    valid_msg_count += 1
+                resume_offset = next_offset
+            last_msg = msg
+            # 訊息產生時 reader 剛讀到下一則訊息的開頭，記下該位置
+            next_offset = reader.line_offset
+        signature = _update_prefix_signature(f, signature, resume_offset, stat)
+
+    # 最後一則先存入檢查點，再加入本次的顯示結果
+    try:
+        _write_json_atomic(checkpoint_path, {
+            'key': checkpoint_key,
+            'offset': resume_offset,
+            'prefix': signature,
+            'names': names,
+            'current_date': last_msg['date'] if last_msg else current_date,
+            'last_time': last_msg['time'] if last_msg else '',
+            'last_name': last_msg['name'] if last_msg else '',
+            'valid_msg_count': valid_msg_count,
+            'kept_msgs': list(kept_msgs),
+        })
+    except OSError as e:
+        print(f"無法寫入增量檢查點 {checkpoint_path}: {e}", file=sys.stderr)
+
+    if last_msg is not None and not is_filtered_msg(last_msg):
+        kept_msgs.append(last_msg)
+        valid_msg_count += 1
+
+    # 反轉訊息列表，讓最新的在最上面
+    kept_msgs.reverse()
+    return list(kept_msgs), valid_msg_count > MAX_DISPLAY_MSGS
+
+def _iter_line_range(file_path, start, end):
+    """逐行讀取檔案中 [start, end) 的 byte 範圍並解碼 (CRLF 統一轉為 LF，略過檔案開頭的 BOM)"""
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        offset = start
+        for raw_line in f:
+            if offset >= end:
+                break
+            if offset == 0 and raw_line.startswith(UTF8_BOM):
+                offset += len(UTF8_BOM)
+                raw_line = raw_line[len(UTF8_BOM):]
+            offset += len(raw_line)
+            if raw_line.endswith(b'\r\n'):
+                raw_line = raw_line[:-2] + b'\n'
+            yield raw_line.decode('utf-8')
+
+def find_chunk_boundaries(file_path, n_chunks):
+    """
+    將檔案切成約 n_chunks 段，切點都落在日期分隔線的開頭，
+    讓每一段都能從自己的日期開始獨立解析。回傳切點 list (含 0 與檔案大小)。
+    """
+    size = os.path.getsize(file_path)
+    boundaries = [0]
+    with open(file_path, 'rb') as f:
+        for i in range(1, n_chunks):
+            target = max(size * i // n_chunks, boundaries[-1] + 1)
+            if target >= size:
+                break
+            f.seek(target - 1)
+            f.readline() # 跳到下一行的開頭 (target 可能落在行中間)
+            offset = f.tell()
+            for raw_line in f:
+                if DATE_LINE_PATTERN_BYTES.match(raw_line):
+                    break
+                offset += len(raw_line)
+            if offset >= size:
+                break
+            if offset > boundaries[-1]:
+                boundaries.append(offset)
+    boundaries.append(size)
+    return boundaries
+
+def _collect_chunk_candidates(file_path, start, end):
+    """(子行程) 統計一段範圍內的候選名字"""
+    return collect_name_candidates(_iter_line_range(file_path, start, end))
+
+def _parse_chunk(file_path, start, end, names, collect_stats=False):
+    """
+    (子行程) 解析並過濾一段範圍內的訊息。
+    最後一則訊息可能在下一段還有續行，所以不過濾、另外回傳。
+    回傳 (段落開頭的續行, 通過過濾的訊息 (MessageStore，最多保留最新的 MAX_DISPLAY_MSGS 則), 通過過濾的數量,
+    最後一則訊息, 計數, 過濾規則命中次數)。子行程的 _stats 與 FilterRules.hits 在行程結束時就會遺失，
+    所以 collect_stats=True 時把本段的計數 (行數、訊息數、過濾數) 與各規則新增的命中次數傳回主行程加總，
+    否則這兩項為 None。
+    """
+    global _stats
+    _stats = Stats(file_path) if collect_stats else None
+    filter_rules = get_filter_rules()
+    hits_before = Counter(filter_rules.hits)
+    lines = _iter_line_range(file_path, start, end)
+    if _stats is not None:
+        lines = _stats.timed(lines, 'read', 'lines')
+    orphan_lines = []
+    kept_msgs = deque(maxlen=MAX_DISPLAY_MSGS)
+    valid_msg_count = 0
+    last_msg = None
+    for msg in parse_lines(lines, NameMatcher(names), "", orphan_lines):
+        if last_msg is not None and not is_filtered_msg(last_msg):
+            kept_msgs.append(last_msg)
+            valid_msg_count += 1
+        last_msg = msg
+    counters = hits = None
+    if _stats is not None:
+        counters = dict(_stats.counters)
+        hits = dict(filter_rules.hits - hits_before)
+        _stats = None
+    # 以 MessageStore 回傳，傳回主行程時序列化的資料量小很多
+    return orphan_lines, MessageStore(kept_msgs), valid_msg_count, last_msg, counters, hits
+
+def collect_display_msgs_parallel(file_path, jobs):
+    """
+    平行版本的 collect_display_msgs：在日期分隔線處把單一大檔切段，以多個行程處理。
+    1. map/reduce 統計候選名字 (各段的 Counter 相加) 並篩選名字
+    2. 各段平行解析與過濾，再依序合併 (段落開頭的續行接回前一則訊息)
+    結果與循序解析完全相同。
+    """
+    file_path = utf8_source(file_path)
+    n_chunks = max(1, min(jobs * 4, os.path.getsize(file_path) // PARALLEL_MIN_CHUNK_BYTES))
+    boundaries = find_chunk_boundaries(file_path, n_chunks)
+    starts, ends = boundaries[:-1], boundaries[1:]
+    paths = [file_path] * len(starts)
+    print(f"使用 {jobs} 個行程平行解析 {len(starts)} 段...")
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        # --- 名字偵測 (map/reduce) ---
+        print("正在自動分析對話中的名字...")
+        cap = NAME_DETECT_THRESHOLDS['diversity_cap']
+        candidate_counts = Counter()
+        candidate_diversity = {}
+        for counts, diversity in executor.map(_collect_chunk_candidates, paths, starts, ends):
+            candidate_counts.update(counts)
+            for name, rest in diversity.items():
+                merged = candidate_diversity.setdefault(name, set())
+                for remainder in rest:
+                    if len(merged) >= cap:
+                        break
+                    merged.add(remainder)
+        new_names = select_detected_names(candidate_counts, candidate_diversity)
+        print(f"自動偵測到 {len(new_names)} 個新名字 (例如: {new_names[:5]})...")
+        names = sorted(set(SPECIAL_NAMES + new_names), key=len, reverse=True) if new_names else SPECIAL_NAMES
+        if _stats is not None:
+            _stats.counters['names_detected'] += len(new_names)
+
+        # --- 平行解析，依序合併 ---
+        kept_msgs = deque(maxlen=MAX_DISPLAY_MSGS)
+        valid_msg_count = 0
+        pending_msg = None
+        chunk_results = executor.map(_parse_chunk, paths, starts, ends, [names] * len(starts),
+                                     [_stats is not None] * len(starts))
+        for orphan_lines, chunk_kept, chunk_count, last_msg, counters, hits in chunk_results:
+            if counters is not None:
+                _stats.counters.update(counters)
+                get_filter_rules().hits.update(hits)
+            if orphan_lines and pending_msg is not None:
+                # 前一段最後一則訊息的續行
+                content_lines = [pending_msg['content']] if pending_msg['content'] else []
+                pending_msg['content'] = '\n'.join(content_lines + orphan_lines)
+                pending_msg['lines_count'] += len(orphan_lines)
+            if last_msg is None:
+                continue
+            if pending_msg is not None and not is_filtered_msg(pending_msg):
+                kept_msgs.append(pending_msg)
+                valid_msg_count += 1
+            kept_msgs.extend(chunk_kept)
+            valid_msg_count += chunk_count
+            pending_msg = last_msg
+
+    if pending_msg is not None and not is_filtered_msg(pending_msg):
+        kept_msgs.append(pending_msg)
+        valid_msg_count += 1
+
+    # 反轉訊息列表，讓最新的在最上面
+    kept_msgs.reverse()
+    return list(kept_msgs), valid_msg_count > MAX_DISPLAY_MSGS
+
+def _date_index_tail_hash(f, end):
+    """已索引範圍最後 DATE_INDEX_TAIL_BYTES 的雜湊，用來確認檔案只是在尾端增加內容"""
+    start = max(end - DATE_INDEX_TAIL_BYTES, 0)
+    f.seek(start)
+    return hashlib.sha256(f.read(end - start)).hexdigest()
+
+def _date_index_valid(f, index):
+    """抽查索引中的日期分隔線是否仍在原本的位置，並比對已索引範圍的尾端"""
+    entries = index['entries']
+    step = max(len(entries) // DATE_INDEX_SPOT_CHECKS, 1)
+    for key, offset in entries[::step] + entries[-1:]:
+        f.seek(offset)
+        match = DATE_LINE_SCAN_PATTERN.match(f.read(10))
+        if not match or int(match.group(1)) * 10000 + int(match.group(2)) * 100 + int(match.group(3)) != key:
+            return False
+    return _date_index_tail_hash(f, index['scanned']) == index['tail_hash']
+
+def build_date_index(file_path):
+    """
+    建立 (或更新) 檔案的日期索引：依檔案順序的 [(YYYYMMDD, 分隔線的 byte offset), ...]。
+    索引存在快取資料夾的 <檔名>.dates.json；對話檔只在尾端增加內容時，
+    只需從上次掃到的位置繼續掃描新增的部分，否則重新掃描整個檔案。
+    只索引完整的行 (最後一行還沒寫完換行時留到下次)。
+    """
+    index_path = _cache_path(file_path, '.dates.json')
+    index = _load_json(index_path)
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        if not (index and index.get('version') == DATE_INDEX_VERSION and index['scanned'] <= size
+                and _date_index_valid(f, index)):
+            index = {'version': DATE_INDEX_VERSION, 'scanned': 0, 'tail_hash': '', 'entries': []}
+        if size > index['scanned']:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                scanned = mm.rfind(b'\n', index['scanned']) + 1
+                if scanned > index['scanned']:
+                    entries = index['entries']
+                    if index['scanned'] == 0 and mm[:len(UTF8_BOM)] == UTF8_BOM:
+                        # 第一行前面的 BOM 會讓 ^ 無法匹配，另外比對
+                        match = DATE_LINE_SCAN_PATTERN.match(mm[len(UTF8_BOM):len(UTF8_BOM) + 10])
+                        if match:
+                            entries.append([int(match.group(1)) * 10000 + int(match.group(2)) * 100
+                                            + int(match.group(3)), len(UTF8_BOM)])
+                    for match in DATE_LINE_SCAN_PATTERN.finditer(mm, index['scanned'], scanned):
+                        entries.append([int(match.group(1)) * 10000 + int(match.group(2)) * 100
+                                        + int(match.group(3)), match.start()])
+                    index['scanned'] = scanned
+                    index['tail_hash'] = _date_index_tail_hash(f, scanned)
+                    _write_json_atomic(index_path, index)
+    return [tuple(entry) for entry in index['entries']]
+
+def date_index_ranges(entries, size, since=0, until=0):
+    """
+    依日期索引找出日期介於 [since, until] (YYYYMMDD，0 表示不限) 的 byte 範圍 [(start, end), ...]。
+    每個範圍都從日期分隔線開始 (不限起始日期時包含第一條分隔線之前沒有日期的內容)。
+    分隔線依日期排序時以二分搜尋直接定位，否則逐條比對並合併相鄰的範圍。
+    """
+    keys = [key for key, _ in entries]
+    if all(keys[i] <= keys[i + 1] for i in range(len(keys) - 1)):
+        lo = bisect_left(keys, since) if since else 0
+        hi = bisect_right(keys, until) if until else len(keys)
+        start = entries[lo][1] if since and lo < len(entries) else 0
+        end = entries[hi][1] if hi < len(entries) else size
+        if lo >= hi and since:
+            return []
+        return [(start, end)] if start < end else []
+
+    ranges = [(0, entries[0][1] if entries else size)] if not since else []
+    for i, (key, offset) in enumerate(entries):
+        if (since and key < since) or (until and key > until):
+            continue
+        end = entries[i + 1][1] if i + 1 < len(entries) else size
+        if ranges and ranges[-1][1] == offset:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((offset, end))
+    return [(start, end) for start, end in ranges if start < end]
+
+def iter_messages_in_range(file_path, since=0, until=0, name_matcher=None):
+    """
+    逐則產生日期介於 [since, until] (YYYYMMDD，0 表示不限) 的訊息。
+    以日期索引直接 seek 到對應的位置，只解析這些範圍，不需從頭讀過整個檔案；
+    壓縮檔無法 seek，改為從頭解析並略過範圍外的訊息。
+    """
+    file_path = utf8_source(file_path)
+    if name_matcher is None:
+        name_matcher, _ = prepare_name_matcher(file_path)
+    if is_compressed_input(file_path):
+        day_keys = {}
+        for msg in iter_messages(file_path, name_matcher):
+            day = day_keys.get(msg['date'])
+            if day is None:
+                day = day_keys[msg['date']] = date_key(msg['date']) if msg['date'] else 0
+            if (not since or day >= since) and (not until or day <= until):
+                yield msg
+        return
+    with _stage('read'):
+        ranges = date_index_ranges(build_date_index(file_path), os.path.getsize(file_path), since, until)
+    for start, end in ranges:
+        lines = _iter_line_range(file_path, start, end)
+        if _stats is None:
+            yield from parse_lines(lines, name_matcher)
+        else:
+            yield from _stats.timed(parse_lines(_stats.timed(lines, 'read', 'lines'), name_matcher), 'parse')
+
+class TimelineMerger:
+    """
+    把同一個對話的多個訊息串流 (各自依時間排序) 以 k-way 合併成一條時間軸，並移除重疊部分的重複訊息。
+    訊息以 (時間戳, 發送者, 類型, 內容) 比對；同一時間戳內，某則訊息在各來源各出現幾次，
+    合併結果就保留其中最多的次數 (同一個檔案內真的重複發送的訊息不會被誤刪)。
+    重複只可能出現在同一個時間戳內，所以只需記住目前這個時間戳的訊息，記憶體用量與歷史長度無關。
+    迭代結束後 duplicates 為移除的重複訊息數。
+    """
+
+    def __init__(self, streams):
+        self.streams = streams
+        self.duplicates = 0
+
+    @staticmethod
+    def _tag(stream, source):
+        """產生 (時間戳, 來源編號, 訊息)：時間戳相同時依來源順序，不會比較到訊息 dict"""
+        for msg in stream:
+            yield msg['ts'], source, msg
+
+    def __iter__(self):
+        tagged = [self._tag(stream, i) for i, stream in enumerate(self.streams)]
+        group_ts = None
+        emitted = Counter()   # 目前時間戳內已輸出的次數
+        seen = Counter()      # 目前時間戳內各來源出現的次數
+        for ts, source, msg in heapq.merge(*tagged):
+            if ts != group_ts:
+                group_ts = ts
+                emitted.clear()
+                seen.clear()
+            key = (msg['name'], msg['type'], msg['content'])
+            seen[source, key] += 1
+            if seen[source, key] > emitted[key]:
+                emitted[key] += 1
+                yield msg
+            else:
+                self.duplicates += 1
+
+class HtmlRenderer:
+    """
+    將訊息轉成 HTML 片段 (使用模組層級的 HTML_* 樣板)。
+    每個發送者的頭像顏色、縮寫與跳脫後的名字只計算一次；日期改變時自動加上分隔線。
+    """
+
+    def __init__(self):
+        self.last_date = ""
+        self._sender_prefix = {}
+
+    def _user_prefix(self, name):
+        prefix = self._sender_prefix.get(name)
+        if prefix is None:
+            prefix = HTML_USER_MSG_PREFIX.format(
+                color=get_avatar_color(name),
+                initial=html.escape(name[0]) if name else "?",
+                name=html.escape(name),
+            )
+            self._sender_prefix[name] = prefix
+        return prefix
+
+    @staticmethod
+    def render_content(content):
+        """跳脫 HTML 並把網址轉為超連結 (沒有網址的訊息不需執行正則表達式)"""
+        display_content = html.escape(content)
+        if '://' in display_content:
+            display_content = URL_PATTERN.sub(HTML_LINK, display_content)
+        return display_content
+
+    def render(self, msg, out):
+        """將一則訊息的 HTML 片段加入 out (list)"""
+        # 日期分隔線
+        date = msg['date']
+        if date != self.last_date:
+            out.append(HTML_DATE_DIVIDER.format(date=html.escape(date)))
+            self.last_date = date
+
+        content = self.render_content(msg.get('content', '').strip())
+        if msg.get('type', 'user') == 'system':
+            out += (HTML_SYSTEM_MSG_PREFIX, content, HTML_SYSTEM_MSG_TIME, msg['time'], HTML_SYSTEM_MSG_END)
+        else:
+            out += (self._user_prefix(msg.get('name', '')), content, HTML_USER_MSG_TIME, msg['time'], HTML_USER_MSG_END)
+
+class _TimedWriter:
+    """統計時包裝輸出檔，把 write (含 gzip 壓縮) 的時間算在 write 階段"""
+
+    def __init__(self, f, stats):
+        self._f = f
+        self._stats = stats
+
+    def write(self, text):
+        with self._stats.stage('write'):
+            self._stats.counters['chars_written'] += len(text)
+            return self._f.write(text)
+
+def open_output(output_path, compress=False):
+    """開啟輸出的 HTML 檔 (compress=True 時寫成 gzip 壓縮檔)"""
+    if compress:
+        return gzip.open(output_path, 'wt', encoding='utf-8', compresslevel=GZIP_COMPRESS_LEVEL)
+    return open(output_path, 'w', encoding='utf-8', buffering=1 << 20)
+
+def format_date_range(since=0, until=0):
+    """日期範圍 (YYYYMMDD，0 表示不限) 的顯示文字，例如 2024-01-01 ~ 2024-03-31"""
+    def fmt(key):
+        return f"{key // 10000:04d}-{key // 100 % 100:02d}-{key % 100:02d}" if key else ''
+    return f"{fmt(since)} ~ {fmt(until)}".strip()
+
+def search_tokens(text):
+    """訊息內容的搜尋 token：中日韓文字每兩個字一組 (只有一個字時取單字)，其餘以整個詞為單位 (小寫)"""
+    tokens = set()
+    for cjk, word in SEARCH_TOKEN_PATTERN.findall(text.lower()):
+        if word:
+            tokens.add(word)
+        elif len(cjk) == 1:
+            tokens.add(cjk)
+        else:
+            tokens.update(cjk[i:i + 2] for i in range(len(cjk) - 1))
+    return tokens
+
+class SearchIndexBuilder:
+    """
+    建立前端搜尋用的倒排索引。訊息依加入的順序 (由舊到新) 從 0 開始編號；
+    每個 token 對應含有它的訊息編號 (posting list，以 array 存放)，
+    輸出時改存相鄰編號的差值 (十進位、以逗號分隔)，大部分差值只有一兩位數。
+    另外記錄每則訊息的發送者編號，日期則以 [YYYYMMDD, 連續幾則] 的 run 存放，供依發送者與日期篩選。
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.senders = []
+        self._sender_ids = {}
+        self.sender_col = array('I')
+        self.date_runs = []
+        self.count = 0
+        self._last_date = None
+        self._last_day = 0
+
+    def add(self, msg):
+        msg_id = self.count
+        self.count += 1
+        for token in search_tokens(msg['content']):
+            ids = self.postings.get(token)
+            if ids is None:
+                ids = self.postings[token] = array('I')
+            ids.append(msg_id)
+        self.sender_col.append(MessageStore._intern(msg['name'], self.senders, self._sender_ids))
+        if msg['date'] != self._last_date:
+            self._last_date = msg['date']
+            self._last_day = date_key(msg['date']) if msg['date'] else 0
+        if self.date_runs and self.date_runs[-1][0] == self._last_day:
+            self.date_runs[-1][1] += 1
+        else:
+            self.date_runs.append([self._last_day, 1])
+
+    @staticmethod
+    def _encode(ids):
+        """posting list 轉成差值編碼的字串"""
+        return ','.join(map(str, [ids[0]] + [b - a for a, b in zip(ids, ids[1:])]))
+
+    def to_json(self):
+        """輸出索引的 JSON (可直接放進 <script>)"""
+        data = {
+            'n': self.count,
+            'senders': self.senders,
+            's': self.sender_col.tolist(),
+            'd': self.date_runs,
+            't': {token: self._encode(ids) for token, ids in sorted(self.postings.items())},
+        }
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':')).replace('</', '<\\/')
+
+    def render_box(self):
+        """搜尋框 (發送者選單依名字排序)"""
+        options = ''.join(f'<option value="{i}">{html.escape(name) or "(系統訊息)"}</option>'
+                          for i, name in sorted(enumerate(self.senders), key=lambda item: item[1]))
+        return HTML_SEARCH_BOX.format(sender_options=options)
+
+def search_script():
+    """搜尋程式 (結果上限依目前的 SEARCH_MAX_RESULTS)"""
+    return SEARCH_SCRIPT.replace('__SEARCH_MAX_RESULTS__', str(SEARCH_MAX_RESULTS))
+
+def render_analytics_html(summary):
+    """把 ChatAnalytics 的統計摘要轉成頁首的統計區塊 (可收合)"""
+    parts = ['<details class="analytics" open><summary>對話統計</summary>']
+    overview = f"訊息 {summary['messages']:,} 則 | 通過過濾 {summary['kept']:,} 則 | 過濾 {summary['filtered']:,} 則"
+    days = [item for item in summary['days'] if item[0]]
+    if days:
+        busiest = max(days, key=lambda item: item[1])
+        overview += (f" | 期間 {days[0][0]} ~ {days[-1][0]} ({len(days):,} 天有訊息)"
+                     f" | 最熱鬧的一天 {busiest[0]} ({busiest[1]:,} 則)")
+    parts.append(f'<p>{overview}</p>')
+
+    senders = summary['senders'][:ANALYTICS_TOP_N]
+    if senders:
+        top = senders[0][1]
+        rows = ''.join(f'<tr><td>{html.escape(name)}</td><td>{count:,}</td>'
+                       f'<td style="width: 60%"><div class="bar" style="width: {count * 100 / top:.1f}%"></div></td></tr>'
+                       for name, count in senders)
+        parts.append(f'<h3>發送者 (前 {len(senders)} 名，共 {len(summary["senders"]):,} 人)</h3><table>{rows}</table>')
+
+    hours = summary['hours']
+    peak = max(hours) or 1
+    bars = ''.join(f'<div style="height: {count * 100 / peak:.1f}%" title="{hour}:00 {count:,} 則"></div>'
+                   for hour, count in enumerate(hours))
+    labels = ''.join(f'<span>{hour}</span>' for hour in range(24))
+    parts.append(f'<h3>各時段訊息數</h3><div class="hours">{bars}</div><div class="hour-labels">{labels}</div>')
+
+    if summary['filter_hits']:
+        hits = ', '.join(f'{html.escape(rule)} {count:,}' for rule, count in summary['filter_hits'].items())
+        parts.append(f'<h3>過濾規則命中</h3><p>{hits}</p>')
+
+    urls = summary['urls'][:ANALYTICS_TOP_N]
+    if urls:
+        rows = ''.join(f'<tr><td class="url"><a href="{html.escape(url)}" target="_blank">{html.escape(url)}</a></td>'
+                       f'<td>{count:,}</td></tr>' for url, count in urls)
+        parts.append(f'<h3>分享的網址 (前 {len(urls)} 個，共 {len(summary["urls"]):,} 個)</h3><table>{rows}</table>')
+    parts.append('</details>')
+    return ''.join(parts)
+
+def write_analytics(summary, output_path):
+    """把統計摘要寫成精簡的 JSON 檔"""
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, separators=(',', ':'))
+
+def write_html(output_path, filename, msgs, truncated, compress=False, date_range=None, analytics=None,
+               search=False):
+    """
+    將 (由新到舊排列的) 訊息寫成 HTML 檔，每 RENDER_BATCH_MSGS 則合併寫入一次。
+    date_range 為 (since, until) 時，在副標題註明日期範圍；
+    指定 analytics (ChatAnalytics) 時，在檔名下方加上對話統計區塊；
+    search=True 時為顯示的訊息建立搜尋索引 (嵌入頁面)，並加上搜尋框。
+    """
+    renderer = HtmlRenderer()
+    with _stage('render'), open_output(output_path, compress) as f:
+        if _stats is not None:
+            f = _TimedWriter(f, _stats)
+        styles = (ANALYTICS_STYLE if analytics is not None else '') + (SEARCH_STYLE if search else '')
+        if styles:
+            f.write(HTML_TEMPLATE_START.replace('</head>', styles + '</head>', 1))
+        else:
+            f.write(HTML_TEMPLATE_START)
+        scope = f"顯示限制：最新的 {MAX_DISPLAY_MSGS} 則"
+        if date_range:
+            scope = f"日期範圍：{format_date_range(*date_range)} | {scope}"
+        f.write(HTML_SUBTITLE.format(max_lines=MAX_LINES, scope=scope))
+        f.write(f'<div class="file-header">檔案：{html.escape(filename)}</div>')
+        if analytics is not None:
+            f.write(render_analytics_html(analytics.summary()))
+        if search:
+            # 訊息由舊到新編號，頁面上則由新到舊排列
+            index = SearchIndexBuilder()
+            for msg in reversed(msgs):
+                index.add(msg)
+            f.write(f'<div class="search-bar">{index.render_box()}</div>')
+
+        parts = []
+        pending = 0
+        for msg in msgs:
+            renderer.render(msg, parts)
+            pending += 1
+            if pending >= RENDER_BATCH_MSGS:
+                f.write(''.join(parts))
+                parts = []
+                pending = 0
+        f.write(''.join(parts))
+
+        # 檢查是否達到顯示上限 (避免 HTML 過大導致瀏覽器崩潰)
+        if truncated:
+            f.write(f'<div class="notice">--- 已顯示最新的 {MAX_DISPLAY_MSGS} 則訊息 (為了效能其餘已省略) ---</div>')
+
+        if search:
+            f.write(f'<script>var LINE_SEARCH_INDEX = {index.to_json()};</script>')
+            f.write(search_script())
+        f.write(HTML_TEMPLATE_END)
+
+def _shard_month(date_line):
+    """分段用的月份鍵 (例如 '2024-01')；沒有日期的訊息回傳空字串"""
+    parts = parse_date_divider(date_line)
+    return f"{parts[0]:04d}-{parts[1]:02d}" if parts else ''
+
+def _write_shard(shard_dir, shard_id, msgs):
+    """把一個分段的訊息寫成 .js 檔 (日期與名字各自建表，訊息以陣列表示)，回傳索引資訊"""
+    dates, senders = [], []
+    date_ids, sender_ids = {}, {}
+    rows = []
+    for msg in msgs:
+        date_id = MessageStore._intern(msg['date'], dates, date_ids)
+        sender_id = MessageStore._intern(msg['name'], senders, sender_ids)
+        rows.append([date_id, msg['time'], sender_id, msg['content'].strip(), 1 if msg['type'] == 'system' else 0])
+    shard_file = f"shard_{shard_id:05d}.js"
+    data = {'id': shard_id, 'dates': dates, 'senders': senders, 'msgs': rows}
+    with open(os.path.join(shard_dir, shard_file), 'w', encoding='utf-8') as f:
+        f.write('LineChatShard(')
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        f.write(');\n')
+    return {
+        'id': shard_id,
+        'file': shard_file,
+        'month': _shard_month(msgs[0]['date']),
+        'first_date': msgs[0]['date'],
+        'last_date': msgs[-1]['date'],
+        'count': len(msgs),
+    }
+
+def write_sharded_html(messages, output_path, filename, date_range=None, analytics=None, search=False):
+    """
+    分段輸出模式：不受 MAX_DISPLAY_MSGS 限制，輸出完整歷史。
+    通過過濾的訊息依月份 (每段最多 SHARD_MAX_MSGS 則) 寫成 <檔名>_shards/shard_NNNNN.js，
+    output_path 只是一個小的外殼頁面，捲動時才載入並渲染接近畫面的分段。
+    指定 analytics (ChatAnalytics) 時同時統計每一則訊息，並在外殼頁面加上對話統計區塊；
+    search=True 時另外建立完整歷史的搜尋索引，寫成 <檔名>_shards/search.js (第一次搜尋時才載入)。
+    回傳輸出的訊息數。
+    """
+    shard_dir_name = os.path.splitext(os.path.basename(output_path))[0] + '_shards'
+    shard_dir = os.path.join(os.path.dirname(output_path), shard_dir_name)
+    os.makedirs(shard_dir, exist_ok=True)
+    # 清除上次輸出的分段
+    for old_file in os.listdir(shard_dir):
+        if (old_file.startswith('shard_') and old_file.endswith('.js')) or old_file == 'search.js':
+            os.remove(os.path.join(shard_dir, old_file))
+
+    shards = []
+    buffer = []
+    month = None
+    total = 0
+    search_index = SearchIndexBuilder() if search else None
+    for msg in messages:
+        filtered = is_filtered_msg(msg)
+        if analytics is not None:
+            analytics.add(msg, filtered)
+        if filtered:
+            continue
+        msg_month = _shard_month(msg['date'])
+        if buffer and (msg_month != month or len(buffer) >= SHARD_MAX_MSGS):
+            shards.append(_write_shard(shard_dir, len(shards) + 1, buffer))
+            buffer = []
+        month = msg_month
+        buffer.append(msg)
+        if search_index is not None:
+            search_index.add(msg)
+        total += 1
+    if buffer:
+        shards.append(_write_shard(shard_dir, len(shards) + 1, buffer))
+    if search_index is not None:
+        with open(os.path.join(shard_dir, 'search.js'), 'w', encoding='utf-8') as f:
+            f.write(f'window.LINE_SEARCH_INDEX = {search_index.to_json()};\n')
+
+    # 頁面由新到舊顯示
+    shards.reverse()
+    index = {'dir': shard_dir_name, 'shards': shards}
+    index_json = json.dumps(index, ensure_ascii=False, separators=(',', ':')).replace('</', '<\\/')
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        styles = SHARD_PAGE_STYLE + (ANALYTICS_STYLE if analytics is not None else '') + (SEARCH_STYLE if search else '')
+        f.write(HTML_TEMPLATE_START.replace('</head>', styles + '</head>', 1))
+        scope = f"顯示範圍：完整歷史共 {total} 則 (捲動時分段載入)"
+        if date_range:
+            scope = f"日期範圍：{format_date_range(*date_range)} 共 {total} 則 (捲動時分段載入)"
+        f.write(HTML_SUBTITLE.format(max_lines=MAX_LINES, scope=scope))
+        f.write(f'<div class="file-header">檔案：{html.escape(filename)}</div>')
+        if analytics is not None:
+            f.write(render_analytics_html(analytics.summary()))
+        f.write('<div class="shard-toolbar">跳至月份：<select id="month-jump"></select>')
+        if search_index is not None:
+            f.write(search_index.render_box())
+        f.write('</div>')
+        f.write('<div id="chat"></div>')
+        f.write(f'<script>var LINE_CHAT_INDEX = {index_json};</script>')
+        f.write(SHARD_PAGE_SCRIPT)
+        if search_index is not None:
+            f.write(f'<script>var LINE_SEARCH_SRC = {json.dumps(shard_dir_name + "/search.js", ensure_ascii=False)};</script>')
+            f.write(search_script())
+        f.write(HTML_TEMPLATE_END)
+    return total
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    id INTEGER PRIMARY KEY,
+    file TEXT NOT NULL UNIQUE,
+    config_key TEXT,
+    offset INTEGER NOT NULL DEFAULT 0,
+    prefix TEXT,
+    names TEXT,
+    last_date TEXT,
+    last_seq INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS senders (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    chat_id INTEGER NOT NULL REFERENCES chats(id),
+    seq INTEGER NOT NULL,
+    date TEXT,
+    time TEXT NOT NULL,
+    sender_id INTEGER NOT NULL REFERENCES senders(id),
+    type TEXT NOT NULL,
+    content TEXT NOT NULL,
+    lines_count INTEGER NOT NULL,
+    filtered_rule TEXT,
+    UNIQUE (chat_id, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_messages_date_time ON messages(date, time);
+CREATE INDEX IF NOT EXISTS idx_messages_sender ON messages(sender_id);
+"""
+
+# 全文檢索表 (external content：內容只存一份在 messages)。
+# 不使用 trigger 逐筆同步 (比整批寫入慢好幾倍)，改由 export_sqlite 在寫入前後整批刪除/加入索引
+SQLITE_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(content, content='messages', content_rowid='id', tokenize='{tokenize}');
+"""
+
+SQLITE_UPSERT_MESSAGE = """
+INSERT INTO messages (chat_id, seq, date, time, sender_id, type, content, lines_count, filtered_rule)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (chat_id, seq) DO UPDATE SET
+    date = excluded.date, time = excluded.time, sender_id = excluded.sender_id, type = excluded.type,
+    content = excluded.content, lines_count = excluded.lines_count, filtered_rule = excluded.filtered_rule
+"""
+
+def _init_sqlite(conn):
+    """
+    建立資料表，回傳是否有全文檢索表。
+    FTS5 優先使用 trigram 斷詞 (中文也能搜尋，但 MATCH 的字串至少要 3 個字，較短的請直接對 messages 用 LIKE)；
+    不支援時退回 unicode61，都不行就略過全文檢索。
+    """
+    conn.executescript(SQLITE_SCHEMA)
+    # 舊版資料庫的 chats 表補上之後新增的欄位
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(chats)")}
+    for column in ('prefix', 'names'):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE chats ADD COLUMN {column} TEXT")
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone():
+        return True
+    for tokenize in ('trigram', 'unicode61'):
+        try:
+            conn.executescript(SQLITE_FTS_SCHEMA.format(tokenize=tokenize))
+            return True
+        except sqlite3.OperationalError:
+            continue
+    print("此 SQLite 不支援 FTS5，略過全文檢索表", file=sys.stderr)
+    return False
+
+def _sqlite_config_key():
+    """
+    SQLite 匯出的設定指紋：過濾規則 (影響 filtered_rule 欄位)、SPECIAL_NAMES 或偵測門檻改變時需完整重建該對話。
+    自動偵測到的名單與增量模式相同，另外記錄在 chats.names (見 _resume_blocker)。
+    """
+    config = {
+        'version': SQLITE_SCHEMA_VERSION,
+        'filter_rules': get_filter_rules().fingerprint,
+        'special_names': sorted(SPECIAL_NAMES),
+        'thresholds': NAME_DETECT_THRESHOLDS,
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def _normalize_date(date_line):
+    """日期分隔線轉為 YYYY-MM-DD，無法解析時回傳 None"""
+    parts = parse_date_divider(date_line)
+    return f"{parts[0]:04d}-{parts[1]:02d}-{parts[2]:02d}" if parts else None
+
+SQLITE_CHAT_STATE = "SELECT id, config_key, offset, prefix, names, last_date, last_seq FROM chats WHERE file = ?"
+
+def export_sqlite(file_path, db_path):
+    """
+    將單個 txt 檔的所有訊息 (包含被過濾的訊息，以 filtered_rule 欄位標示命中的規則) 匯出到 SQLite。
+    每則訊息以 (chat_id, seq) 為鍵；同一個對話再次匯出時，與增量模式相同，
+    前段內容沒變、且新偵測到的名字不影響新增的部分時，就從上次最後一則訊息開始解析並 upsert，
+    否則刪除該對話的訊息後完整重建。回傳本次寫入的訊息數。
+    解析在交易之外進行，結果分批暫存到暫存檔，只有最後整批寫入時才持有寫入鎖：
+    多個行程 (--jobs) 同時匯出到同一個資料庫時，不需等待別的對話整個解析完。
+    """
+    # 對話以原始檔案路徑識別 (UTF-16 的匯出檔實際讀取轉成 UTF-8 的副本)
+    chat_file = os.path.abspath(file_path)
+    file_path = utf8_source(file_path)
+    name_matcher, names = prepare_name_matcher(file_path)
+
+    # 多個行程同時寫入同一個資料庫時，等待對方的寫入交易結束
+    conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+    try:
+        has_fts = _init_sqlite(conn)
+        while True:
+            count = _export_sqlite_once(conn, has_fts, chat_file, file_path, name_matcher, names)
+            if count is not None:
+                return count
+            print("SQLite：解析期間此對話已被其他行程更新，重新匯出...")
+    finally:
+        conn.close()
+
+def _export_sqlite_once(conn, has_fts, chat_file, file_path, name_matcher, names):
+    """
+    export_sqlite 的一次匯出：先在交易之外解析並暫存要寫入的訊息，再以一個交易整批寫入。
+    寫入前發現對話的狀態在解析期間被其他行程改變時不寫入，回傳 None。
+    """
+    config_key = _sqlite_config_key()
+    filter_rules = get_filter_rules()
+    state = conn.execute(SQLITE_CHAT_STATE, (chat_file,)).fetchone()
+
+    with open(file_path, 'rb') as f, tempfile.TemporaryFile() as spool:
+        stat = os.fstat(f.fileno())
+        signature = None
+        start = 0
+        seq = 0
+        current_date = ""
+        if state and state[1] == config_key:
+            _, _, offset, prefix, pinned_names, saved_date, last_seq = state
+            pinned_names = json.loads(pinned_names) if pinned_names else []
+            blocker = _resume_blocker(f, stat, json.loads(prefix) if prefix else None, offset, pinned_names, names)
+            if blocker:
+                print(f"SQLite：{blocker}，重建此對話...")
+            else:
+                # 最後一則訊息可能還有後續行，從它開始重新解析 (沿用相同的 seq 與名單)
+                signature = json.loads(prefix)
+                start, current_date, seq = offset, saved_date, max(last_seq - 1, 0)
+                names = pinned_names
+                name_matcher = NameMatcher(names)
+                print(f"SQLite：從 byte {start} 繼續匯出 (已有 {last_seq} 則)")
+        elif state:
+            print("SQLite：設定已變動，重建此對話...")
+
+        # 1. 解析 (不持有任何鎖)：每 SQLITE_BATCH_SIZE 則以 pickle 暫存一批
+        reader = _OffsetLineReader(f, start)
+        # 與增量模式相同：記錄最後一則訊息的開頭，下次從那裡繼續
+        resume_offset = next_offset = start
+        first_seq = seq + 1
+        last_msg = None
+        rows = []
+        for msg in parse_lines(reader, name_matcher, current_date):
+            if last_msg is not None:
+                resume_offset = next_offset
+            last_msg = msg
+            next_offset = reader.line_offset
+            minutes = time_to_minutes(msg['time'])
+            seq += 1
+            rows.append((seq, _normalize_date(msg['date']), f"{minutes // 60:02d}:{minutes % 60:02d}",
+                         msg['name'], msg['type'], msg['content'], msg['lines_count'], filter_rules.classify(msg)))
+            if len(rows) >= SQLITE_BATCH_SIZE:
+                pickle.dump(rows, spool, pickle.HIGHEST_PROTOCOL)
+                rows = []
+        if rows:
+            pickle.dump(rows, spool, pickle.HIGHEST_PROTOCOL)
+        signature = _update_prefix_signature(f, signature, resume_offset, stat)
+        spool.seek(0)
+
+        # 2. 寫入 (持有寫入鎖)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute(SQLITE_CHAT_STATE, (chat_file,)).fetchone() != state:
+                conn.execute("ROLLBACK")
+                return None
+            if state is None:
+                chat_id = conn.execute("INSERT INTO chats (file) VALUES (?)", (chat_file,)).lastrowid
+            else:
+                chat_id = state[0]
+            # 先移除本次會改寫的訊息 (續寫時為最後一則之後，重建時為整個對話) 的全文索引
+            if has_fts:
+                conn.execute("INSERT INTO messages_fts (messages_fts, rowid, content) "
+                             "SELECT 'delete', id, content FROM messages WHERE chat_id = ? AND seq >= ?",
+                             (chat_id, first_seq))
+            if start == 0:
+                conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+
+            sender_ids = dict(conn.execute("SELECT name, id FROM senders"))
+            while True:
+                try:
+                    batch = pickle.load(spool)
+                except EOFError:
+                    break
+                for i, (msg_seq, date, time_str, name, msg_type, content, lines_count, rule) in enumerate(batch):
+                    sender_id = sender_ids.get(name)
+                    if sender_id is None:
+                        sender_id = conn.execute("INSERT INTO senders (name) VALUES (?)", (name,)).lastrowid
+                        sender_ids[name] = sender_id
+                    batch[i] = (chat_id, msg_seq, date, time_str, sender_id, msg_type, content, lines_count, rule)
+                conn.executemany(SQLITE_UPSERT_MESSAGE, batch)
+
+            if has_fts:
+                conn.execute("INSERT INTO messages_fts (rowid, content) "
+                             "SELECT id, content FROM messages WHERE chat_id = ? AND seq >= ?", (chat_id, first_seq))
+            conn.execute("UPDATE chats SET config_key = ?, offset = ?, prefix = ?, names = ?, last_date = ?, last_seq = ?, "
+                         "updated_at = ? WHERE id = ?",
+                         (config_key, resume_offset, json.dumps(signature), json.dumps(names, ensure_ascii=False),
+                          last_msg['date'] if last_msg else current_date, seq,
+                          datetime.now().isoformat(timespec='seconds'), chat_id))
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+    return max(seq - first_seq + 1, 0)
+
+def _file_sha256(path):
+    """計算整個檔案內容的 sha256"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def _stat_signature(path):
+    """檔案的 (大小, mtime 奈秒)"""
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+def _build_config_key(options):
+    """建置快取的設定指紋：顯示設定、名單、過濾規則或輸出選項改變時所有檔案都要重新轉換"""
+    config = {
+        'version': BUILD_MANIFEST_VERSION,
+        'max_lines': MAX_LINES,
+        'max_msgs': MAX_DISPLAY_MSGS,
+        'special_names': sorted(SPECIAL_NAMES),
+        'thresholds': NAME_DETECT_THRESHOLDS,
+        'filter_rules': get_filter_rules().fingerprint,
+        'options': options,
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def _output_signature(path):
+    """
+    附加輸出 (分段資料夾、統計 JSON) 的 stat 記錄：檔案為 [大小, mtime]，
+    資料夾為其中每個檔案的 [檔名, 大小, mtime]。
+    """
+    if os.path.isdir(path):
+        return [[entry.name, *_stat_signature(entry.path)] for entry in sorted(os.scandir(path), key=lambda e: e.name)
+                if entry.is_file()]
+    return list(_stat_signature(path))
+
+def _sqlite_chat_position(db_path, file_path):
+    """SQLite 資料庫中這個對話的 [設定指紋, 已匯出的 byte 位置, 最後一則的序號]；沒有記錄時回傳 None"""
+    if not os.path.isfile(db_path):
+        return None
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute("SELECT config_key, offset, last_seq FROM chats WHERE file = ?",
+                           (os.path.abspath(file_path),)).fetchone()
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+    return list(row) if row else None
+
+def is_build_up_to_date(entry, file_path, config_key):
+    """
+    依 manifest 記錄判斷檔案是否不需重新轉換 (輸入、設定與輸出都沒變)。
+    先比對大小與 mtime；大小相同但 mtime 改變，或記錄時檔案剛被修改 (mtime 不可靠) 時才比對內容雜湊。
+    雜湊確認沒變時會更新 entry 的 mtime，下次只需比對 stat。
+    附加輸出 (分段資料夾、統計 JSON) 必須存在且 stat 與記錄相同；
+    SQLite 資料庫由多個對話共用，改為確認其中這個對話的匯出位置與記錄相同。
+    """
+    if not entry or entry.get('config') != config_key:
+        return False
+    try:
+        size, mtime_ns = _stat_signature(file_path)
+        output_size, output_mtime_ns = _stat_signature(entry['output'])
+        if any(_output_signature(path) != signature for path, signature in entry['extra_outputs'].items()):
+            return False
+    except OSError:
+        return False
+    if entry['sqlite'] and _sqlite_chat_position(entry['sqlite']['path'], file_path) != entry['sqlite']['position']:
+        return False
+
+    # 輸出檔被刪除或修改
+    if (output_size, output_mtime_ns) != (entry['output_size'], entry['output_mtime_ns']):
+        if output_size != entry['output_size'] or _file_sha256(entry['output']) != entry['output_sha256']:
+            return False
+        entry['output_mtime_ns'] = output_mtime_ns
+
+    if size != entry['size']:
+        return False
+    if mtime_ns == entry['mtime_ns'] and mtime_ns < entry['recorded_ns'] - MANIFEST_RACY_NS:
+        return True
+    if _file_sha256(file_path) != entry['sha256']:
+        return False
+    entry['mtime_ns'] = mtime_ns
+    entry['recorded_ns'] = time.time_ns()
+    return True
+
+def make_build_entry(file_path, result, config_key, stat_before):
+    """
+    轉換成功後建立 manifest 記錄 (含附加輸出的 stat 與 SQLite 中這個對話的匯出位置)。
+    stat_before 為轉換前的 (大小, mtime)；轉換期間檔案被修改時回傳 None (下次重新轉換)。
+    """
+    if _stat_signature(file_path) != stat_before:
+        return None
+    output_size, output_mtime_ns = _stat_signature(result['output'])
+    sqlite_path = result['sqlite']
+    return {
+        'size': stat_before[0],
+        'mtime_ns': stat_before[1],
+        'sha256': _file_sha256(file_path),
+        'recorded_ns': time.time_ns(),
+        'config': config_key,
+        'output': result['output'],
+        'output_size': output_size,
+        'output_mtime_ns': output_mtime_ns,
+        'output_sha256': _file_sha256(result['output']),
+        'extra_outputs': {path: _output_signature(path) for path in result['extra_outputs']},
+        'sqlite': sqlite_path and {'path': sqlite_path, 'position': _sqlite_chat_position(sqlite_path, file_path)},
+        'messages': result['messages'],
+    }
+
+def convert_file(file_path, incremental=False, jobs=1, shards=False, sqlite_path=None, compress=False,
+                 collect_stats=False, since=0, until=0, analytics=False, search=False, forward=False,
+                 output_path=None):
+    """
+    將單個 txt 檔轉換為同目錄下的 HTML 檔。
+    jobs > 1 時把這個檔案切段平行解析 (增量模式下不使用)；
+    指定 since/until (YYYYMMDD) 時只輸出該日期範圍的訊息，以日期索引直接讀取對應的部分
+    (此時不使用增量與平行模式)；
+    analytics=True 時在解析的同一輪統計對話活動，寫成 <檔名>.analytics.json 並加在頁首
+    (需要看過每一則訊息，因此從頭解析，不使用增量、平行與反向讀取)；
+    search=True 時為輸出的訊息建立搜尋索引並加上搜尋框；
+    forward=True 時從頭串流解析，邊過濾邊放進固定大小的環狀緩衝區 (記憶體只保留顯示上限的訊息)，
+    gzip 壓縮的 .txt.gz 無法反向或分段讀取，一律使用這個模式；
+    output_path 可指定輸出位置 (預設為同目錄、副檔名改為 .html)；
+    shards=True 時改用分段輸出模式 (完整歷史，捲動時分段載入)；
+    指定 sqlite_path 時，另外把所有訊息匯出到該 SQLite 資料庫；
+    compress=True 時輸出 gzip 壓縮的 .html.gz；
+    collect_stats=True 時另外統計各階段耗時與計數，放在結果的 'stats'。
+    回傳結果摘要 dict (file, output, ok, messages, seconds, error；extra_outputs 為分段資料夾與統計 JSON 等
+    附加輸出，sqlite 為匯出的資料庫)，失敗時不拋出例外。
+    """
+    global _stats
+    filename = os.path.basename(file_path)
+    print(f"正在處理: {filename}...")
+    
+    # 決定輸出檔名 (同目錄，副檔名改為 .html 或 .html.gz；chat.txt.gz 輸出為 chat.html)
+    compressed_input = is_compressed_input(file_path)
+    base_name = os.path.splitext(filename[:-len('.gz')] if compressed_input else filename)[0]
+    if output_path is None:
+        output_path = os.path.join(os.path.dirname(file_path),
+                                   f"{base_name}.html.gz" if compress and not shards else f"{base_name}.html")
+    file_dir = os.path.dirname(output_path)
+    result = {'file': filename, 'output': output_path, 'ok': False, 'messages': 0, 'seconds': 0.0, 'error': None,
+              'extra_outputs': [], 'sqlite': sqlite_path}
+    if collect_stats:
+        _stats = Stats(filename)
+        hits_before = Counter(_filter_rules.hits) if _filter_rules else Counter()
+    start_time = time.perf_counter()
+    
+    try:
+        if sqlite_path:
+            if compressed_input:
+                raise ValueError('壓縮檔 (.gz) 不支援 --sqlite 匯出')
+            with _stage('sqlite'):
+                count = export_sqlite(file_path, sqlite_path)
+            print(f"已匯出 {count} 則訊息至 SQLite: {sqlite_path}")
+
+        date_range = (since, until) if since or until else None
+        chat_analytics = ChatAnalytics() if analytics else None
+        if shards:
+            messages = iter_messages_in_range(file_path, since, until) if date_range else iter_messages(file_path)
+            with _stage('render'):
+                result['messages'] = write_sharded_html(messages, output_path, filename, date_range, chat_analytics,
+                                                        search)
+            result['extra_outputs'].append(os.path.splitext(output_path)[0] + '_shards')
+            result['ok'] = True
+            print(f"完成！已輸出至: {output_path} (分段資料在 {base_name}_shards/)")
+        else:
+            # 讀取、名字偵測與過濾有各自的計時，其餘的解析工作都算在 parse
+            with _stage('parse'):
+                if date_range or analytics or forward or compressed_input:
+                    messages = iter_messages_in_range(file_path, since, until) if date_range else iter_messages(file_path)
+                    msgs, truncated = collect_display_msgs(messages, chat_analytics)
+                elif incremental:
+                    msgs, truncated = collect_display_msgs_incremental(file_path)
+                elif jobs > 1:
+                    msgs, truncated = collect_display_msgs_parallel(file_path, jobs)
+                else:
+                    # 從檔案結尾往回讀，湊滿顯示上限就停止
+                    msgs, truncated = collect_display_msgs_reverse(file_path)
+            write_html(output_path, filename, msgs, truncated, compress, date_range, chat_analytics, search)
+            result['ok'] = True
+            result['messages'] = len(msgs)
+            print(f"完成！已輸出至: {output_path}")
+        if chat_analytics is not None:
+            analytics_path = os.path.join(file_dir, f"{base_name}.analytics.json")
+            write_analytics(chat_analytics.summary(), analytics_path)
+            result['extra_outputs'].append(analytics_path)
+            print(f"對話統計已輸出至: {analytics_path}")
+
+    except Exception as e:
+        result['error'] = str(e)
+        print(f"處理失敗 {filename}: {e}", file=sys.stderr)
+
+    result['seconds'] = time.perf_counter() - start_time
+    if collect_stats:
+        stats = _stats.to_dict()
+        _stats = None
+        stats['total_seconds'] = round(result['seconds'], 6)
+        stats['counters']['messages_displayed'] = result['messages']
+        stats['filter_hits'] = dict((_filter_rules.hits - hits_before) if _filter_rules else Counter())
+        result['stats'] = stats
+    return result
+
+def merge_exports(file_paths, shards=False, compress=False, collect_stats=False, since=0, until=0, analytics=False,
+                  search=False):
+    """
+    將同一個對話的多個匯出檔 (不同裝置、不同日期範圍或重新匯出) 合併成一條連續的時間軸，
+    輸出到第一個檔案同目錄的 <檔名>_merged.html。名字偵測以所有檔案共用同一份名單；
+    各檔案逐則串流解析後依時間戳合併並去除重複 (見 TimelineMerger)，不需載入完整歷史。
+    其餘參數 (含 analytics、search) 與 convert_file 相同；回傳結果摘要 dict (另有 duplicates：移除的重複訊息數)。
+    """
+    global _stats
+    filename = " + ".join(os.path.basename(file_path) for file_path in file_paths)
+    print(f"正在合併 {len(file_paths)} 個檔案: {filename}...")
+
+    first_path = file_paths[0]
+    # 與 convert_file 相同，chat.txt.gz 的輸出檔名為 chat_merged.html
+    first_name = os.path.basename(first_path)
+    base_name = os.path.splitext(first_name[:-len('.gz')] if is_compressed_input(first_path) else first_name)[0]
+    base_name += '_merged'
+    output_path = os.path.join(os.path.dirname(first_path),
+                               f"{base_name}.html.gz" if compress and not shards else f"{base_name}.html")
+    result = {'file': filename, 'output': output_path, 'ok': False, 'messages': 0, 'seconds': 0.0, 'error': None,
+              'duplicates': 0}
+    if collect_stats:
+        _stats = Stats(filename)
+        hits_before = Counter(_filter_rules.hits) if _filter_rules else Counter()
+    start_time = time.perf_counter()
+
+    try:
+        name_matcher, _ = prepare_shared_name_matcher(file_paths)
+        date_range = (since, until) if since or until else None
+        if date_range:
+            streams = [iter_messages_in_range(file_path, since, until, name_matcher) for file_path in file_paths]
+        else:
+            streams = [iter_messages(file_path, name_matcher) for file_path in file_paths]
+        merger = TimelineMerger(streams)
+        chat_analytics = ChatAnalytics() if analytics else None
+        if shards:
+            with _stage('render'):
+                result['messages'] = write_sharded_html(merger, output_path, filename, date_range, chat_analytics,
+                                                        search)
+        else:
+            with _stage('parse'):
+                msgs, truncated = collect_display_msgs(merger, chat_analytics)
+            write_html(output_path, filename, msgs, truncated, compress, date_range, chat_analytics, search)
+            result['messages'] = len(msgs)
+        result['duplicates'] = merger.duplicates
+        result['ok'] = True
+        print(f"完成！已移除 {merger.duplicates} 則重複訊息，輸出至: {output_path}")
+        if chat_analytics is not None:
+            analytics_path = os.path.join(os.path.dirname(first_path), f"{base_name}.analytics.json")
+            write_analytics(chat_analytics.summary(), analytics_path)
+            print(f"對話統計已輸出至: {analytics_path}")
+
+    except Exception as e:
+        result['error'] = str(e)
+        print(f"合併失敗 {filename}: {e}", file=sys.stderr)
+
+    result['seconds'] = time.perf_counter() - start_time
+    if collect_stats:
+        stats = _stats.to_dict()
+        _stats = None
+        stats['total_seconds'] = round(result['seconds'], 6)
+        stats['counters']['messages_displayed'] = result['messages']
+        stats['counters']['messages_duplicated'] = result['duplicates']
+        stats['filter_hits'] = dict((_filter_rules.hits - hits_before) if _filter_rules else Counter())
+        result['stats'] = stats
+    return [result]
+
+def print_summary(results):
+    """印出批次處理的結果摘要"""
+    failed = [r for r in results if not r['ok']]
+    print(f"\n===== 處理結果：成功 {len(results) - len(failed)} 個，失敗 {len(failed)} 個 =====")
+    for r in results:
+        status = "SKIP" if r.get('skipped') else "OK  " if r['ok'] else "FAIL"
+        detail = f"{r['messages']} 則訊息" if r['ok'] else r['error']
+        print(f"{status} {r['file']} ({r['seconds']:.2f}s) {detail}")
+
+def print_stats(results):
+    """以表格印出各檔案的階段耗時與計數 (--stats)"""
+    for r in results:
+        stats = r.get('stats')
+        if not stats:
+            continue
+        print(f"\n===== 效能統計：{stats['file']} =====")
+        total = stats['total_seconds']
+        for name, seconds in stats['stages'].items():
+            share = seconds / total if total else 0.0
+            print(f"{name:<8}{seconds:>10.3f}s {share:>6.1%}")
+        print(f"{'total':<8}{total:>10.3f}s")
+        counters = stats['counters']
+        print(f"行數 {counters.get('lines', 0):,} | 訊息 {counters.get('messages', 0):,} | "
+              f"過濾 {counters.get('messages_filtered', 0):,} | 顯示 {counters.get('messages_displayed', 0):,} | "
+              f"候選名字 {counters.get('name_candidates', 0):,} | 偵測到名字 {counters.get('names_detected', 0):,} | "
+              f"輸出 {counters.get('chars_written', 0):,} 字元 | 峰值記憶體 {stats['peak_memory_mb']:.1f} MB")
+        if stats['filter_hits']:
+            hits = sorted(stats['filter_hits'].items(), key=lambda item: -item[1])
+            print("過濾規則命中：" + ", ".join(f"{rule} {count:,}" for rule, count in hits))
+
+def write_metrics(results, metrics_path):
+    """
+    把各檔案的統計寫成 JSON (--metrics)。
+    副檔名為 .ndjson 或 .jsonl 時每個檔案附加一行 (方便監控系統收集)，否則覆寫成一個 JSON 陣列。
+    """
+    timestamp = datetime.now().isoformat(timespec='seconds')
+    records = []
+    for r in results:
+        record = {'timestamp': timestamp, 'ok': r['ok'], 'error': r['error'], 'output': r['output']}
+        record.update(r.get('stats') or {'file': r['file']})
+        records.append(record)
+    if metrics_path.endswith(('.ndjson', '.jsonl')):
+        with open(metrics_path, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    else:
+        with open(metrics_path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, ensure_ascii=False, indent=2)
+
+def run_profiled(func, *args, profile_path=None, trace_memory=False, **kwargs):
+    """
+    以 cProfile 及/或 tracemalloc 包住 func (例如 generate_html) 執行。
+    profile_path：把 cProfile 結果存成該檔 (可用 snakeviz 等工具檢視)，並印出累計耗時最高的函式；
+    trace_memory：印出配置記憶體最多的程式行。多行程 (--jobs) 時只會分析主行程。
+    """
+    profiler = cProfile.Profile() if profile_path else None
+    if trace_memory:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+            print(f"\n===== cProfile (已存至 {profile_path}) =====")
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"\n===== tracemalloc：目前 {current / (1 << 20):.1f} MB，峰值 {peak / (1 << 20):.1f} MB =====")
+            for stat in snapshot.statistics('lineno')[:10]:
+                print(stat)
+
+def is_pipe(path):
+    """path 是否為具名管線 (FIFO)；不存在或無法存取時回傳 False，交給一般的檔案流程回報錯誤"""
+    try:
+        return stat.S_ISFIFO(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+def convert_stream(source, output_path=None, **options):
+    """
+    轉換標準輸入 (source 為 '-') 或具名管線等無法重複讀取的來源。
+    名字偵測與解析各需要讀一次內容，因此先串流寫到暫存檔 (內容是 gzip 時保留為 .txt.gz，
+    之後邊解壓縮邊解析)，再以 convert_file 轉換；未指定 output_path 時輸出到目前目錄。
+    其餘參數與 convert_file 相同，回傳結果摘要 dict。
+    """
+    name = 'stdin' if source == '-' else os.path.splitext(os.path.basename(source))[0] or 'stdin'
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        try:
+            src = sys.stdin.buffer if source == '-' else open(source, 'rb')
+            try:
+                head = src.read(HASH_BLOCK_SIZE)
+                spool_path = os.path.join(tmp_dir, f"{name}.txt.gz" if head[:2] == b'\x1f\x8b' else f"{name}.txt")
+                with open(spool_path, 'wb') as dst:
+                    dst.write(head)
+                    shutil.copyfileobj(src, dst, HASH_BLOCK_SIZE)
+            finally:
+                if src is not sys.stdin.buffer:
+                    src.close()
+        except OSError as e:
+            print(f"處理失敗 {name}: {e}", file=sys.stderr)
+            return {'file': name, 'output': output_path, 'ok': False, 'messages': 0, 'seconds': 0.0, 'error': str(e),
+                    'extra_outputs': [], 'sqlite': options.get('sqlite_path')}
+        if output_path is None:
+            output_path = f"{name}.html.gz" if options.get('compress') and not options.get('shards') else f"{name}.html"
+        # 暫存檔沒有可沿用的增量檢查點
+        options['incremental'] = False
+        return convert_file(spool_path, output_path=os.path.abspath(output_path), **options)
+
+def generate_html(target_file=None, incremental=False, jobs=1, shards=False, sqlite_path=None, compress=False,
+                  collect_stats=False, force=False, since=0, until=0, analytics=False, search=False, forward=False):
+    """
+    將 txt 檔轉換為 HTML。未指定 target_file 時處理 SOURCE_DIR 下所有 txt 檔；
+    incremental=True 時使用增量模式 (只解析上次轉換後新增的內容)；
+    指定 since/until (YYYYMMDD，0 表示不限) 時只輸出該日期範圍內的訊息；
+    analytics=True 時另外輸出對話統計 (<檔名>.analytics.json 與頁首的統計區塊)；
+    search=True 時在頁面加上搜尋框 (查詢轉換時預先建好的索引)；
+    forward=True 時從頭串流解析，只在固定大小的環狀緩衝區保留要顯示的訊息；
+    target_file 可以是 .txt.gz (邊解壓縮邊解析)，或 '-' / 具名管線 (先存成暫存檔，輸出到目前目錄)；
+    shards=True 時輸出完整歷史，訊息分段存放、捲動時才載入；
+    指定 sqlite_path 時，同時把訊息匯出到 SQLite 資料庫 (可重複匯出，只寫入新增的部分)；
+    compress=True 時輸出 .html.gz (分段輸出模式不適用)；
+    collect_stats=True 時每個結果另外附上各階段耗時與計數 ('stats')；
+    處理整個資料夾時會以 manifest 記錄每個檔案的轉換結果，輸入、設定與輸出都沒變的檔案直接跳過
+    (結果標示 'skipped')，force=True 時全部重新轉換；
+    jobs > 1 時以多個行程平行處理多個檔案，只有一個檔案時則在檔案內部切段平行解析
+    (jobs=0 表示使用所有 CPU 核心)。
+    回傳每個檔案的結果摘要 list。
+    """
     full_paths = []
     
+    if target_file and (target_file == '-' or is_pipe(target_file)):
+        # 標準輸入或具名管線：只能讀一次，先存成暫存檔再轉換
+        result = convert_stream(target_file, shards=shards, sqlite_path=sqlite_path, compress=compress,
+                                collect_stats=collect_stats, since=since, until=until, analytics=analytics,
+                                search=search, forward=forward)
+        print("所有檔案處理完畢。")
+        return [result]
     if target_file:
         # 如果有指定檔案，只處理該檔案
         if os.path.exists(target_file):
             full_paths = [target_file]
         else:
             print(f"找不到指定檔案: {target_file}")
-            return
+            return []
     else:
         # 否則搜尋 SOURCE_DIR 下所有 txt 檔案
-        files = [f for f in os.listdir(SOURCE_DIR) if f.endswith('.txt')]
+        files = sorted(f for f in os.listdir(SOURCE_DIR) if f.endswith('.txt'))
         if not files:
             print("未找到任何 .txt 檔案！")
-            return
+            return []
         full_paths = [os.path.join(SOURCE_DIR, f) for f in files]
 
-    for file_path in full_paths:
-        filename = os.path.basename(file_path)
-        print(f"正在處理: {filename}...")
-        
-        # 決定輸出檔名 (同目錄，副檔名改為 .html)
-        file_dir = os.path.dirname(file_path)
-        base_name = os.path.splitext(filename)[0]
-        output_path = os.path.join(file_dir, f"{base_name}.html")
-        
-        try:
-            msgs = parse_line_log(file_path)
-            # 反轉訊息列表，讓最新的在最上面
-            msgs.reverse()
-            
-            with open(output_path, 'w', encoding='utf-8') as f:
-                # 寫入檔頭 (直接寫入檔案，取代記憶體堆疊)
-                f.write(HTML_TEMPLATE_START.replace("{max_lines}", str(MAX_LINES)).replace("{max_msgs}", str(MAX_DISPLAY_MSGS)))
-                f.write(f'<div class="file-header">檔案：{filename}</div>')
-                
-                last_date = ""
-                valid_msg_count = 0
-                
-                for msg in msgs:
-                    # ================= 過濾區 =================
-                    name = msg.get('name', '')
-                    content = msg.get('content', '').strip()
-                    msg_type = msg.get('type', 'user')
-
-                    # 1. 過濾 AI 與機器人
-                    if 'AI小幫手' in name or 'gpt-4o-mini' in name or '麥肯錫AI' in name:
-                        continue
-                        
-                    # 2. 過濾特定系統訊息/圖片/貼圖/記事本
-                    system_keywords = [
-                        '圖片',
-                        '影片',
-                        '貼圖',
-                        '已新增新的記事本。',
-                        '已分享記事本。',
-                        'GOD已設定<u>公告</u>',
-                        '聯絡資訊',
-                        '!切換角色',
-                        '!重置角色',
-                        '!清空對話',
-                        '!56cf61af-bca7-4d4f-a0ab-2ba7844012ab',
-                        '!8f279bfe-37c2-4734-bedf-e17f256096ad',
-                        '!e9e2b097-2db4-4c97-9dab-52aaaf6fc74b',
-                        ]
-                    
-                    # 精確匹配
-                    if content in system_keywords:
-                        continue
-                    
-                    # 模糊匹配 (處理名字被誤判進內容的情況，例如 "Kevin 圖片")
-                    is_suffix_system = False
-                    for kw in system_keywords:
-                        if content.endswith(' ' + kw):
-                             is_suffix_system = True
-                             break
-                    if is_suffix_system:
-                        continue
-
-                    if '已收回訊息' in content: 
-                        continue
-
-                    # 3. 過濾過長訊息 (直接跳過)
-                    if msg['lines_count'] > MAX_LINES:
-                        continue
-                    # ========================================
-
-                    # 4. 檢查是否達到顯示上限 (避免 HTML 過大導致瀏覽器崩潰)
-                    if valid_msg_count >= MAX_DISPLAY_MSGS:
-                        f.write(f'<div style="text-align:center; padding: 20px; color: #888; background: #f9f9f9; margin: 20px 0; border-radius: 10px;">--- 已顯示最新的 {MAX_DISPLAY_MSGS} 則訊息 (為了效能其餘已省略) ---</div>')
-                        break
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
 
-                    # 日期分隔線
-                    if msg['date'] != last_date:
-                        f.write(f'<div class="date-divider"><span>{msg["date"]}</span></div>')
-                        last_date = msg['date']
-                    
-                    display_content = html.escape(content)
-                    
-                    # 將網址轉換為超連結
-                    # 簡單匹配 https:// 或 http:// 開頭，直到遇到空白或結尾
-                    url_pattern = re.compile(r'(https?://\S+)')
-                    display_content = url_pattern.sub(r'<a href="\1" target="_blank" style="color: #007bff; text-decoration: none;">\1</a>', display_content)
-
-                    # 渲染訊息
-                    if msg_type == 'system':
-                        # 系統訊息樣式
-                         f.write(f"""
-                <div class="message" style="justify-content: center;">
-                    <div style="background-color: #f0f0f0; color: #888; padding: 5px 15px; border-radius: 15px; font-size: 0.85em;">
-                        {display_content} <span style="font-size: 0.8em; margin-left: 5px;">{msg['time']}</span>
-                    </div>
-                </div>
-                """)
-                    else:
-                        # 一般使用者訊息
-                        avatar_text = name[0] if name else "?"
-                        avatar_color = get_avatar_color(name)
-                        bubble_class = "bubble"
-                        
-                        f.write(f"""
-                <div class="message">
-                    <div class="avatar {avatar_color}">{avatar_text}</div>
-                    <div class="content-wrapper">
-                        <div class="sender-name">{html.escape(name)}</div>
-                        <div class="{bubble_class}">{display_content}</div>
-                        <div class="time">{msg['time']}</div>
-                    </div>
-                </div>
-                """)
-                    
-                    valid_msg_count += 1
-                
-                f.write(HTML_TEMPLATE_END)
-            
-            print(f"完成！已輸出至: {output_path}")
+    # 資料夾模式：跳過 manifest 記錄中沒有變動的檔案
+    use_manifest = not target_file
+    skipped = {}
+    stat_before = {}
+    if use_manifest:
+        manifest_path = os.path.join(SOURCE_DIR, CACHE_DIR_NAME, 'build_manifest.json')
+        manifest = _load_json(manifest_path) or {}
+        entries = manifest.get('files', {})
+        config_key = _build_config_key({'shards': shards, 'compress': compress, 'sqlite': sqlite_path,
+                                        'since': since, 'until': until, 'analytics': analytics,
+                                        'search': search, 'forward': forward})
+        for file_path in full_paths:
+            name = os.path.basename(file_path)
+            entry = entries.get(name)
+            if not force and is_build_up_to_date(entry, file_path, config_key):
+                skipped[file_path] = {'file': name, 'output': entry['output'], 'ok': True, 'messages': entry['messages'],
+                                      'seconds': 0.0, 'error': None, 'skipped': True}
+            else:
+                stat_before[file_path] = _stat_signature(file_path)
+        if skipped:
+            print(f"{len(skipped)} 個檔案沒有變動，略過 (使用 --force 強制重新轉換)")
+    pending = [file_path for file_path in full_paths if file_path not in skipped]
 
-        except Exception as e:
-            print(f"處理失敗 {filename}: {e}")
+    convert = partial(convert_file, incremental=incremental, shards=shards, sqlite_path=sqlite_path,
+                      compress=compress, collect_stats=collect_stats, since=since, until=until, analytics=analytics,
+                      search=search, forward=forward)
+    if len(pending) == 1:
+        # 單一檔案：jobs > 1 時在檔案內部切段平行解析
+        converted = [convert(pending[0], jobs=jobs)]
+    elif jobs > 1 and pending:
+        jobs = min(jobs, len(pending))
+        # 每個檔案在獨立的行程中處理，名字偵測的狀態互不影響
+        print(f"使用 {jobs} 個行程平行處理 {len(pending)} 個檔案...")
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            converted = list(executor.map(convert, pending))
+    else:
+        converted = [convert(file_path) for file_path in pending]
+    converted = dict(zip(pending, converted))
+    results = [skipped.get(file_path) or converted[file_path] for file_path in full_paths]
 
+    if use_manifest:
+        # 已不存在的檔案不保留記錄；轉換失敗的檔案移除記錄，下次重新轉換
+        new_entries = {os.path.basename(p): entries[os.path.basename(p)] for p in skipped}
+        for file_path, result in converted.items():
+            if result['ok']:
+                entry = make_build_entry(file_path, result, config_key, stat_before[file_path])
+                if entry:
+                    new_entries[os.path.basename(file_path)] = entry
+        try:
+            _write_json_atomic(manifest_path, {'files': new_entries})
+        except OSError as e:
+            print(f"無法寫入建置快取 {manifest_path}: {e}", file=sys.stderr)
+
+    if len(results) > 1:
+        print_summary(results)
     print("所有檔案處理完畢。")
+    return results
+
+def parse_date_arg(value):
+    """命令列的日期參數 (YYYY-MM-DD) 轉為 YYYYMMDD 整數"""
+    try:
+        key = date_key(value)
+        datetime(key // 10000, key // 100 % 100, key % 100)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"日期格式錯誤: {value} (應為 YYYY-MM-DD)")
+    return key
+
+def build_arg_parser():
+    """建立命令列參數解析器"""
+    parser = argparse.ArgumentParser(description='將 LINE 對話紀錄 .txt 轉換為 HTML')
+    parser.add_argument('target_file', nargs='?',
+                        help='要處理的 txt 檔 (省略時處理 SOURCE_DIR 下所有 txt 檔)；'
+                             '可以是 gzip 壓縮的 .txt.gz，或以 - 從標準輸入讀取 (輸出到目前目錄)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='增量模式：只解析上次轉換後新增的內容')
+    parser.add_argument('--jobs', type=int, default=1, metavar='N',
+                        help='平行處理的行程數 (預設 1；0 表示使用所有 CPU 核心)。'
+                             '處理多個檔案時每個行程負責一個檔案，單一檔案時則切段平行解析')
+    parser.add_argument('--shards', action='store_true',
+                        help='分段輸出模式：輸出完整歷史 (不受顯示上限限制)，訊息依月份分段存放，捲動時才載入')
+    parser.add_argument('--sqlite', nargs='?', const=SQLITE_DB_DEFAULT, metavar='DB',
+                        help='同時把所有訊息匯出到 SQLite 資料庫 (含日期/發送者索引與全文檢索)；'
+                             f'省略 DB 時使用 {os.path.basename(SQLITE_DB_DEFAULT)}')
+    parser.add_argument('--gzip', action='store_true',
+                        help='輸出 gzip 壓縮的 .html.gz (瀏覽器需透過支援 gzip 的伺服器開啟，或先解壓縮)')
+    parser.add_argument('--since', type=parse_date_arg, default=0, metavar='YYYY-MM-DD',
+                        help='只輸出這一天 (含) 之後的訊息；以日期索引直接讀取對應的部分，不需解析整個檔案')
+    parser.add_argument('--until', type=parse_date_arg, default=0, metavar='YYYY-MM-DD',
+                        help='只輸出這一天 (含) 之前的訊息')
+    parser.add_argument('--analytics', action='store_true',
+                        help='在解析的同一輪統計各發送者/日期/時段的訊息數、過濾規則命中與分享的網址，'
+                             '輸出 <檔名>.analytics.json 並加在頁首 (需從頭解析整個檔案)')
+    parser.add_argument('--search', action='store_true',
+                        help='在頁面加上搜尋框：轉換時為訊息建立索引 (中文以兩字一組、英數字以詞為單位)，'
+                             '可依關鍵字、發送者與日期搜尋；分段輸出模式下索引另存在分段資料夾')
+    parser.add_argument('--forward', action='store_true',
+                        help='從頭串流解析，邊過濾邊放進固定大小的環狀緩衝區 (記憶體只保留顯示上限的訊息)；'
+                             '.txt.gz 一律使用這個模式')
+    parser.add_argument('--merge', nargs='+', metavar='FILE',
+                        help='把同一個對話的多個匯出檔依時間合併成一份 (去除重疊部分的重複訊息)，'
+                             '輸出為第一個檔案的 <檔名>_merged.html')
+    parser.add_argument('--force', action='store_true',
+                        help='處理整個資料夾時，忽略建置快取，所有檔案都重新轉換')
+    parser.add_argument('--stats', action='store_true',
+                        help='印出各階段 (read/detect/parse/filter/render/write) 耗時、計數與過濾規則命中次數')
+    parser.add_argument('--metrics', metavar='PATH',
+                        help='把統計寫成 JSON 檔；副檔名為 .ndjson 或 .jsonl 時每個檔案附加一行')
+    parser.add_argument('--profile', metavar='PATH',
+                        help='以 cProfile 分析整個轉換過程，結果存到 PATH (.prof)')
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help='以 tracemalloc 追蹤記憶體配置，印出配置最多的程式行 (會明顯變慢)')
+    return parser
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        # 如果有傳入參數，例如 python line_parser.py chat.txt
-        generate_html(sys.argv[1])
+    # 例如 python line_parser.py chat.txt --incremental
+    parser = build_arg_parser()
+    args = parser.parse_args()
+    if args.jobs < 0:
+        parser.error("--jobs 不可為負數")
+    if args.gzip and args.shards:
+        parser.error("--gzip 不能與 --shards 同時使用 (分段檔需由瀏覽器直接載入)")
+    if args.since and args.until and args.since > args.until:
+        parser.error("--since 不可晚於 --until")
+    if args.merge and (args.target_file or args.incremental or args.jobs != 1 or args.sqlite):
+        parser.error("--merge 不能與 target_file、--incremental、--jobs 或 --sqlite 同時使用")
+    collect_stats = args.stats or bool(args.metrics)
+    if args.merge:
+        missing = [path for path in args.merge if not os.path.exists(path)]
+        if missing:
+            parser.error(f"找不到指定檔案: {', '.join(missing)}")
+        results = run_profiled(merge_exports, args.merge, shards=args.shards, compress=args.gzip,
+                               collect_stats=collect_stats, since=args.since, until=args.until,
+                               analytics=args.analytics, search=args.search,
+                               profile_path=args.profile, trace_memory=args.tracemalloc)
     else:
-        generate_html()
+        results = run_profiled(generate_html, args.target_file, incremental=args.incremental, jobs=args.jobs,
+                               shards=args.shards, sqlite_path=args.sqlite, compress=args.gzip,
+                               collect_stats=collect_stats, force=args.force, since=args.since, until=args.until,
+                               analytics=args.analytics, search=args.search, forward=args.forward,
+                               profile_path=args.profile, trace_memory=args.tracemalloc)
+    if args.stats:
+        print_stats(results)
+    if args.metrics:
+        write_metrics(results, args.metrics)
@@ -0,0 +1,618 @@
+"""
+Project: Line Chat Parser - Benchmark
+
+Description:
+    Generates deterministic synthetic LINE chat exports (1 MB to multiple GB) and
+    benchmarks each stage of line_parser.py (name detection, parsing, filtering,
+    rendering and the full conversion), reporting lines/sec, MB/sec and peak RSS.
+    Results can be saved as a baseline so later runs flag regressions, and a
+    golden-output check confirms the generated HTML stays byte-identical to the
+    hash committed in line_parser_golden.json, for the reverse, forward,
+    incremental and parallel reading paths.
+
+Usage:
+    $ python line_parser_bench.py                       # 預設 10MB，與基準比較
+    $ python line_parser_bench.py --size 1GB --stages parse,convert
+    $ python line_parser_bench.py --save-baseline       # 把本次的效能結果存為基準
+    $ python line_parser_bench.py --save-golden         # 輸出格式有意改變時，更新提交在版本控制中的 golden 雜湊
+    $ python line_parser_bench.py --generate chat.txt --size 100MB   # 只產生測試資料
+    $ python line_parser_bench.py --check-names         # 名字篩選與舊寫法對照 (約 100 萬行)
+    $ python line_parser_bench.py --memory              # list of dict 與 MessageStore 的記憶體比較
+
+描述：
+    產生可重現的 LINE 對話紀錄測試資料，並分別量測 line_parser.py 各階段的效能。
+    每個階段在獨立的行程中執行，因此峰值記憶體 (peak RSS) 只反映該階段本身。
+    報告同時寫入 bench_output.txt。
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import random
+import hashlib
+import argparse
+import tempfile
+import shutil
+import subprocess
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+
+import line_parser as lp
+
+# ==========================================
+# 設定區
+# ==========================================
+# 產生的測試資料與基準檔放在快取資料夾內 (不會被提交)
+BENCH_DIR = os.path.join(lp.SOURCE_DIR, lp.CACHE_DIR_NAME, 'bench')
+BASELINE_FILE = os.path.join(BENCH_DIR, 'baseline.json')
+REPORT_FILE = os.path.join(lp.SOURCE_DIR, 'bench_output.txt')
+# 產生器格式版本 (修改產生邏輯時遞增，舊的測試資料會重新產生)
+GENERATOR_VERSION = 1
+DEFAULT_SIZE = '10MB'
+DEFAULT_SEED = 1
+# golden 檢查使用固定大小與亂數種子的資料；預期的 HTML 雜湊記錄在版本控制中的 GOLDEN_FILE
+GOLDEN_SIZE = 2 << 20
+GOLDEN_SEED = 20240101
+GOLDEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'line_parser_golden.json')
+# 每一種讀取路徑都要輸出完全相同的 HTML
+GOLDEN_MODES = ['reverse', 'forward', 'incremental', 'parallel']
+# golden 的增量模式先轉換前面這個比例的內容，再分兩次附加其餘部分：第一次的量較大，
+# 通常會因新偵測到的名字而完整重建；最後幾行則從檢查點續接。平行模式強制切成多段
+GOLDEN_INCREMENTAL_SPLIT = 0.8
+GOLDEN_INCREMENTAL_TAIL_LINES = 3
+GOLDEN_PARALLEL_CHUNK_BYTES = 256 << 10
+STAGES = ['detect', 'parse', 'filter', 'render', 'convert']
+# 名字篩選對照檢查使用的測試資料大小 (約 100 萬行)
+NAME_CHECK_SIZE = 36 << 20
+# 與基準相比，速度下降或記憶體增加超過此比例視為退步
+REGRESSION_TOLERANCE = 0.10
+# 記憶體比較時允許的絕對誤差 (MB)，避免小檔案的雜訊
+RSS_SLACK_MB = 5
+
+# 不在 SPECIAL_NAMES 內、需要靠自動偵測找出的名字
+UNKNOWN_NAMES = [
+    'Amy Chen', '小明', 'Tom', '王大同 David', 'Jack Ma Yun', '阿華', '陳 小 美',
+    'Sophie 蘇菲', '林 Kevin', 'Ken', '張三豐 🥋', 'Mary Lee', '黃阿明', 'Peter Pan',
+]
+WORDS = [
+    '早安', 'hello world', '今天天氣很好', '哈哈 哈哈', 'OK', '好 的 呀', '收到，謝謝',
+    '明天 10 點開會', 'Good night', '這個問題我再確認一下', '👍', '+1',
+    '看這個 https://example.com/a?b=1&c=2', '參考 http://line.me/R/ti/p/abc 這裡',
+    '<b>bold</b> & "quote"',
+]
+# 會被過濾規則擋下的內容
+FILTERED_WORDS = ['圖片', '貼圖', '影片', '已收回訊息', '!切換角色', '聯絡資訊', '已分享記事本。']
+WEEKDAYS = '一二三四五六日'
+
+
+def parse_size(text):
+    """將 '10MB'、'1.5GB'、'500KB' 或位元組數轉為整數位元組"""
+    text = text.strip().upper()
+    for unit, factor in (('GB', 1 << 30), ('MB', 1 << 20), ('KB', 1 << 10), ('B', 1)):
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+
+def format_size(size):
+    """位元組數轉為易讀的字串"""
+    for unit, factor in (('GB', 1 << 30), ('MB', 1 << 20), ('KB', 1 << 10)):
+        if size >= factor:
+            return f"{size / factor:.3g}{unit}"
+    return f"{size}B"
+
+
+def _format_time(rng, minute_of_day):
+    """24 小時制或上午/下午格式的時間"""
+    hour, minute = divmod(minute_of_day, 60)
+    if rng.random() < 0.3:
+        period = '上午' if hour < 12 else '下午'
+        return f"{period} {(hour % 12) or 12}:{minute:02d}"
+    return f"{hour:02d}:{minute:02d}"
+
+
+def _generate_day(rng, day, names, out):
+    """產生一天的訊息 (日期分隔線交替使用 / 與 . )，加入 out (list)"""
+    sep = '/' if day.toordinal() % 2 else '.'
+    out.append(f"{day.year}{sep}{day.month:02d}{sep}{day.day:02d}（{WEEKDAYS[day.weekday()]}）")
+    minutes = sorted(rng.randrange(24 * 60) for _ in range(rng.randint(0, 80)))
+    for minute_of_day in minutes:
+        time_str = _format_time(rng, minute_of_day)
+        name = rng.choice(names)
+        x = rng.random()
+        # 系統訊息：加入 / 退出 / 邀請 / 踢出
+        if x < 0.02:
+            out.append(f"{time_str} {name}已加入群組。")
+            continue
+        if x < 0.03:
+            out.append(f"{time_str} {name}已退出群組。")
+            continue
+        if x < 0.04:
+            out.append(f"{time_str} {name}邀請{rng.choice(names)}加入群組。")
+            continue
+        if x < 0.045:
+            out.append(f"{time_str} {name}已將{rng.choice(names)}退出群組。")
+            continue
+
+        content = rng.choice(FILTERED_WORDS) if rng.random() < 0.1 else rng.choice(WORDS)
+        # 三種格式：電腦版 Tab 分隔、名字後兩個空白、名字後一個空白
+        fmt = rng.random()
+        if fmt < 0.4:
+            out.append(f"{time_str}\t{name}\t{content}")
+        elif fmt < 0.6:
+            out.append(f"{time_str} {name}  {content}")
+        else:
+            out.append(f"{time_str} {name} {content}")
+        # 多行訊息 (偶爾超過 MAX_LINES，會被過濾)
+        if rng.random() < 0.12:
+            for _ in range(rng.randint(1, lp.MAX_LINES + 4)):
+                out.append(rng.choice(WORDS + ['', '  縮排的一行']))
+
+
+def generate_log(path, target_bytes, seed=DEFAULT_SEED):
+    """
+    產生約 target_bytes 大小的合成 LINE 對話紀錄 (相同參數一定產生相同內容)。
+    以串流方式分批寫入，可產生數 GB 的檔案。回傳 (位元組數, 行數)。
+    """
+    rng = random.Random(seed)
+    names = lp.SPECIAL_NAMES[:20] + UNKNOWN_NAMES
+    out = ['[LINE] 聊天記錄 效能測試群組', '儲存日期：2024/01/01 12:00', '']
+    size = 0
+    line_count = 0
+    day = date(2015, 1, 1)
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        while size < target_bytes:
+            _generate_day(rng, day, names, out)
+            if rng.random() < 0.2:
+                out.append('')
+            day += timedelta(days=1)
+            if len(out) >= 10000:
+                chunk = '\n'.join(out) + '\n'
+                f.write(chunk)
+                size += len(chunk.encode('utf-8'))
+                line_count += len(out)
+                out = []
+        if out:
+            chunk = '\n'.join(out) + '\n'
+            f.write(chunk)
+            size += len(chunk.encode('utf-8'))
+            line_count += len(out)
+    return size, line_count
+
+
+def ensure_dataset(target_bytes, seed):
+    """取得 (必要時產生) 指定大小與種子的測試資料，回傳 (路徑, 位元組數, 行數)"""
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    path = os.path.join(BENCH_DIR, f"synthetic_{format_size(target_bytes)}_{seed}.txt")
+    meta_path = path + '.meta.json'
+    meta = lp._load_json(meta_path)
+    if (meta and meta.get('version') == GENERATOR_VERSION and os.path.exists(path)
+            and os.path.getsize(path) == meta.get('bytes')):
+        return path, meta['bytes'], meta['lines']
+
+    print(f"正在產生測試資料 {format_size(target_bytes)} (seed={seed})...")
+    size, line_count = generate_log(path, target_bytes, seed)
+    lp._write_json_atomic(meta_path, {'version': GENERATOR_VERSION, 'bytes': size, 'lines': line_count})
+    return path, size, line_count
+
+
+def _load_names(names_path):
+    """讀取 detect 階段存下的名字，與 SPECIAL_NAMES 合併成名字比對器"""
+    detected = lp._load_json(names_path) or []
+    names = sorted(set(lp.SPECIAL_NAMES + detected), key=len, reverse=True)
+    return lp.NameMatcher(names)
+
+
+def run_stage(stage, file_path, names_path):
+    """
+    在目前的行程中執行一個階段 (由 run_stage_subprocess 以子行程呼叫)，回傳耗時秒數。
+    parse/filter/render 使用 detect 階段偵測到的名字，因此不包含名字偵測的時間。
+    """
+    # 效能測試量的是實際運算，不使用名字快取
+    lp.NAME_CACHE_ENABLED = False
+
+    if stage == 'detect':
+        start = time.perf_counter()
+        with open(file_path, 'r', encoding='utf-8') as f:
+            names = lp.auto_detect_names(f)
+        seconds = time.perf_counter() - start
+        lp._write_json_atomic(names_path, names)
+        return seconds
+
+    if stage in ('parse', 'filter'):
+        name_matcher = _load_names(names_path)
+        lp.get_filter_rules()
+        apply_filter = stage == 'filter'
+        start = time.perf_counter()
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for msg in lp.parse_lines(f, name_matcher):
+                if apply_filter:
+                    lp.is_filtered_msg(msg)
+        return time.perf_counter() - start
+
+    if stage == 'render':
+        # 只計算輸出 HTML 的時間：所有通過過濾的訊息 (不受顯示上限) 由新到舊寫出
+        name_matcher = _load_names(names_path)
+        with open(file_path, 'r', encoding='utf-8') as f:
+            store = lp.MessageStore(msg for msg in lp.parse_lines(f, name_matcher) if not lp.is_filtered_msg(msg))
+        output_path = os.path.join(tempfile.mkdtemp(prefix='line_parser_bench_'), 'render.html')
+        try:
+            start = time.perf_counter()
+            lp.write_html(output_path, os.path.basename(file_path), (store[i] for i in range(len(store) - 1, -1, -1)), False)
+            return time.perf_counter() - start
+        finally:
+            shutil.rmtree(os.path.dirname(output_path), ignore_errors=True)
+
+    if stage == 'convert':
+        # 完整轉換 (與直接執行 line_parser.py 相同的預設路徑)，輸出到暫存資料夾
+        work_dir = tempfile.mkdtemp(prefix='line_parser_bench_')
+        try:
+            work_file = os.path.join(work_dir, os.path.basename(file_path))
+            try:
+                os.link(file_path, work_file)
+            except OSError:
+                shutil.copyfile(file_path, work_file)
+            start = time.perf_counter()
+            result = lp.convert_file(work_file)
+            seconds = time.perf_counter() - start
+            if not result['ok']:
+                raise RuntimeError(result['error'])
+            return seconds
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    raise ValueError(f"未知的階段: {stage}")
+
+
+def run_stage_subprocess(stage, file_path, names_path):
+    """以獨立的子行程執行一個階段，回傳 {'seconds', 'peak_rss_mb'}"""
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--run-stage', stage, '--file', file_path, '--names', names_path],
+        capture_output=True, text=True, encoding='utf-8',
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"階段 {stage} 執行失敗:\n{proc.stderr}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def select_detected_names_reference(candidate_counts, candidate_diversity):
+    """
+    select_detected_names 改用排序前綴索引之前的寫法 (每次強連結檢查都掃描全部候選人，O(n^2))，
+    只作為對照組，確認新的寫法選出完全相同的名字。
+    """
+    th = lp.NAME_DETECT_THRESHOLDS
+    detected_names = []
+    all_candidates = list(candidate_counts.keys())
+
+    def is_strong_binding(base_name, count):
+        best_extension = None
+        max_ext_count = 0
+        for cand in all_candidates:
+            if cand != base_name and cand.startswith(base_name + " "):
+                c_count = candidate_counts[cand]
+                if c_count > max_ext_count:
+                    max_ext_count = c_count
+                    best_extension = cand
+        if best_extension and max_ext_count > 0 and (max_ext_count / count) > th['binding_ratio'] and max_ext_count > th['binding_min_count']:
+            return best_extension
+        return None
+
+    for name, count in candidate_counts.items():
+        if count > th['strong_count'] and name not in lp.SPECIAL_NAMES:
+            detected_names.append(name)
+
+    for name, count in candidate_counts.items():
+        if count > th['min_count']:
+            diversity = len(candidate_diversity.get(name, []))
+            strong_extension = is_strong_binding(name, count)
+            if strong_extension:
+                if strong_extension not in lp.SPECIAL_NAMES and strong_extension not in detected_names:
+                    detected_names.append(strong_extension)
+                continue
+            if diversity >= th['min_diversity'] and name not in lp.SPECIAL_NAMES and name not in detected_names:
+                detected_names.append(name)
+    return detected_names
+
+
+def check_name_selection(file_path):
+    """
+    以同一份候選名字統計分別執行 select_detected_names 與對照組，
+    回傳 (是否相同, 候選人數, 名字數, 新寫法秒數, 對照組秒數)。
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        candidate_counts, candidate_diversity = lp.collect_name_candidates(f)
+    start = time.perf_counter()
+    names = lp.select_detected_names(candidate_counts, candidate_diversity)
+    seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    reference = select_detected_names_reference(candidate_counts, candidate_diversity)
+    reference_seconds = time.perf_counter() - start
+    return names == reference, len(candidate_counts), len(names), seconds, reference_seconds
+
+
+def _traced_bytes(build):
+    """以 tracemalloc 量測 build() 的結果仍保留在記憶體中的位元組數，回傳 (結果, 位元組數, 峰值位元組數)"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current - before, peak - before
+
+
+def measure_memory(file_path):
+    """
+    比較同一批訊息以 list of dict 與 MessageStore 保存時的記憶體 (tracemalloc)，
+    以及預設顯示路徑 (collect_display_msgs 的環狀緩衝區) 的峰值。回傳 dict。
+    """
+    name_matcher, _ = lp.prepare_name_matcher(file_path)
+    lp.get_filter_rules()
+
+    def parse():
+        with open(file_path, 'r', encoding='utf-8', newline='\n') as f:
+            return list(lp.parse_lines(f, name_matcher))
+
+    msgs, dict_bytes, _ = _traced_bytes(parse)
+    store, store_bytes, _ = _traced_bytes(lambda: lp.MessageStore(msgs))
+    count = len(msgs)
+    del msgs, store
+    (kept, _), _, display_peak = _traced_bytes(lambda: lp.collect_display_msgs(lp.iter_messages(file_path, name_matcher)))
+    _, kept_store_bytes, _ = _traced_bytes(lambda: lp.MessageStore(kept))
+    return {
+        'messages': count,
+        'dict_bytes': dict_bytes,
+        'store_bytes': store_bytes,
+        'display_msgs': len(kept),
+        'display_peak_bytes': display_peak,
+        'display_store_bytes': kept_store_bytes,
+    }
+
+
+def config_fingerprint():
+    """影響 HTML 輸出的設定指紋：設定不同時 golden 雜湊無法互相比較"""
+    config = {
+        'generator': GENERATOR_VERSION,
+        'max_lines': lp.MAX_LINES,
+        'max_msgs': lp.MAX_DISPLAY_MSGS,
+        'special_names': sorted(lp.SPECIAL_NAMES),
+        'thresholds': lp.NAME_DETECT_THRESHOLDS,
+        'filter_rules': lp.get_filter_rules().fingerprint,
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def _convert_golden(work_file, mode):
+    """以指定的讀取路徑轉換 golden 測試資料，回傳輸出 HTML 的 sha256"""
+    if mode == 'incremental':
+        # 先轉換前段建立檢查點，再附加其餘內容，讓增量模式真的從檢查點續接
+        with open(work_file, 'rb') as f:
+            data = f.read()
+        cut = data.index(b'\n', int(len(data) * GOLDEN_INCREMENTAL_SPLIT)) + 1
+        tail = len(data)
+        for _ in range(GOLDEN_INCREMENTAL_TAIL_LINES + 1):
+            tail = data.rindex(b'\n', 0, tail)
+        with open(work_file, 'wb') as f:
+            f.write(data[:cut])
+        lp.convert_file(work_file, incremental=True)
+        for start, end in ((cut, tail + 1), (tail + 1, len(data))):
+            with open(work_file, 'ab') as f:
+                f.write(data[start:end])
+            result = lp.convert_file(work_file, incremental=True)
+    elif mode == 'parallel':
+        chunk_bytes = lp.PARALLEL_MIN_CHUNK_BYTES
+        lp.PARALLEL_MIN_CHUNK_BYTES = GOLDEN_PARALLEL_CHUNK_BYTES
+        try:
+            result = lp.convert_file(work_file, jobs=2)
+        finally:
+            lp.PARALLEL_MIN_CHUNK_BYTES = chunk_bytes
+    else:
+        result = lp.convert_file(work_file, forward=mode == 'forward')
+    if not result['ok']:
+        raise RuntimeError(result['error'])
+    with open(result['output'], 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def golden_hashes(modes=GOLDEN_MODES):
+    """以固定的測試資料分別用各種讀取路徑執行完整轉換，回傳 {路徑: 輸出 HTML 的 sha256}"""
+    path, _, _ = ensure_dataset(GOLDEN_SIZE, GOLDEN_SEED)
+    name_cache_enabled = lp.NAME_CACHE_ENABLED
+    lp.NAME_CACHE_ENABLED = False
+    hashes = {}
+    try:
+        for mode in modes:
+            # 每種路徑使用獨立的資料夾，不會沿用其他路徑留下的快取
+            work_dir = tempfile.mkdtemp(prefix='line_parser_golden_')
+            try:
+                work_file = os.path.join(work_dir, 'golden.txt')
+                shutil.copyfile(path, work_file)
+                with redirect_stdout(io.StringIO()):
+                    hashes[mode] = _convert_golden(work_file, mode)
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+    finally:
+        lp.NAME_CACHE_ENABLED = name_cache_enabled
+    return hashes
+
+
+def check_golden():
+    """
+    與 GOLDEN_FILE 記錄的雜湊比較，回傳 (是否相符, 說明 list)。
+    設定 (過濾規則、名單或顯示限制) 與記錄時不同時無法比較，視為相符並註明略過。
+    """
+    golden = lp._load_json(GOLDEN_FILE)
+    if not golden:
+        return True, [f"golden HTML：尚無 {os.path.basename(GOLDEN_FILE)} (使用 --save-golden 建立)"]
+    if golden['config'] != config_fingerprint():
+        return True, ["golden HTML：設定 (過濾規則、名單或顯示限制) 與記錄時不同，略過比較"]
+    hashes = golden_hashes()
+    different = [mode for mode in GOLDEN_MODES if hashes[mode] != golden['sha256']]
+    if not different:
+        return True, [f"golden HTML：{', '.join(GOLDEN_MODES)} 的輸出都與記錄完全相同"]
+    return False, [f"golden HTML：{mode} 的輸出與記錄不同！ ({hashes[mode]} != {golden['sha256']})"
+                   for mode in different]
+
+
+def save_golden():
+    """以目前的輸出更新 GOLDEN_FILE (各讀取路徑的輸出必須一致)，回傳雜湊"""
+    hashes = golden_hashes()
+    if len(set(hashes.values())) != 1:
+        raise RuntimeError(f"各讀取路徑的輸出不一致，無法建立 golden：{hashes}")
+    sha256 = hashes[GOLDEN_MODES[0]]
+    golden = {'size': GOLDEN_SIZE, 'seed': GOLDEN_SEED, 'generator': GENERATOR_VERSION,
+              'config': config_fingerprint(), 'sha256': sha256}
+    with open(GOLDEN_FILE, 'w', encoding='utf-8', newline='\n') as f:
+        json.dump(golden, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+    return sha256
+
+
+def compare_with_baseline(size_key, results, baseline):
+    """與基準比較，回傳退步項目的說明 list"""
+    regressions = []
+    base_results = baseline.get('runs', {}).get(size_key, {})
+    for stage, result in results.items():
+        base = base_results.get(stage)
+        if not base:
+            continue
+        if result['lines_per_sec'] < base['lines_per_sec'] * (1 - REGRESSION_TOLERANCE):
+            regressions.append(f"{stage}: 速度 {result['lines_per_sec']:,.0f} lines/s，"
+                               f"基準 {base['lines_per_sec']:,.0f} lines/s")
+        if (result.get('peak_rss_mb') and base.get('peak_rss_mb')
+                and result['peak_rss_mb'] > base['peak_rss_mb'] * (1 + REGRESSION_TOLERANCE) + RSS_SLACK_MB):
+            regressions.append(f"{stage}: 峰值記憶體 {result['peak_rss_mb']:.1f} MB，"
+                               f"基準 {base['peak_rss_mb']:.1f} MB")
+    return regressions
+
+
+def run_benchmark(target_bytes, seed, stages, save_baseline=False, golden=True):
+    """執行效能測試並輸出報告；有退步或 golden 不符時回傳 False"""
+    path, size, line_count = ensure_dataset(target_bytes, seed)
+    size_key = f"{format_size(target_bytes)}_{seed}"
+    names_path = os.path.join(BENCH_DIR, f"names_{size_key}.json")
+    report = [f"測試資料：{format_size(size)} ({line_count:,} 行，seed={seed})", '']
+    report.append(f"{'階段':<10}{'秒數':>10}{'lines/s':>14}{'MB/s':>10}{'peak RSS (MB)':>16}")
+
+    # 其他階段需要 detect 的結果
+    if 'detect' not in stages and not os.path.exists(names_path):
+        stages = ['detect'] + stages
+    results = {}
+    for stage in stages:
+        measured = run_stage_subprocess(stage, path, names_path)
+        seconds = measured['seconds']
+        result = {
+            'seconds': round(seconds, 4),
+            'lines_per_sec': line_count / seconds if seconds else 0.0,
+            'mb_per_sec': size / (1 << 20) / seconds if seconds else 0.0,
+            'peak_rss_mb': measured['peak_rss_mb'],
+        }
+        results[stage] = result
+        rss = f"{result['peak_rss_mb']:.1f}" if result['peak_rss_mb'] is not None else '-'
+        report.append(f"{stage:<10}{seconds:>10.2f}{result['lines_per_sec']:>14,.0f}{result['mb_per_sec']:>10.1f}{rss:>16}")
+
+    baseline = lp._load_json(BASELINE_FILE) or {}
+    ok = True
+    report.append('')
+    regressions = compare_with_baseline(size_key, results, baseline)
+    if regressions:
+        ok = False
+        report.append(f"與基準相比退步 (容許 {REGRESSION_TOLERANCE:.0%})：")
+        report.extend(f"  - {item}" for item in regressions)
+    elif baseline.get('runs', {}).get(size_key):
+        report.append("與基準相比沒有退步。")
+    else:
+        report.append("尚無此大小的基準 (使用 --save-baseline 儲存)。")
+
+    if golden:
+        golden_ok, lines = check_golden()
+        ok = ok and golden_ok
+        report.extend(lines)
+
+    if save_baseline:
+        baseline.setdefault('runs', {})[size_key] = results
+        lp._write_json_atomic(BASELINE_FILE, baseline)
+        report.append(f"已儲存基準至 {BASELINE_FILE}")
+
+    text = '\n'.join(report)
+    print(text)
+    with open(REPORT_FILE, 'w', encoding='utf-8') as f:
+        f.write(text + '\n')
+    return ok
+
+
+def build_arg_parser():
+    """建立命令列參數解析器"""
+    parser = argparse.ArgumentParser(description='line_parser.py 效能測試與合成測試資料產生器')
+    parser.add_argument('--size', default=DEFAULT_SIZE,
+                        help=f'測試資料大小，例如 1MB、500MB、2GB (預設 {DEFAULT_SIZE})')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='亂數種子 (相同種子產生相同內容)')
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help=f'要測試的階段，以逗號分隔 (預設 {",".join(STAGES)})')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次結果存為基準')
+    parser.add_argument('--no-golden', action='store_true', help='略過 golden HTML 檢查')
+    parser.add_argument('--save-golden', action='store_true',
+                        help=f'以目前的輸出更新 {os.path.basename(GOLDEN_FILE)} (修改輸出格式後使用，並一起提交)')
+    parser.add_argument('--check-names', action='store_true',
+                        help=f'以約 100 萬行 ({format_size(NAME_CHECK_SIZE)}) 的測試資料確認名字篩選與 O(n^2) 對照組結果相同')
+    parser.add_argument('--memory', action='store_true',
+                        help='以 tracemalloc 比較 list of dict 與 MessageStore 保存所有訊息的記憶體，以及顯示路徑的峰值')
+    parser.add_argument('--generate', metavar='PATH', help='只產生測試資料到 PATH，不執行測試')
+    # 內部使用：在子行程中執行單一階段
+    parser.add_argument('--run-stage', help=argparse.SUPPRESS)
+    parser.add_argument('--file', help=argparse.SUPPRESS)
+    parser.add_argument('--names', help=argparse.SUPPRESS)
+    return parser
+
+
+if __name__ == "__main__":
+    parser = build_arg_parser()
+    args = parser.parse_args()
+
+    if args.run_stage:
+        # 子行程：line_parser 的訊息不輸出，最後一行是 JSON 結果
+        with redirect_stdout(io.StringIO()):
+            seconds = run_stage(args.run_stage, args.file, args.names)
+        print(json.dumps({'seconds': seconds, 'peak_rss_mb': lp.peak_memory_mb()}))
+        sys.exit(0)
+
+    target_bytes = parse_size(args.size)
+    if args.generate:
+        size, line_count = generate_log(args.generate, target_bytes, args.seed)
+        print(f"已產生 {args.generate}：{format_size(size)}，{line_count:,} 行")
+        sys.exit(0)
+
+    if args.save_golden:
+        print(f"已更新 {os.path.basename(GOLDEN_FILE)}：{save_golden()}")
+        sys.exit(0)
+
+    if args.check_names:
+        path, size, line_count = ensure_dataset(NAME_CHECK_SIZE, args.seed)
+        same, candidates, name_count, seconds, reference_seconds = check_name_selection(path)
+        print(f"測試資料：{format_size(size)} ({line_count:,} 行)，候選名字 {candidates:,} 個，選出 {name_count} 個名字")
+        print(f"select_detected_names {seconds:.3f}s，對照組 {reference_seconds:.3f}s："
+              f"{'結果相同' if same else '結果不同！'}")
+        sys.exit(0 if same else 1)
+
+    if args.memory:
+        path, size, line_count = ensure_dataset(target_bytes, args.seed)
+        with redirect_stdout(io.StringIO()):
+            memory = measure_memory(path)
+        count = memory['messages']
+        print(f"測試資料：{format_size(size)} ({line_count:,} 行，{count:,} 則訊息)")
+        print(f"list of dict：{memory['dict_bytes'] / (1 << 20):8.1f} MB ({memory['dict_bytes'] / count:6.0f} B/則)")
+        print(f"MessageStore：{memory['store_bytes'] / (1 << 20):8.1f} MB ({memory['store_bytes'] / count:6.0f} B/則)")
+        print(f"顯示路徑 (最多 {lp.MAX_DISPLAY_MSGS} 則)：峰值 {memory['display_peak_bytes'] / (1 << 20):.1f} MB，"
+              f"同樣的 {memory['display_msgs']} 則存成 MessageStore 為 {memory['display_store_bytes'] / (1 << 20):.1f} MB")
+        sys.exit(0)
+
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"未知的階段: {', '.join(unknown)}")
+    ok = run_benchmark(target_bytes, args.seed, stages, args.save_baseline, not args.no_golden)
+    sys.exit(0 if ok else 1)
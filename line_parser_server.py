@@ -0,0 +1,379 @@
+"""
+Project: Line Chat Parser - Local Server
+
+Description:
+    Serves LINE chat logs on demand instead of pre-rendering static HTML.
+    Each chat is parsed once into an in-memory indexed MessageStore; HTTP
+    requests ask for pages of messages by date range, sender or keyword, and
+    only the requested page is rendered with line_parser's bubble markup.
+    Chat files are re-indexed in the background when their mtime changes.
+
+Usage:
+    $ python line_parser_server.py                      # 服務 SOURCE_DIR 下所有 txt 檔
+    $ python line_parser_server.py chat.txt --port 8080
+    Then open http://127.0.0.1:8000/ in a browser.
+
+    JSON API:
+        /api/chats
+        /api/messages?chat=<檔名>&since=2024-01-01&until=2024-01-31&sender=<名字>&q=<關鍵字>&page=1&per_page=200
+
+描述：
+    本機對話紀錄伺服器 (只使用標準函式庫)。不受 MAX_DISPLAY_MSGS 限制，
+    可以瀏覽多年份的完整對話，只渲染目前頁面的訊息。
+"""
+
+import os
+import sys
+import json
+import html
+import time
+import argparse
+import threading
+from datetime import datetime
+from array import array
+from bisect import bisect_left, bisect_right
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, urlencode
+
+import line_parser as lp
+
+# ==========================================
+# 設定區
+# ==========================================
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8000
+# 每頁訊息數 (per_page 參數的預設值與上限)
+PAGE_SIZE = 200
+MAX_PAGE_SIZE = 2000
+# 每隔幾秒檢查一次檔案是否有變動 (mtime 改變就重新建立索引)
+RELOAD_INTERVAL = 5
+
+SERVER_PAGE_STYLE = """
+    <style>
+        .chat-list a { color: #007bff; text-decoration: none; }
+        .chat-list li { margin: 8px 0; }
+        .search-form { display: flex; flex-wrap: wrap; gap: 8px; justify-content: center; margin: 15px 0; }
+        .search-form input { padding: 5px 8px; border: 1px solid #ccc; border-radius: 5px; }
+        .pager { text-align: center; margin: 15px 0; color: #666; }
+        .pager a { color: #007bff; text-decoration: none; margin: 0 8px; }
+    </style>
+"""
+
+
+def parse_date_param(value):
+    """
+    把 YYYY-MM-DD (或 YYYY/MM/DD、YYYY.MM.DD) 轉為 YYYYMMDD 整數；空字串回傳 0。
+    格式錯誤或日期不存在 (例如 2015-13-45) 時拋出 ValueError (回應 400)。
+    """
+    if not value:
+        return 0
+    key = lp.date_key(value)
+    try:
+        datetime(key // 10000, key // 100 % 100, key % 100)
+    except ValueError:
+        raise ValueError(f"日期不存在: {value}")
+    return key
+
+
+class ChatIndex:
+    """
+    單一對話的記憶體索引：通過過濾的訊息存在 MessageStore (由舊到新)，
+    另外建立每則訊息的日期鍵 (YYYYMMDD，沒有日期為 0) 與每個發送者的訊息編號列表。
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.name = os.path.basename(file_path)
+        self.mtime_ns = os.stat(file_path).st_mtime_ns
+        start = time.perf_counter()
+        self.store = lp.MessageStore(msg for msg in lp.iter_messages(file_path) if not lp.is_filtered_msg(msg))
+        store = self.store
+
+        # 日期索引：訊息大致依日期排列時可直接二分搜尋，否則逐則比對
+        keys_by_date_id = [lp.date_key(date[:10]) if lp.DATE_PATTERN.match(date) else 0
+                           for date in store.dates]
+        self.date_keys = array('I', (keys_by_date_id[date_id] for date_id in store.date_ids))
+        self.dates_sorted = all(self.date_keys[i] <= self.date_keys[i + 1] for i in range(len(self.date_keys) - 1))
+
+        # 發送者索引
+        self.sender_ids = {name: sender_id for sender_id, name in enumerate(store.senders)}
+        self.sender_postings = [array('I') for _ in store.senders]
+        for i, sender_id in enumerate(store.sender_ids):
+            self.sender_postings[sender_id].append(i)
+
+        self.indexed_at = time.time()
+        self.index_seconds = time.perf_counter() - start
+
+    def __len__(self):
+        return len(self.store)
+
+    def _keyword_matches(self, keyword):
+        """內容包含 keyword 的訊息編號 (直接在串接的 UTF-8 文字中搜尋，再換算成訊息編號)"""
+        needle = keyword.encode('utf-8')
+        text = self.store.text
+        offsets = self.store.text_offsets
+        matches = array('I')
+        pos = text.find(needle)
+        while pos != -1:
+            i = bisect_right(offsets, pos) - 1
+            msg_end = offsets[i + 1]
+            if pos + len(needle) <= msg_end:
+                matches.append(i)
+                pos = text.find(needle, msg_end)
+            else:
+                # 跨越兩則訊息的假匹配
+                pos = text.find(needle, pos + 1)
+        return matches
+
+    def query(self, since=0, until=0, sender=None, keyword=None):
+        """回傳符合條件的訊息編號 (由舊到新)；since/until 為 YYYYMMDD 整數 (0 表示不限)"""
+        lo, hi = 0, len(self.store)
+        if self.dates_sorted:
+            if since:
+                lo = bisect_left(self.date_keys, since)
+            if until:
+                hi = bisect_right(self.date_keys, until)
+
+        if sender is not None:
+            sender_id = self.sender_ids.get(sender)
+            if sender_id is None:
+                return []
+            postings = self.sender_postings[sender_id]
+            candidates = postings[bisect_left(postings, lo):bisect_left(postings, hi)]
+        else:
+            candidates = range(lo, hi)
+
+        if not self.dates_sorted and (since or until):
+            date_keys = self.date_keys
+            candidates = [i for i in candidates
+                          if (not since or date_keys[i] >= since) and (not until or date_keys[i] <= until)]
+
+        if keyword:
+            matches = self._keyword_matches(keyword)
+            if isinstance(candidates, range):
+                candidates = matches[bisect_left(matches, lo):bisect_left(matches, hi)]
+            else:
+                wanted = set(candidates)
+                candidates = [i for i in matches if i in wanted]
+        return candidates
+
+    def page(self, candidates, page, per_page):
+        """由新到舊分頁，回傳 (該頁訊息 dict list, 總頁數)"""
+        total = len(candidates)
+        pages = max((total + per_page - 1) // per_page, 1)
+        end = total - (page - 1) * per_page
+        start = max(end - per_page, 0)
+        msgs = [self.store[candidates[i]] for i in range(end - 1, start - 1, -1)] if end > 0 else []
+        return msgs, pages
+
+    def summary(self):
+        store = self.store
+        return {
+            'chat': self.name,
+            'messages': len(store),
+            'senders': len(store.senders),
+            'first_date': store.dates[store.date_ids[0]] if len(store) else '',
+            'last_date': store.dates[store.date_ids[-1]] if len(store) else '',
+            'indexed_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.indexed_at)),
+            'index_seconds': round(self.index_seconds, 3),
+        }
+
+
+class ChatRegistry:
+    """管理所有對話的索引；refresh() 會為新增或 mtime 改變的檔案重建索引 (建好後才替換，查詢不會中斷)"""
+
+    def __init__(self, files=None, directory=None):
+        self.files = files
+        self.directory = directory
+        self._chats = {}
+        self._lock = threading.Lock()
+
+    def _scan(self):
+        if self.files:
+            return [path for path in self.files if os.path.exists(path)]
+        return [os.path.join(self.directory, f) for f in sorted(os.listdir(self.directory)) if f.endswith('.txt')]
+
+    def refresh(self):
+        paths = self._scan()
+        names = {os.path.basename(path) for path in paths}
+        for path in paths:
+            name = os.path.basename(path)
+            current = self._chats.get(name)
+            try:
+                if current is not None and os.stat(path).st_mtime_ns == current.mtime_ns:
+                    continue
+                print(f"正在建立索引: {name}...")
+                index = ChatIndex(path)
+            except (OSError, UnicodeDecodeError) as e:
+                print(f"建立索引失敗 {name}: {e}", file=sys.stderr)
+                continue
+            with self._lock:
+                self._chats[name] = index
+            print(f"索引完成: {name} ({len(index)} 則，{index.index_seconds:.2f}s)")
+        with self._lock:
+            for name in list(self._chats):
+                if name not in names:
+                    del self._chats[name]
+
+    def watch(self, interval=RELOAD_INTERVAL):
+        """在背景執行緒中定期 refresh"""
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.refresh()
+        thread = threading.Thread(target=loop, name='chat-reindex', daemon=True)
+        thread.start()
+        return thread
+
+    def get(self, name):
+        with self._lock:
+            return self._chats.get(name)
+
+    def all(self):
+        with self._lock:
+            return [self._chats[name] for name in sorted(self._chats)]
+
+
+class ChatRequestHandler(BaseHTTPRequestHandler):
+    """HTTP 請求處理：/ (對話列表)、/chat (分頁瀏覽)、/api/chats、/api/messages"""
+
+    registry = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        routes = {
+            '/': self._index_page,
+            '/chat': self._chat_page,
+            '/api/chats': self._api_chats,
+            '/api/messages': self._api_messages,
+        }
+        handler = routes.get(url.path)
+        if handler is None:
+            self._send(404, 'text/plain; charset=utf-8', '找不到頁面')
+            return
+        try:
+            handler(params)
+        except ValueError as e:
+            self._send(400, 'text/plain; charset=utf-8', str(e))
+
+    def _send(self, status, content_type, body):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_json(self, data, status=200):
+        self._send(status, 'application/json; charset=utf-8', json.dumps(data, ensure_ascii=False))
+
+    def _query(self, params):
+        """解析查詢參數並執行查詢，回傳 (chat, 該頁訊息, 符合總數, page, pages)"""
+        chat = self.registry.get(params.get('chat', ''))
+        if chat is None:
+            raise ValueError(f"找不到對話: {params.get('chat', '')}")
+        since = parse_date_param(params.get('since', ''))
+        until = parse_date_param(params.get('until', ''))
+        try:
+            page = max(int(params.get('page', 1)), 1)
+            per_page = min(max(int(params.get('per_page', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        except ValueError:
+            raise ValueError("page / per_page 必須是整數")
+        candidates = chat.query(since, until, params.get('sender') or None, params.get('q') or None)
+        msgs, pages = chat.page(candidates, page, per_page)
+        return chat, msgs, len(candidates), page, pages
+
+    def _api_chats(self, params):
+        self._send_json([chat.summary() for chat in self.registry.all()])
+
+    def _api_messages(self, params):
+        chat, msgs, total, page, pages = self._query(params)
+        self._send_json({'chat': chat.name, 'total': total, 'page': page, 'pages': pages, 'messages': msgs})
+
+    def _page_start(self, subtitle):
+        return (lp.HTML_TEMPLATE_START.replace('</head>', SERVER_PAGE_STYLE + '</head>', 1)
+                + lp.HTML_SUBTITLE.format(max_lines=lp.MAX_LINES, scope=html.escape(subtitle)))
+
+    def _index_page(self, params):
+        parts = [self._page_start("本機伺服器：完整歷史，依需要分頁載入"), '<ul class="chat-list">']
+        for chat in self.registry.all():
+            info = chat.summary()
+            link = '/chat?' + urlencode({'chat': chat.name})
+            parts.append(f'<li><a href="{html.escape(link)}">{html.escape(chat.name)}</a> '
+                         f'({info["messages"]:,} 則，{html.escape(info["first_date"])} ~ {html.escape(info["last_date"])})</li>')
+        parts.append('</ul>')
+        parts.append(lp.HTML_TEMPLATE_END)
+        self._send(200, 'text/html; charset=utf-8', ''.join(parts))
+
+    def _chat_page(self, params):
+        chat, msgs, total, page, pages = self._query(params)
+        parts = [self._page_start(f"共 {total:,} 則符合條件，第 {page}/{pages} 頁 (由新到舊)"),
+                 f'<div class="file-header">檔案：{html.escape(chat.name)}</div>']
+
+        # 搜尋表單 (發送者可從清單選擇)
+        field = lambda key: html.escape(params.get(key, ''))
+        parts.append(
+            '<form class="search-form" method="get" action="/chat">'
+            f'<input type="hidden" name="chat" value="{html.escape(chat.name)}">'
+            f'<input type="date" name="since" value="{field("since")}" title="起始日期">'
+            f'<input type="date" name="until" value="{field("until")}" title="結束日期">'
+            f'<input type="text" name="sender" value="{field("sender")}" placeholder="發送者" list="senders">'
+            f'<input type="text" name="q" value="{field("q")}" placeholder="關鍵字">'
+            '<input type="submit" value="搜尋"></form>'
+            '<datalist id="senders">'
+            + ''.join(f'<option value="{html.escape(name)}">' for name in chat.store.senders if name)
+            + '</datalist>')
+
+        pager = self._pager(params, page, pages)
+        parts.append(pager)
+        renderer = lp.HtmlRenderer()
+        for msg in msgs:
+            renderer.render(msg, parts)
+        parts.append(pager)
+        parts.append(lp.HTML_TEMPLATE_END)
+        self._send(200, 'text/html; charset=utf-8', ''.join(parts))
+
+    @staticmethod
+    def _pager(params, page, pages):
+        def link(target, label):
+            query = dict(params, page=target)
+            return f'<a href="/chat?{html.escape(urlencode(query))}">{label}</a>'
+        items = []
+        if page > 1:
+            items.append(link(1, '« 最新'))
+            items.append(link(page - 1, '‹ 較新'))
+        items.append(f'{page} / {pages}')
+        if page < pages:
+            items.append(link(page + 1, '較舊 ›'))
+            items.append(link(pages, '最舊 »'))
+        return f'<div class="pager">{"".join(items)}</div>'
+
+
+def build_arg_parser():
+    """建立命令列參數解析器"""
+    parser = argparse.ArgumentParser(description='以本機 HTTP 伺服器瀏覽 LINE 對話紀錄 (依需要分頁渲染)')
+    parser.add_argument('files', nargs='*',
+                        help='要服務的 txt 檔 (省略時服務 SOURCE_DIR 下所有 txt 檔，並自動加入新檔案)')
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f'監聽位址 (預設 {DEFAULT_HOST})')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'監聽埠號 (預設 {DEFAULT_PORT})')
+    parser.add_argument('--reload-interval', type=float, default=RELOAD_INTERVAL, metavar='SECONDS',
+                        help=f'檢查檔案變動的間隔秒數 (預設 {RELOAD_INTERVAL})')
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_arg_parser().parse_args()
+    registry = ChatRegistry(files=args.files, directory=lp.SOURCE_DIR)
+    registry.refresh()
+    registry.watch(args.reload_interval)
+
+    ChatRequestHandler.registry = registry
+    server = ThreadingHTTPServer((args.host, args.port), ChatRequestHandler)
+    print(f"伺服器已啟動: http://{args.host}:{args.port}/ (Ctrl+C 結束)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("伺服器已關閉。")
+    finally:
+        server.server_close()
@@ -0,0 +1,25 @@
+"""
+line_parser 測試的共用設定：讓測試可以直接 import 專案根目錄的腳本，
+並提供以 line_parser_bench 的產生器建立的合成對話紀錄。
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+import line_parser_bench as bench  # noqa: E402
+
+
+@pytest.fixture
+def synthetic_log(tmp_path):
+    """產生合成對話紀錄的函式：synthetic_log(size, seed=1, name='chat.txt') 回傳檔案路徑"""
+    def make(size, seed=bench.DEFAULT_SEED, name='chat.txt'):
+        path = tmp_path / name
+        bench.generate_log(str(path), size, seed)
+        return str(path)
+    return make
@@ -0,0 +1,62 @@
+"""ChatAnalytics (--analytics) 的測試：分批彙總的結果要與逐則計數相同"""
+
+import json
+from collections import Counter
+
+import line_parser as lp
+
+
+def brute_force_summary(msgs):
+    rules = lp.get_filter_rules()
+    senders, days, hours, urls, hits = Counter(), Counter(), [0] * 24, Counter(), Counter()
+    kept = system = 0
+    for msg in msgs:
+        rule = rules.classify(msg)
+        if rule is not None:
+            hits[rule] += 1
+            continue
+        kept += 1
+        key = lp.date_key(msg['date']) if msg['date'] else 0
+        days[f"{key // 10000:04d}-{key // 100 % 100:02d}-{key % 100:02d}" if key else ''] += 1
+        hours[msg['ts'] % 86400 // 3600] += 1
+        if msg['type'] == 'system':
+            system += 1
+        else:
+            senders[msg['name']] += 1
+        urls.update(lp.URL_PATTERN.findall(msg['content']))
+    return {
+        'messages': len(msgs), 'kept': kept, 'filtered': len(msgs) - kept, 'system': system,
+        'filter_hits': dict(hits), 'senders': dict(senders), 'days': sorted(days.items()), 'hours': hours,
+        'urls': dict(urls),
+    }
+
+
+def test_summary_matches_brute_force(synthetic_log, monkeypatch):
+    # 小批次，確保跨越多次彙總
+    monkeypatch.setattr(lp, 'ANALYTICS_BATCH_SIZE', 1000)
+    msgs = list(lp.iter_messages(synthetic_log(1 << 20)))
+    analytics = lp.ChatAnalytics()
+    for msg in msgs:
+        analytics.add(msg, lp.is_filtered_msg(msg))
+    summary = analytics.summary()
+    expected = brute_force_summary(msgs)
+    assert expected['system'] and expected['urls'] and expected['filter_hits']
+    assert {key: summary[key] for key in ('messages', 'kept', 'filtered', 'system', 'filter_hits', 'hours')} == \
+        {key: expected[key] for key in ('messages', 'kept', 'filtered', 'system', 'filter_hits', 'hours')}
+    assert dict(summary['senders']) == expected['senders']
+    assert [count for _, count in summary['senders']] == sorted(expected['senders'].values(), reverse=True)
+    assert [tuple(day) for day in summary['days']] == expected['days']
+    assert dict(summary['urls']) == expected['urls']
+
+
+def test_convert_file_writes_analytics_json(synthetic_log):
+    chat = synthetic_log(300 << 10)
+    result = lp.convert_file(chat, analytics=True)
+    assert result['ok']
+    with open(chat[:-len('.txt')] + '.analytics.json', encoding='utf-8') as f:
+        summary = json.load(f)
+    assert summary['kept'] >= result['messages']
+    assert summary['messages'] == summary['kept'] + summary['filtered']
+    assert sum(summary['hours']) == summary['kept']
+    with open(result['output'], encoding='utf-8') as f:
+        assert '過濾規則命中' in f.read()
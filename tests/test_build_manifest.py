@@ -0,0 +1,58 @@
+"""資料夾模式建置快取 (manifest) 的測試：任何一個輸出遺失或被改動都要重新轉換"""
+
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import line_parser as lp
+
+
+@pytest.fixture
+def source_dir(synthetic_log, tmp_path, monkeypatch):
+    for seed in (1, 2):
+        synthetic_log(200 << 10, seed=seed, name=f'chat{seed}.txt')
+    monkeypatch.setattr(lp, 'SOURCE_DIR', str(tmp_path))
+    return tmp_path
+
+
+def build(source_dir):
+    """以分段、統計與 SQLite 輸出轉換整個資料夾，回傳 {檔名: 是否略過}"""
+    results = lp.generate_html(shards=True, analytics=True, sqlite_path=str(source_dir / 'chats.db'))
+    assert all(result['ok'] for result in results)
+    return {result['file']: bool(result.get('skipped')) for result in results}
+
+
+def test_unchanged_outputs_are_skipped(source_dir):
+    build(source_dir)
+    assert build(source_dir) == {'chat1.txt': True, 'chat2.txt': True}
+
+
+@pytest.mark.parametrize('damage', [
+    lambda d: os.remove(d / 'chats.db'),
+    lambda d: shutil.rmtree(d / 'chat1_shards'),
+    lambda d: os.remove(d / 'chat1_shards' / 'shard_00001.js'),
+    lambda d: os.remove(d / 'chat1.analytics.json'),
+    lambda d: (d / 'chat1.analytics.json').write_text('{}', encoding='utf-8'),
+])
+def test_missing_or_modified_output_rebuilds(source_dir, damage):
+    build(source_dir)
+    damage(source_dir)
+    skipped = build(source_dir)
+    assert not skipped['chat1.txt']
+    assert (source_dir / 'chat1_shards' / 'shard_00001.js').exists()
+    assert (source_dir / 'chat1.analytics.json').read_text(encoding='utf-8') != '{}'
+    assert build(source_dir)['chat1.txt']
+
+
+def test_chat_removed_from_database_rebuilds(source_dir):
+    build(source_dir)
+    with sqlite3.connect(source_dir / 'chats.db') as conn:
+        chat_id, = conn.execute("SELECT id FROM chats WHERE file = ?",
+                                (str(source_dir / 'chat1.txt'),)).fetchone()
+        conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+        conn.execute("DELETE FROM chats WHERE id = ?", (chat_id,))
+    assert build(source_dir) == {'chat1.txt': False, 'chat2.txt': True}
+    with sqlite3.connect(source_dir / 'chats.db') as conn:
+        assert conn.execute("SELECT COUNT(*) FROM chats").fetchone()[0] == 2
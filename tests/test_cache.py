@@ -0,0 +1,115 @@
+"""名字快取與前段內容驗證 (_prefix_unchanged) 的測試"""
+
+import io
+import os
+
+import line_parser as lp
+
+
+class CountingReader(io.BufferedReader):
+    """記錄讀取了多少 bytes 的檔案物件"""
+
+    bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+def _open_counting(path):
+    return CountingReader(io.FileIO(path, 'rb'))
+
+
+def _signature(path):
+    with open(path, 'rb') as f:
+        return lp._update_prefix_signature(f, None, os.path.getsize(path), os.fstat(f.fileno()))
+
+
+def _make_file(path, size):
+    with open(path, 'wb') as f:
+        f.write(bytes(i % 251 for i in range(size)))
+
+
+def test_append_is_verified(tmp_path, monkeypatch):
+    monkeypatch.setattr(lp, 'HASH_BLOCK_SIZE', 1024)
+    path = str(tmp_path / 'chat.txt')
+    _make_file(path, 200 * 1024 + 100)
+    signature = _signature(path)
+    with open(path, 'ab') as f:
+        f.write(b'appended\n')
+
+    with _open_counting(path) as f:
+        assert lp._prefix_unchanged(f, signature, os.fstat(f.fileno()))
+        # 只讀已記錄的範圍，不讀新增的部分
+        assert f.bytes_read == signature['size']
+
+
+def test_edit_with_append_is_detected(tmp_path, monkeypatch):
+    monkeypatch.setattr(lp, 'HASH_BLOCK_SIZE', 1024)
+    path = str(tmp_path / 'chat.txt')
+    _make_file(path, 200 * 1024)
+    signature = _signature(path)
+    # 原地修改中間一個區塊 (長度不變)，同時在尾端新增內容
+    with open(path, 'r+b') as f:
+        f.seek(137 * 1024 + 5)
+        f.write(b'X')
+        f.seek(0, os.SEEK_END)
+        f.write(b'appended\n')
+
+    with open(path, 'rb') as f:
+        assert not lp._prefix_unchanged(f, signature, os.fstat(f.fileno()))
+
+
+def test_unchanged_stat_needs_no_read(tmp_path, monkeypatch):
+    monkeypatch.setattr(lp, 'HASH_BLOCK_SIZE', 1024)
+    path = str(tmp_path / 'chat.txt')
+    _make_file(path, 50 * 1024)
+    old = os.stat(path).st_mtime_ns - 10 * lp.MANIFEST_RACY_NS
+    os.utime(path, ns=(old, old))
+    signature = _signature(path)
+
+    with _open_counting(path) as f:
+        assert lp._prefix_unchanged(f, signature, os.fstat(f.fileno()))
+        assert f.bytes_read == 0
+
+
+def test_in_place_edit_is_detected(tmp_path, monkeypatch):
+    monkeypatch.setattr(lp, 'HASH_BLOCK_SIZE', 1024)
+    path = str(tmp_path / 'chat.txt')
+    _make_file(path, 200 * 1024)
+    signature = _signature(path)
+    # 大小不變、只改了一個區塊
+    with open(path, 'r+b') as f:
+        f.seek(1024 + 5)
+        f.write(b'X')
+    os.utime(path, ns=(signature['stat'][1] + 10**9,) * 2)
+
+    with open(path, 'rb') as f:
+        assert not lp._prefix_unchanged(f, signature, os.fstat(f.fileno()))
+
+
+def test_truncated_file_is_detected(tmp_path):
+    path = str(tmp_path / 'chat.txt')
+    _make_file(path, 4096)
+    signature = _signature(path)
+    with open(path, 'r+b') as f:
+        f.truncate(1000)
+
+    with open(path, 'rb') as f:
+        assert not lp._prefix_unchanged(f, signature, os.fstat(f.fileno()))
+
+
+def test_name_cache_follows_appends(synthetic_log):
+    path = synthetic_log(300 << 10)
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        f.writelines(lines[:len(lines) // 2])
+    lp.detect_names_cached(path)
+
+    with open(path, 'a', encoding='utf-8', newline='\n') as f:
+        f.writelines(lines[len(lines) // 2:])
+    cached = lp.detect_names_cached(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        assert cached == lp.auto_detect_names(f)
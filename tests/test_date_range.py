@@ -0,0 +1,101 @@
+"""日期範圍 (--since / --until) 的測試：以日期索引讀取的結果要與逐則比對日期相同"""
+
+import os
+import random
+
+import pytest
+
+import line_parser as lp
+
+UNSORTED_CHAT = """[LINE] 聊天記錄
+10:00\t小明\t第一條分隔線之前
+2024/01/03（三）
+10:00\t小明\t一月三日
+2024/01/01（一）
+10:00\t小華\t一月一日
+第二行
+2024/01/05（五）
+10:00\t小明\t一月五日
+2024/01/03（三）
+11:00\t小華\t又是一月三日
+"""
+
+
+def in_range(msgs, since, until):
+    """逐則比對日期的對照組 (沒有日期的訊息視為 0)"""
+    return [msg for msg in msgs
+            if (not since or (lp.date_key(msg['date']) if msg['date'] else 0) >= since)
+            and (not until or (lp.date_key(msg['date']) if msg['date'] else 0) <= until)]
+
+
+@pytest.fixture
+def chat_and_days(synthetic_log):
+    chat = synthetic_log(1 << 20)
+    msgs = list(lp.iter_messages(chat))
+    days = sorted({lp.date_key(msg['date']) for msg in msgs if msg['date']})
+    return chat, msgs, days
+
+
+def test_random_ranges_match_brute_force(chat_and_days):
+    chat, msgs, days = chat_and_days
+    rng = random.Random(18)
+    ranges = [(0, 0), (days[0], 0), (0, days[-1]), (days[0], days[0]), (days[-1], days[-1]),
+              (days[-1] + 1, 0), (0, days[0] - 1), (days[10], days[9])]
+    for _ in range(20):
+        since, until = sorted(rng.sample(days, 2))
+        ranges.append((since, until))
+    for since, until in ranges:
+        assert list(lp.iter_messages_in_range(chat, since, until)) == in_range(msgs, since, until), (since, until)
+
+
+def test_index_follows_appends(chat_and_days):
+    chat, _, _ = chat_and_days
+    lp.build_date_index(chat)
+    with open(chat, 'a', encoding='utf-8') as f:
+        f.write('2030/01/01（二）\n10:00\t小明\t新的一天\n')
+    entries = lp.build_date_index(chat)
+    assert entries[-1][0] == 20300101
+    assert [msg['content'] for msg in lp.iter_messages_in_range(chat, 20300101)] == ['新的一天']
+    # 續掃的結果與重新掃描整個檔案相同
+    os.remove(lp._cache_path(chat, '.dates.json'))
+    assert lp.build_date_index(chat) == entries
+
+
+def test_unsorted_dividers(tmp_path):
+    chat = tmp_path / 'chat.txt'
+    chat.write_text(UNSORTED_CHAT, encoding='utf-8')
+    chat = str(chat)
+    msgs = list(lp.iter_messages(chat))
+    for since, until in [(0, 0), (20240103, 20240103), (20240101, 20240103), (0, 20240101),
+                         (20240102, 20240102), (20240104, 0), (20240106, 0)]:
+        assert list(lp.iter_messages_in_range(chat, since, until)) == in_range(msgs, since, until), (since, until)
+
+
+def test_date_index_ranges():
+    entries = [(20240101, 10), (20240102, 50), (20240104, 90)]
+    assert lp.date_index_ranges(entries, 120) == [(0, 120)]
+    assert lp.date_index_ranges(entries, 120, 20240102, 20240102) == [(50, 90)]
+    # 範圍起點落在沒有訊息的日期
+    assert lp.date_index_ranges(entries, 120, 20240103) == [(90, 120)]
+    assert lp.date_index_ranges(entries, 120, 0, 20240101) == [(0, 50)]
+    # 沒有任何訊息的範圍
+    assert lp.date_index_ranges(entries, 120, 20240103, 20240103) == []
+    assert lp.date_index_ranges(entries, 120, 20240105) == []
+    unsorted = [(20240103, 10), (20240101, 40), (20240103, 70)]
+    assert lp.date_index_ranges(unsorted, 100, 20240103, 20240103) == [(10, 40), (70, 100)]
+    assert lp.date_index_ranges(unsorted, 100, 0, 20240101) == [(0, 10), (40, 70)]
+
+
+def test_convert_file_with_date_range(chat_and_days):
+    chat, msgs, days = chat_and_days
+    since, until = days[100], days[120]
+    expected = [msg for msg in in_range(msgs, since, until) if not lp.is_filtered_msg(msg)]
+    assert len(expected) < lp.MAX_DISPLAY_MSGS
+    result = lp.convert_file(chat, since=since, until=until)
+    assert result['ok'] and result['messages'] == len(expected)
+    with open(result['output'], encoding='utf-8') as f:
+        page = f.read()
+    assert expected[0]['date'] in page and expected[-1]['date'] in page
+    assert msgs[0]['date'] not in page
+    empty = lp.convert_file(chat, since=days[-1] + 1)
+    assert empty['ok'] and empty['messages'] == 0
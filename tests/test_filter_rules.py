@@ -0,0 +1,76 @@
+"""FilterRules 的測試：設定檔載入、各類規則的比對與命中次數"""
+
+import json
+
+import pytest
+
+import line_parser as lp
+
+
+def msg(content, name='小明', lines_count=1):
+    return {'name': name, 'content': content, 'lines_count': lines_count}
+
+
+@pytest.fixture
+def rules():
+    return lp.FilterRules({})
+
+
+def test_shipped_rules_file_matches_defaults():
+    shipped = lp.FilterRules.from_file(lp.FILTER_RULES_FILE)
+    assert shipped.config == lp.DEFAULT_FILTER_RULES
+    assert shipped.fingerprint == lp.FilterRules({}).fingerprint
+
+
+def test_from_file_merges_with_defaults(tmp_path):
+    assert lp.FilterRules.from_file(str(tmp_path / 'missing.json')).config == lp.DEFAULT_FILTER_RULES
+
+    path = tmp_path / 'rules.json'
+    path.write_text(json.dumps({'content_keywords': ['收到 了'], 'max_lines': 3}, ensure_ascii=False),
+                    encoding='utf-8')
+    custom = lp.FilterRules.from_file(str(path))
+    assert custom.config['sender_contains'] == lp.DEFAULT_FILTER_RULES['sender_contains']
+    assert custom.max_lines == 3
+    assert custom.fingerprint != lp.FilterRules({}).fingerprint
+    assert custom.match(msg('圖片')) is None
+    assert custom.match(msg('好 收到 了')) == 'suffix:收到 了'
+    assert custom.match(msg('一\n二\n三\n四', lines_count=4)) == 'max_lines'
+    assert lp.FilterRules({}).max_lines == lp.MAX_LINES
+
+
+def test_match_suffix(rules):
+    assert rules.match_suffix('Kevin 圖片') == '圖片'
+    assert rules.match_suffix('Amy Chen 已分享記事本。') == '已分享記事本。'
+    assert rules.match_suffix('圖片') is None
+    assert rules.match_suffix('這張圖片') is None
+    assert rules.match_suffix('圖片 很好看') is None
+    spaced = lp.FilterRules({'content_keywords': ['收到 了', '好']})
+    assert spaced.match_suffix('我 收到 了') == '收到 了'
+    assert spaced.match_suffix('我收到 了') is None
+    assert spaced.match_suffix('那 好') == '好'
+
+
+def test_rule_order_and_names(rules):
+    assert rules.match(msg('圖片', name='AI小幫手 bot')) == 'sender:AI小幫手'
+    assert rules.match(msg(' 貼圖 ')) == 'exact:貼圖'
+    assert rules.match(msg('Kevin 圖片')) == 'suffix:圖片'
+    assert rules.match(msg('小明已收回訊息')) == 'contains:已收回訊息'
+    assert rules.match(msg('很長', lines_count=lp.MAX_LINES + 1)) == 'max_lines'
+    assert rules.match(msg('一般訊息', lines_count=lp.MAX_LINES)) is None
+    assert rules.match(msg('<b>GOD已設定<u>公告</u>')) is None
+    assert rules.match(msg('GOD已設定<u>公告</u>')) == 'exact:GOD已設定<u>公告</u>'
+
+
+def test_hits(rules):
+    for content in ['圖片', '圖片', 'Kevin 圖片', '一般訊息']:
+        rules.match(msg(content))
+    assert rules.hits == {'exact:圖片': 2, 'suffix:圖片': 1}
+    assert rules.classify(msg('圖片')) == 'exact:圖片'
+    assert rules.hits['exact:圖片'] == 2
+
+
+def test_system_event_pattern(rules):
+    assert rules.system_event_pattern.search('小明已加入群組。')
+    assert rules.system_event_pattern.search('小明邀請小華加入群組。')
+    assert not rules.system_event_pattern.search('已加入群組。了嗎')
+    assert lp.FilterRules({'system_event_patterns': []}).system_event_pattern is None
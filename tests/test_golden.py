@@ -0,0 +1,17 @@
+"""golden HTML 的測試：各讀取路徑的輸出都要與 line_parser_golden.json 記錄的雜湊相同"""
+
+import pytest
+
+import line_parser as lp
+import line_parser_bench as bench
+
+
+def test_every_reading_path_matches_golden():
+    golden = lp._load_json(bench.GOLDEN_FILE)
+    assert golden, f"缺少 {bench.GOLDEN_FILE}"
+    if golden['config'] != bench.config_fingerprint():
+        pytest.skip("設定 (過濾規則、名單或顯示限制) 與記錄 golden 時不同")
+    assert (golden['size'], golden['seed'], golden['generator']) == \
+        (bench.GOLDEN_SIZE, bench.GOLDEN_SEED, bench.GENERATOR_VERSION)
+    hashes = bench.golden_hashes()
+    assert hashes == {mode: golden['sha256'] for mode in bench.GOLDEN_MODES}
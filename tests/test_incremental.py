@@ -0,0 +1,88 @@
+"""增量模式 (--incremental) 的測試：附加內容後重新轉換，結果要與完整轉換相同"""
+
+import os
+import re
+import shutil
+
+import line_parser as lp
+
+
+def _convert(path, **options):
+    result = lp.convert_file(path, **options)
+    assert result['ok'], result['error']
+    with open(result['output'], 'rb') as f:
+        return f.read()
+
+
+def _full_convert(path, work_dir):
+    os.makedirs(work_dir)
+    copy = os.path.join(work_dir, os.path.basename(path))
+    shutil.copyfile(path, copy)
+    return _convert(copy)
+
+
+def test_append_matches_full_run(synthetic_log, tmp_path, capsys):
+    source = synthetic_log(3600 << 10, seed=7, name='source.txt')
+    with open(source, 'rb') as f:
+        data = f.read()
+    chat = str(tmp_path / 'chat.txt')
+    pos = data.index(b'\n', 3 << 20) + 1
+    with open(chat, 'wb') as f:
+        f.write(data[:pos])
+    _convert(chat, incremental=True)
+
+    resumed = 0
+    for i in range(4):
+        end = data.index(b'\n', pos + (100 << 10)) + 1
+        with open(chat, 'ab') as f:
+            f.write(data[pos:end])
+        pos = end
+        capsys.readouterr()
+        html = _convert(chat, incremental=True)
+        resumed += '繼續解析' in capsys.readouterr().out
+        assert html == _full_convert(chat, str(tmp_path / f'full{i}'))
+    # 只有新偵測到的名字會改變新增部分的訊息時才完整重建，不是每次名單變動都重建
+    assert resumed >= 2
+
+
+def test_message_continued_in_appended_tail(tmp_path):
+    chat = str(tmp_path / 'chat.txt')
+    with open(chat, 'w', encoding='utf-8', newline='\n') as f:
+        f.write('2024/01/01（一）\n10:00\t小明\t第一行\n')
+    _convert(chat, incremental=True)
+    with open(chat, 'a', encoding='utf-8', newline='\n') as f:
+        f.write('第二行\n10:01\t小華\t你好\n')
+    assert _convert(chat, incremental=True) == _full_convert(chat, str(tmp_path / 'full'))
+
+
+def test_edited_prefix_rebuilds(synthetic_log, tmp_path, capsys):
+    chat = synthetic_log(200 << 10)
+    _convert(chat, incremental=True)
+    with open(chat, 'r+b') as f:
+        f.seek(100)
+        f.write(b'X')
+    capsys.readouterr()
+    html = _convert(chat, incremental=True)
+    assert '前段內容已變動' in capsys.readouterr().out
+    assert html == _full_convert(chat, str(tmp_path / 'full'))
+
+
+def test_edit_with_append_rebuilds(synthetic_log, tmp_path, monkeypatch, capsys):
+    # 小區塊：前段有上百個區塊，修改的位置不會剛好是第一個或最後一個
+    monkeypatch.setattr(lp, 'HASH_BLOCK_SIZE', 4096)
+    chat = synthetic_log(600 << 10)
+    _convert(chat, incremental=True)
+    with open(chat, 'r+b') as f:
+        data = f.read()
+        # 在顯示範圍內的某則訊息中原地改一個字 (長度不變)，同時新增訊息
+        head = data[:len(data) - 30 * 4096]
+        pos = [m.start(1) for m in re.finditer(rb'\n\d\d:\d\d [^\n]*(hello)', head)][-1]
+        f.seek(pos)
+        f.write(b'HELLO')
+        f.seek(0, os.SEEK_END)
+        f.write('2030/01/01（二）\n10:00\t小明\t新的訊息\n'.encode('utf-8'))
+    capsys.readouterr()
+    html = _convert(chat, incremental=True)
+    assert '前段內容已變動' in capsys.readouterr().out
+    assert b'HELLO' in html
+    assert html == _full_convert(chat, str(tmp_path / 'full'))
@@ -0,0 +1,73 @@
+"""多個匯出檔合併 (--merge) 的測試"""
+
+import gzip
+
+import line_parser as lp
+
+EXPORT_A = """2024/01/01（一）
+09:00\t小明\t早安
+09:00\t小明\t早安
+15:10\t小華\t下午好
+2024/01/02（二）
+10:00\t小明\t重疊的訊息
+10:05\t小華\t重疊的訊息二
+"""
+
+# 同一個對話的另一次匯出：與 A 重疊 01/01 下午到 01/02，且時間是 12 小時制
+EXPORT_B = """2024/01/01（一）
+下午 3:10\t小華\t下午好
+2024/01/02（二）
+上午 10:00\t小明\t重疊的訊息
+上午 10:05\t小華\t重疊的訊息二
+2024/01/03（三）
+上午 8:00\t小明\t新的一天
+"""
+
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def merged(*paths):
+    matcher = lp.NameMatcher(lp.SPECIAL_NAMES)
+    merger = lp.TimelineMerger([lp.iter_messages(path, matcher) for path in paths])
+    return [(msg['date'][:10], msg['time'], msg['name'], msg['content']) for msg in merger], merger.duplicates
+
+
+def test_overlap_is_deduplicated_across_time_formats(tmp_path):
+    a = write(tmp_path, 'a.txt', EXPORT_A)
+    b = write(tmp_path, 'b.txt', EXPORT_B)
+    msgs, duplicates = merged(a, b)
+    assert msgs == [
+        ('2024/01/01', '09:00', '小明', '早安'),
+        ('2024/01/01', '09:00', '小明', '早安'),
+        ('2024/01/01', '15:10', '小華', '下午好'),
+        ('2024/01/02', '10:00', '小明', '重疊的訊息'),
+        ('2024/01/02', '10:05', '小華', '重疊的訊息二'),
+        ('2024/01/03', '上午 8:00', '小明', '新的一天'),
+    ]
+    # 12 小時制的 下午 3:10 與 15:10 是同一則；同一檔案內真的重複發送的「早安」兩則都保留
+    assert duplicates == 3
+
+
+def test_order_is_stable(tmp_path):
+    a = write(tmp_path, 'a.txt', EXPORT_A)
+    b = write(tmp_path, 'b.txt', EXPORT_B)
+    forward, _ = merged(a, b)
+    backward, _ = merged(b, a)
+    # 來源順序只影響重複訊息保留哪一份 (時間的寫法)，內容與順序相同
+    assert [msg[::2] + msg[3:] for msg in forward] == [msg[::2] + msg[3:] for msg in backward]
+    assert merged(a, b) == merged(a, b)
+
+
+def test_merge_exports_output_name_for_gzip_input(tmp_path):
+    a = tmp_path / 'chat.txt.gz'
+    with gzip.open(a, 'wt', encoding='utf-8') as f:
+        f.write(EXPORT_A)
+    b = write(tmp_path, 'b.txt', EXPORT_B)
+    result, = lp.merge_exports([str(a), b])
+    assert result['ok']
+    assert result['output'] == str(tmp_path / 'chat_merged.html')
+    assert (result['messages'], result['duplicates']) == (6, 3)
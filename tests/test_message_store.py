@@ -0,0 +1,20 @@
+"""MessageStore 的測試"""
+
+import line_parser as lp
+import line_parser_bench as bench
+
+
+def test_store_round_trips_parsed_messages(synthetic_log):
+    path = synthetic_log(300 << 10)
+    msgs = list(lp.iter_messages(path))
+    store = lp.MessageStore(msgs)
+    assert len(store) == len(msgs)
+    assert list(store) == msgs
+    assert store[-1] == msgs[-1]
+
+
+def test_store_uses_far_less_memory_than_dicts(synthetic_log):
+    memory = bench.measure_memory(synthetic_log(300 << 10))
+    assert memory['store_bytes'] * 5 < memory['dict_bytes']
+    # 顯示路徑只保留 MAX_DISPLAY_MSGS 則，峰值與檔案大小無關
+    assert memory['display_msgs'] <= lp.MAX_DISPLAY_MSGS
@@ -0,0 +1,33 @@
+"""名字偵測與名字比對的測試"""
+
+from collections import Counter
+
+import line_parser as lp
+import line_parser_bench as bench
+
+
+def _select_both(candidate_counts, candidate_diversity):
+    return (lp.select_detected_names(candidate_counts, candidate_diversity),
+            bench.select_detected_names_reference(candidate_counts, candidate_diversity))
+
+
+def test_strong_binding_matches_reference_on_synthetic_log(synthetic_log):
+    path = synthetic_log(2 << 20)
+    with open(path, 'r', encoding='utf-8') as f:
+        candidate_counts, candidate_diversity = lp.collect_name_candidates(f)
+    names, reference = _select_both(candidate_counts, candidate_diversity)
+    assert names == reference
+    assert 'Jack Ma Yun' in names
+
+
+def test_strong_binding_prefix_boundaries():
+    # 排序後 "林立" 與 "林立 Eric" 之間夾著 "林立!"、"林立 " 開頭之外的候選人，
+    # 前綴索引必須只看以 "林立 " 開頭的那一段
+    candidate_counts = Counter({
+        '林立': 10, '林立 Eric': 9, '林立 Eric Wu': 8, '林立!': 30, '林立皋': 12,
+        '林立皋 Eric': 4, 'Tom': 8, 'Tom Lee': 3, 'Tom Leeds': 7, 'Tommy': 9,
+    })
+    candidate_diversity = {name: {str(i) for i in range(5)} for name in candidate_counts}
+    names, reference = _select_both(candidate_counts, candidate_diversity)
+    assert names == reference
+    assert '林立 Eric' in names
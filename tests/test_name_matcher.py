@@ -0,0 +1,36 @@
+"""NameMatcher 的測試：結果要與逐一 startswith 取最長名字的寫法相同"""
+
+import random
+
+import pytest
+
+import line_parser as lp
+
+
+def longest_prefix_reference(names, text):
+    found = [name for name in names if text.startswith(name)]
+    return max(found, key=len) if found else None
+
+
+@pytest.mark.parametrize('group_size', [3, lp.NAME_MATCHER_REGEX_LIMIT, lp.NAME_MATCHER_REGEX_LIMIT + 1, 600])
+def test_longest_match_equals_reference(group_size):
+    rng = random.Random(group_size)
+    alphabet = '林小明美 華.*(|'
+    names = {'林'}
+    while len(names) < group_size:
+        names.add('林' + ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))))
+    names |= {'Amy', 'Amy Chen', '阿[華]'}
+    names = sorted(names)
+    matcher = lp.NameMatcher(names)
+    texts = [rng.choice(names) + ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 5)))
+             for _ in range(2000)]
+    texts += ['', '林', '王小明 你好', 'Amy Chen 早安', 'Am', '阿[華] 嗨', '阿華']
+    for text in texts:
+        assert matcher.match(text) == longest_prefix_reference(names, text), text
+
+
+def test_empty_name_matches_everything_else():
+    matcher = lp.NameMatcher(['', '林小明'] + [f'林{i}' for i in range(lp.NAME_MATCHER_REGEX_LIMIT + 1)])
+    assert matcher.match('林小明 你好') == '林小明'
+    assert matcher.match('林X') == ''
+    assert matcher.match('王') == ''
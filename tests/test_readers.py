@@ -0,0 +1,39 @@
+"""各種讀取路徑 (從頭解析、反向、日期範圍、增量、平行) 的結果必須完全相同"""
+
+import line_parser as lp
+
+# CRLF 結尾、訊息內容中有單獨的 \r，以及超過 MAX_LINES 的訊息
+CRLF_EXPORT = (
+    '﻿[LINE] 聊天記錄 測試群組\r\n'
+    '2024/01/01（一）\r\n'
+    '10:00\t小明\thello\r\n'
+    'li\rne2\r\n'
+    '10:01\t小華\t早安\r\n'
+    '2024/01/02（二）\r\n'
+    '上午 9:05\t小明\t' + 'a\r' * (lp.MAX_LINES + 1) + 'b\r\n'
+    '09:06\t小華\t多行\r\n' + '續行\r\n' * (lp.MAX_LINES - 1) +
+    '09:07\t小明\t最後\r'
+)
+
+
+def _write(tmp_path, text):
+    path = tmp_path / 'chat.txt'
+    path.write_bytes(text.encode('utf-8'))
+    return str(path)
+
+
+def test_all_readers_split_lines_the_same(tmp_path):
+    path = _write(tmp_path, CRLF_EXPORT)
+    forward = lp.collect_display_msgs(lp.iter_messages(path))
+    assert [msg['content'] for msg in forward[0]][-1] == 'hello\nli\rne2'
+
+    assert lp.collect_display_msgs_reverse(path) == forward
+    assert lp.collect_display_msgs(lp.iter_messages_in_range(path, 20240101, 20240102)) == forward
+    assert lp.collect_display_msgs_incremental(path) == forward
+    assert lp.collect_display_msgs_parallel(path, 2) == forward
+
+
+def test_lone_cr_counts_as_one_line(tmp_path):
+    path = _write(tmp_path, CRLF_EXPORT)
+    msgs = list(lp.iter_messages(path))
+    assert [msg['lines_count'] for msg in msgs] == [2, 1, 1, lp.MAX_LINES, 1]
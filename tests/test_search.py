@@ -0,0 +1,75 @@
+"""搜尋索引 (--search) 的測試：斷詞與差值編碼的 posting list"""
+
+import json
+import random
+
+import line_parser as lp
+
+
+def decode(text):
+    """與頁面上的 postings() 相同：把差值編碼還原成訊息編號"""
+    ids, msg_id = [], 0
+    for gap in text.split(','):
+        msg_id += int(gap)
+        ids.append(msg_id)
+    return ids
+
+
+def test_search_tokens():
+    assert lp.search_tokens('今天天氣很好') == {'今天', '天天', '天氣', '氣很', '很好'}
+    assert lp.search_tokens('好') == {'好'}
+    assert lp.search_tokens('Hello, WORLD 123 foo_bar') == {'hello', 'world', '123', 'foo', 'bar'}
+    # 中日韓文字與英數字相連時分開斷詞
+    assert lp.search_tokens('iPhone15很好用ok') == {'iphone15', '很好', '好用', 'ok'}
+    assert lp.search_tokens('ありがとう 안녕') == {'あり', 'りが', 'がと', 'とう', '안녕'}
+    assert lp.search_tokens('!!! 🎉') == set()
+
+
+def test_index_round_trips(synthetic_log):
+    msgs = [msg for msg in lp.iter_messages(synthetic_log(300 << 10)) if not lp.is_filtered_msg(msg)]
+    builder = lp.SearchIndexBuilder()
+    for msg in msgs:
+        builder.add(msg)
+    index = json.loads(builder.to_json())
+    assert index['n'] == len(msgs)
+
+    tokens = {token: decode(text) for token, text in index['t'].items()}
+    expected = {}
+    for i, msg in enumerate(msgs):
+        for token in lp.search_tokens(msg['content']):
+            expected.setdefault(token, []).append(i)
+    assert tokens == expected
+
+    assert [index['senders'][s] for s in index['s']] == [msg['name'] for msg in msgs]
+    days = [day for day, run in index['d'] for _ in range(run)]
+    assert days == [lp.date_key(msg['date']) if msg['date'] else 0 for msg in msgs]
+    assert all(a[0] != b[0] for a, b in zip(index['d'], index['d'][1:]))
+
+
+def test_query_bigrams_find_every_match(synthetic_log):
+    msgs = [msg for msg in lp.iter_messages(synthetic_log(300 << 10)) if not lp.is_filtered_msg(msg)]
+    builder = lp.SearchIndexBuilder()
+    for msg in msgs:
+        builder.add(msg)
+    postings = {token: set(decode(text)) for token, text in json.loads(builder.to_json())['t'].items()}
+    rng = random.Random(22)
+    # 中文查詢 (兩字以上) 的每個 bigram 都出現的訊息，一定包含所有真正含有這段文字的訊息
+    cjk_runs = sorted({run for msg in msgs for run, _ in lp.SEARCH_TOKEN_PATTERN.findall(msg['content'])
+                       if len(run) >= 2})
+    for _ in range(50):
+        run = rng.choice(cjk_runs)
+        start = rng.randrange(len(run) - 1)
+        query = run[start:rng.randint(start + 2, len(run))]
+        candidates = set.intersection(*(postings[token] for token in lp.search_tokens(query)))
+        assert {i for i, msg in enumerate(msgs) if query in msg['content'].lower()} <= candidates
+
+
+def test_page_embeds_escaped_index(tmp_path):
+    msgs = [{'date': '2024/01/01（一）', 'time': '10:00', 'name': '小明', 'type': 'user', 'lines_count': 1,
+             'content': '看這個 </script><b>', 'ts': 0}]
+    output = tmp_path / 'chat.html'
+    lp.write_html(str(output), 'chat.txt', msgs, False, search=True)
+    page = output.read_text(encoding='utf-8')
+    assert 'window.LINE_SEARCH_INDEX' in page and 'id="search-q"' in page
+    index_line = next(line for line in page.splitlines() if 'LINE_SEARCH_INDEX =' in line)
+    assert '</script><b>' not in index_line
@@ -0,0 +1,91 @@
+"""line_parser_server 的測試：在臨時埠號啟動伺服器，透過 HTTP 查詢 JSON API"""
+
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+from urllib.parse import urlencode
+
+import pytest
+
+import line_parser_server as server
+
+CHAT = """2024/01/01（一）
+10:00\t小明\t新年快樂
+10:01\t小華\t圖片
+10:02\t小華\t新年快樂！
+2024/01/02（二）
+09:00\t小明\t今天上班
+2024/01/03（三）
+21:30\t小華\t晚安
+第二行
+"""
+
+
+@pytest.fixture
+def chat_server(tmp_path):
+    chat = tmp_path / 'chat.txt'
+    chat.write_text(CHAT, encoding='utf-8')
+    registry = server.ChatRegistry(files=[str(chat)])
+    registry.refresh()
+    handler = type('Handler', (server.ChatRequestHandler,), {'registry': registry})
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+
+    def get(path, **params):
+        url = f'http://127.0.0.1:{httpd.server_address[1]}{path}'
+        if params:
+            url += '?' + urlencode(params)
+        with urllib.request.urlopen(url) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    yield get, registry, chat
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def contents(result):
+    return [msg['content'] for msg in result['messages']]
+
+
+def test_api_chats_lists_indexed_chats(chat_server):
+    get, _, _ = chat_server
+    chat, = get('/api/chats')
+    assert chat['chat'] == 'chat.txt'
+    # 「圖片」被過濾
+    assert chat['messages'] == 4
+    assert chat['senders'] == 2
+
+
+def test_api_messages_filters_by_keyword_and_date(chat_server):
+    get, _, _ = chat_server
+    # 由新到舊
+    assert contents(get('/api/messages', chat='chat.txt')) == ['晚安\n第二行', '今天上班', '新年快樂！', '新年快樂']
+    assert contents(get('/api/messages', chat='chat.txt', q='新年')) == ['新年快樂！', '新年快樂']
+    assert contents(get('/api/messages', chat='chat.txt', since='2024-01-02', until='2024-01-02')) == ['今天上班']
+    assert contents(get('/api/messages', chat='chat.txt', since='2024-01-02', sender='小華')) == ['晚安\n第二行']
+    result = get('/api/messages', chat='chat.txt', per_page=3, page=2)
+    assert (result['total'], result['pages'], contents(result)) == (4, 2, ['新年快樂'])
+
+
+@pytest.mark.parametrize('since', ['2024-1', '2015-13-45', '2024-02-30'])
+def test_bad_date_is_rejected(chat_server, since):
+    get, _, _ = chat_server
+    with pytest.raises(urllib.error.HTTPError) as error:
+        get('/api/messages', chat='chat.txt', since=since)
+    assert error.value.code == 400
+
+
+def test_refresh_picks_up_file_changes(chat_server):
+    get, registry, chat = chat_server
+    with open(chat, 'a', encoding='utf-8') as f:
+        f.write('2024/01/04（四）\n08:00\t小明\t早安\n')
+    stat = os.stat(chat)
+    # 確保 mtime 一定改變 (檔案系統的時間精度可能很粗)
+    os.utime(chat, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    registry.refresh()
+    assert contents(get('/api/messages', chat='chat.txt', since='2024-01-04')) == ['早安']
+    assert get('/api/chats')[0]['messages'] == 5
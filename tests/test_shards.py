@@ -0,0 +1,64 @@
+"""分段輸出 (--shards) 的測試：所有分段組回來要等於完整歷史中通過過濾的訊息"""
+
+import json
+import os
+import re
+
+import line_parser as lp
+
+
+def read_shards(output_path):
+    """讀出外殼頁面的索引與各分段的內容 (依分段編號，由舊到新)"""
+    with open(output_path, encoding='utf-8') as f:
+        index = json.loads(re.search(r'var LINE_CHAT_INDEX = (.*?);</script>', f.read()).group(1))
+    shard_dir = os.path.join(os.path.dirname(output_path), index['dir'])
+    shards = {}
+    for info in index['shards']:
+        with open(os.path.join(shard_dir, info['file']), encoding='utf-8') as f:
+            text = f.read()
+        assert text.startswith('LineChatShard(') and text.endswith(');\n')
+        shards[info['id']] = json.loads(text[len('LineChatShard('):-len(');\n')])
+    return index, shards
+
+
+def test_shards_hold_the_full_history(synthetic_log, monkeypatch):
+    monkeypatch.setattr(lp, 'SHARD_MAX_MSGS', 500)
+    chat = synthetic_log(1 << 20)
+    expected = [(msg['date'], msg['time'], msg['name'], msg['content'].strip(), int(msg['type'] == 'system'))
+                for msg in lp.iter_messages(chat) if not lp.is_filtered_msg(msg)]
+    assert len(expected) > lp.MAX_DISPLAY_MSGS
+
+    result = lp.convert_file(chat, shards=True)
+    assert result['ok'] and result['messages'] == len(expected)
+    index, shards = read_shards(result['output'])
+    # 頁面索引由新到舊
+    assert [info['id'] for info in index['shards']] == sorted(shards, reverse=True)
+
+    rebuilt = []
+    for info in reversed(index['shards']):
+        shard = shards[info['id']]
+        rows = [(shard['dates'][d], time, shard['senders'][s], content, system)
+                for d, time, s, content, system in shard['msgs']]
+        assert 0 < len(rows) == info['count'] <= lp.SHARD_MAX_MSGS
+        assert {lp._shard_month(row[0]) for row in rows} == {info['month']}
+        assert (rows[0][0], rows[-1][0]) == (info['first_date'], info['last_date'])
+        rebuilt.extend(rows)
+    assert rebuilt == expected
+
+
+def test_rerun_replaces_old_shards(synthetic_log, tmp_path):
+    chat = synthetic_log(600 << 10)
+    lp.convert_file(chat, shards=True, search=True)
+    shard_dir = tmp_path / 'chat_shards'
+    before = set(os.listdir(shard_dir))
+    assert 'search.js' in before
+
+    # 內容變少、不再建立搜尋索引：多出來的分段與 search.js 都要移除
+    with open(chat, 'rb') as f:
+        data = f.read()
+    with open(chat, 'wb') as f:
+        f.write(data[:data.index(b'\n', len(data) // 3) + 1])
+    result = lp.convert_file(chat, shards=True)
+    index, _ = read_shards(result['output'])
+    assert set(os.listdir(shard_dir)) == {info['file'] for info in index['shards']}
+    assert len(index['shards']) < len(before) - 1
@@ -0,0 +1,97 @@
+"""--sqlite 匯出的測試"""
+
+import os
+import sqlite3
+
+import line_parser as lp
+
+MESSAGE_ROWS = """
+SELECT m.seq, m.date, m.time, s.name, m.type, m.content, m.lines_count, m.filtered_rule
+FROM messages m JOIN senders s ON s.id = m.sender_id JOIN chats c ON c.id = m.chat_id
+WHERE c.file = ? ORDER BY m.seq
+"""
+
+
+def _rows(db_path, chat_file):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(MESSAGE_ROWS, (os.path.abspath(chat_file),)).fetchall()
+
+
+def _append(path, text):
+    with open(path, 'a', encoding='utf-8', newline='\n') as f:
+        f.write(text)
+
+
+def test_append_upserts_tail_and_matches_fresh_export(synthetic_log, tmp_path, capsys):
+    chat = synthetic_log(800 << 10)
+    db_path = str(tmp_path / 'chats.db')
+    lp.export_sqlite(chat, db_path)
+    before = len(_rows(db_path, chat))
+
+    # 新增的部分讓某些候選名字的次數改變，但沒有新名字會影響新增的訊息：只 upsert 尾端
+    _append(chat, '2030/01/01（二）\n' + ''.join(f'10:{i:02d}\t小明\t新的訊息 {i}\n續行\n' for i in range(50)))
+    capsys.readouterr()
+    written = lp.export_sqlite(chat, db_path)
+    assert '繼續匯出' in capsys.readouterr().out
+    assert written == 51
+    assert len(_rows(db_path, chat)) == before + 50
+
+    fresh_db = str(tmp_path / 'fresh.db')
+    lp.export_sqlite(chat, fresh_db)
+    assert _rows(db_path, chat) == _rows(fresh_db, chat)
+
+
+def test_new_name_in_tail_rebuilds(synthetic_log, tmp_path, capsys):
+    chat = synthetic_log(300 << 10)
+    db_path = str(tmp_path / 'chats.db')
+    lp.export_sqlite(chat, db_path)
+
+    # 新出現的發送者，名字中有空白且以單一空白與內容分隔：沒有這個名字時會被切成 "新" 與 "朋友 ..."
+    words = ['早安', '晚安', '好', '收到', '謝謝']
+    _append(chat, '2030/01/01（二）\n' + ''.join(f'10:{i:02d} 新 朋友 {words[i % 5]}\n' for i in range(30)))
+    capsys.readouterr()
+    lp.export_sqlite(chat, db_path)
+    assert '重建此對話' in capsys.readouterr().out
+
+    fresh_db = str(tmp_path / 'fresh.db')
+    lp.export_sqlite(chat, fresh_db)
+    assert _rows(db_path, chat) == _rows(fresh_db, chat)
+
+
+def test_full_text_index_follows_upserts(tmp_path):
+    chat = tmp_path / 'chat.txt'
+    chat.write_text('2024/01/01（一）\n10:00\t小明\t第一則訊息\n', encoding='utf-8')
+    db_path = str(tmp_path / 'chats.db')
+    lp.export_sqlite(str(chat), db_path)
+    with open(chat, 'a', encoding='utf-8') as f:
+        f.write('續行的內容\n10:01\t小華\t第二則訊息\n')
+    lp.export_sqlite(str(chat), db_path)
+
+    with sqlite3.connect(db_path) as conn:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone():
+            return
+        found = conn.execute("SELECT m.seq FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+                             "WHERE messages_fts MATCH ? ORDER BY m.seq", ('"續行的內容"',)).fetchall()
+        total = conn.execute("SELECT count(*) FROM messages_fts").fetchone()[0]
+    assert found == [(1,)]
+    assert total == 2
+
+
+def test_parallel_exports_to_one_database(synthetic_log, tmp_path, monkeypatch):
+    paths = [synthetic_log(200 << 10, seed=seed, name=f'chat{seed}.txt') for seed in (1, 2, 3)]
+    monkeypatch.setattr(lp, 'SOURCE_DIR', str(tmp_path))
+    db_path = str(tmp_path / 'chats.db')
+    results = lp.generate_html(jobs=3, sqlite_path=db_path)
+    assert all(result['ok'] for result in results)
+    for path in paths:
+        assert len(_rows(db_path, path)) == sum(1 for _ in lp.iter_messages(path))
+
+
+def test_export_does_not_count_filter_hits(synthetic_log, tmp_path, monkeypatch):
+    chat = synthetic_log(300 << 10)
+    monkeypatch.setattr(lp, 'NAME_CACHE_ENABLED', False)
+    plain = lp.convert_file(chat, forward=True, collect_stats=True)['stats']
+    exported = lp.convert_file(chat, forward=True, collect_stats=True,
+                               sqlite_path=str(tmp_path / 'chats.db'))['stats']
+    assert exported['filter_hits'] == plain['filter_hits']
+    assert sum(exported['filter_hits'].values()) == exported['counters']['messages_filtered']
@@ -0,0 +1,15 @@
+"""--stats / --metrics 統計的測試"""
+
+import line_parser as lp
+
+
+def test_parallel_stats_match_sequential(synthetic_log, monkeypatch):
+    chat = synthetic_log(1 << 20)
+    monkeypatch.setattr(lp, 'PARALLEL_MIN_CHUNK_BYTES', 128 << 10)
+    monkeypatch.setattr(lp, 'NAME_CACHE_ENABLED', False)
+    # jobs=1 預設從結尾反向讀取，湊滿顯示上限就停止；從頭解析的 forward 模式才會看過每一行
+    sequential = lp.convert_file(chat, forward=True, collect_stats=True)['stats']
+    parallel = lp.convert_file(chat, jobs=2, collect_stats=True)['stats']
+    assert parallel['counters'] == sequential['counters']
+    assert parallel['filter_hits'] == sequential['filter_hits']
+    assert parallel['counters']['messages_filtered'] == sum(parallel['filter_hits'].values())
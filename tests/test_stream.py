@@ -0,0 +1,36 @@
+"""標準輸入與具名管線來源的測試"""
+
+import os
+import threading
+
+import pytest
+
+import line_parser as lp
+
+
+@pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason='需要具名管線 (mkfifo)')
+def test_named_pipe_is_spooled_and_converted(synthetic_log, tmp_path, monkeypatch):
+    chat = synthetic_log(100 << 10)
+    expected = lp.convert_file(chat)
+    fifo = str(tmp_path / 'pipe.txt')
+    os.mkfifo(fifo)
+
+    def write_pipe():
+        with open(chat, 'rb') as src, open(fifo, 'wb') as dst:
+            dst.write(src.read())
+
+    writer = threading.Thread(target=write_pipe)
+    writer.start()
+    monkeypatch.chdir(tmp_path)
+    result, = lp.generate_html(fifo)
+    writer.join()
+    assert result['ok'] and result['messages'] == expected['messages']
+    assert os.path.exists(tmp_path / 'pipe.html')
+
+
+def test_directory_target_fails_cleanly(tmp_path, capsys):
+    result, = lp.generate_html(str(tmp_path))
+    assert not result['ok']
+    assert '處理失敗' in capsys.readouterr().err
+    assert not lp.is_pipe(str(tmp_path))
+    assert not lp.is_pipe(str(tmp_path / 'missing.txt'))